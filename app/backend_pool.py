@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import httpx
+
+from app.comfy_client import ComfyUIClient, ComfyUIDisconnected
+from app.metrics import Trace
+
+# 각 서버의 /queue 와 연결 상태를 확인하는 주기 (초)
+BACKEND_POLL_INTERVAL = 2.0
+# 이 시간(초) 이상 연결이 끊긴 서버의 작업은 다른 서버로 재전송
+BACKEND_DOWN_TIMEOUT = 10.0
+# 서버 장애로 작업을 다른 서버에 다시 보낼 최대 횟수
+MAX_REDISPATCH = 3
+
+
+class Backend:
+    """풀에 속한 ComfyUI 서버 하나"""
+
+    def __init__(self, name: str, base_url: str, ws_url: str, weight: float = 1.0,
+                 max_queue_depth: int = 2, fetch_outputs: bool = False):
+        self.name = name
+        self.weight = weight
+        self.max_queue_depth = max_queue_depth
+        # True 이면 출력 파일을 /view 로 내려받아 API 서버의 output 폴더에 저장 (원격 서버용)
+        self.fetch_outputs = fetch_outputs
+        self.client = ComfyUIClient(base_url, ws_url)
+        self.in_flight = 0
+        self.queue_length = 0
+        self.healthy = False
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and self.in_flight < self.max_queue_depth
+
+    def score(self) -> float:
+        """낮을수록 우선 배정. /queue 에는 다른 클라이언트의 작업도 포함되므로 둘 중 큰 값을 사용"""
+        return max(self.in_flight, self.queue_length) / self.weight
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "base_url": self.client.base_url,
+            "healthy": self.healthy,
+            "weight": self.weight,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "queue_length": self.queue_length,
+            "completed": self.completed,
+            "failed": self.failed,
+            "ws_reconnects": self.client.reconnects,
+        }
+
+
+class BackendPool:
+    """
+    여러 ComfyUI 서버에 작업을 분배합니다.
+
+    사용 가능한(연결되어 있고 max_queue_depth 미만인) 서버 중 큐 길이 / 가중치가
+    가장 작은 서버에 배정하므로, 빨리 끝나는 서버가 자연스럽게 더 많은 작업을 받습니다.
+    연결이 BACKEND_DOWN_TIMEOUT 이상 끊긴 서버의 작업은 다른 서버로 다시 보냅니다.
+    """
+
+    def __init__(self, configs: List[dict]):
+        self.backends = [Backend(**config) for config in configs]
+        self._changed: Optional[asyncio.Event] = None
+        self._monitor: Optional[asyncio.Task] = None
+
+    @property
+    def capacity(self) -> int:
+        """모든 서버에 동시에 올릴 수 있는 최대 작업 수"""
+        return sum(backend.max_queue_depth for backend in self.backends)
+
+    @property
+    def has_remote(self) -> bool:
+        """output 폴더를 공유하지 않는(fetch_outputs=True) 서버가 있는지"""
+        return any(backend.fetch_outputs for backend in self.backends)
+
+    async def start(self, http_client: httpx.AsyncClient):
+        self._changed = asyncio.Event()
+        for backend in self.backends:
+            await backend.client.start(http_client)
+        self._monitor = asyncio.create_task(self._monitor_loop())
+
+    async def stop(self):
+        if self._monitor:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+        for backend in self.backends:
+            await backend.client.stop()
+
+    async def acquire(self) -> Backend:
+        """작업을 보낼 서버를 하나 고릅니다. 사용 가능한 서버가 없으면 기다립니다."""
+        while True:
+            candidates = [backend for backend in self.backends if backend.available]
+            if candidates:
+                backend = min(candidates, key=Backend.score)
+                backend.in_flight += 1
+                return backend
+            self._changed.clear()
+            await self._changed.wait()
+
+    def release(self, backend: Backend):
+        backend.in_flight -= 1
+        self._changed.set()
+
+    async def run(self, workflow: dict, trace: Optional[Trace] = None,
+                  on_submit: Optional[Callable[[Backend, str], None]] = None,
+                  remote_workflow: Optional[dict] = None):
+        """
+        워크플로우를 서버 하나에서 실행하고 (출력, 서버)를 반환합니다.
+        서버 연결이 끊기면 다른 서버로 최대 MAX_REDISPATCH 번 다시 보냅니다.
+        trace 가 있으면 전송(comfy_submit), ComfyUI 큐 대기(comfy_queue), 실행(comfy_execute) 시간을 기록합니다.
+        on_submit(서버, prompt_id)는 ComfyUI 큐에 들어갈 때마다 호출됩니다. (취소할 때 사용)
+        remote_workflow 가 있으면 fetch_outputs 서버에는 workflow 대신 이것을 보냅니다.
+        (API 서버의 output 폴더에만 있는 파일을 읽는 워크플로우를 원격 서버에 보내지 않도록)
+        """
+        trace = trace or Trace()
+        last_error = None
+        for attempt in range(MAX_REDISPATCH + 1):
+            backend = await self.acquire()
+            try:
+                with trace.stage("comfy_submit"):
+                    payload = remote_workflow if backend.fetch_outputs and remote_workflow is not None else workflow
+                    prompt_id = await asyncio.wait_for(backend.client.submit(payload), BACKEND_DOWN_TIMEOUT)
+                logging.info(f"📡 [{backend.name}] 작업 전송 완료. 프롬프트 ID: {prompt_id}")
+                if on_submit:
+                    on_submit(backend, prompt_id)
+                sent = time.monotonic()
+                try:
+                    outputs = await backend.client.wait(prompt_id)
+                finally:
+                    started = backend.client.pop_execution_start(prompt_id)
+                finished = time.monotonic()
+                if started is not None:
+                    # 큐가 비어 있으면 execution_start 가 전송 응답보다 먼저 올 수 있음
+                    # -> 큐 대기 0, 그 전까지는 comfy_submit 에 이미 들어 있으므로 실행은 sent 부터 (단계 합 = 전체 시간)
+                    started = max(started, sent)
+                    trace.add("comfy_queue", started - sent)
+                    trace.add("comfy_execute", finished - started)
+                else:
+                    trace.add("comfy_execute", finished - sent)
+                backend.completed += 1
+                return outputs, backend
+            except (ComfyUIDisconnected, httpx.TransportError, asyncio.TimeoutError) as e:
+                backend.failed += 1
+                backend.healthy = False
+                last_error = e
+                logging.warning(f"⚠️ [{backend.name}] 서버 장애로 작업을 다시 배정합니다 ({attempt + 1}/{MAX_REDISPATCH}): {e!r}")
+            finally:
+                self.release(backend)
+        raise ComfyUIDisconnected(f"사용 가능한 ComfyUI 서버가 없습니다: {last_error!r}")
+
+    async def fetch_outputs(self, backend: Backend, outputs: dict, dest_dir: Path, extra_files: List[str] = ()):
+        """
+        원격 서버의 출력 이미지(와 캡션 등 추가 파일)를 /view 로 내려받아 dest_dir 에 저장합니다.
+        로컬 서버(fetch_outputs=False)는 이미 같은 폴더에 저장하므로 아무것도 하지 않습니다.
+        """
+        if not backend.fetch_outputs:
+            return
+        files = [(image["filename"], image.get("subfolder", ""), image.get("type", "output"))
+                 for output in outputs.values() if output
+                 for image in output.get("images", [])]
+        files += [(filename, "", "output") for filename in extra_files]
+        for filename, subfolder, folder_type in files:
+            data = await backend.client.view(filename, subfolder, folder_type)
+            target = dest_dir / subfolder / filename
+            await asyncio.to_thread(_write_atomic, target, data)
+
+    def stats(self) -> List[dict]:
+        return [backend.stats() for backend in self.backends]
+
+    async def _monitor_loop(self):
+        while True:
+            await asyncio.gather(*(self._check(backend) for backend in self.backends))
+            self._changed.set()
+            await asyncio.sleep(BACKEND_POLL_INTERVAL)
+
+    async def _check(self, backend: Backend):
+        client = backend.client
+        if client.disconnected_at is not None and time.monotonic() - client.disconnected_at > BACKEND_DOWN_TIMEOUT:
+            if backend.healthy or client.in_flight:
+                logging.error(f"❌ [{backend.name}] 서버 연결이 {BACKEND_DOWN_TIMEOUT}초 이상 끊겼습니다.")
+            backend.healthy = False
+            client.fail_pending(ComfyUIDisconnected(f"{backend.name} 서버 연결 끊김"))
+            return
+        try:
+            backend.queue_length = await client.queue_length()
+            backend.healthy = client.connected
+        except Exception as e:
+            if backend.healthy:
+                logging.warning(f"⚠️ [{backend.name}] /queue 조회 실패: {e!r}")
+            backend.healthy = False
+
+
+def _write_atomic(target: Path, data: bytes):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, target)
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import posixpath
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from app.metrics import stage_seconds
+from app.model import GenerateRequest
+
+
+def caption_tags(req: GenerateRequest) -> List[str]:
+    """생성 모드별로 캡션 끝에 덧붙일 태그"""
+    if req.generation_mode == "expression" and req.expression:
+        return [req.expression]
+    return []
+
+
+def extract_caption_text(output: Optional[dict]) -> Optional[str]:
+    """
+    SaveText 노드의 executed 출력(또는 /history outputs)에서 DeepDanbooru 캡션을 꺼냅니다.
+    텍스트가 없으면 None 을 반환합니다.
+    """
+    if not output:
+        return None
+    text = output.get("text")
+    if isinstance(text, list):
+        text = "".join(str(t) for t in text)
+    return text if text else None
+
+
+def caption_name(image: str) -> str:
+    """저장된 이미지(output 폴더 기준 상대 경로)와 짝이 되는 최종 캡션 파일 경로 (같은 이름, 확장자만 .txt)"""
+    return f"{posixpath.splitext(image)[0]}.txt"
+
+
+def build_caption(text: str, tags: List[str]) -> str:
+    """캡션 끝의 공백/개행을 제거하고 쉼표로 태그를 덧붙입니다."""
+    caption = text.rstrip()
+    for tag in tags:
+        caption += f", {tag}"
+    return caption
+
+
+class CaptionWriter:
+    """
+    최종 캡션 파일을 백그라운드에서 한 번에 원자적으로(임시 파일 -> os.replace) 기록합니다.
+
+    요청 처리 경로에서는 submit() 으로 큐에 넣기만 하고 바로 반환하므로,
+    캡션 파일을 기다리며 sleep 하거나 SaveText 노드와 같은 파일을 동시에 고쳐 쓰지 않습니다.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.failed = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        """남은 캡션을 모두 기록한 뒤 종료합니다."""
+        if self._task:
+            await self._queue.join()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def submit(self, path: Path, text: Optional[str], tags: List[str], source: Optional[Path] = None) -> asyncio.Future:
+        """
+        캡션 기록을 예약합니다.
+        text 가 None 이면 ComfyUI가 저장한 파일(source, 없으면 path) 내용을 기준으로 태그를 덧붙입니다.
+        source 가 path 와 다르면 기록한 뒤 source 를 지웁니다. (SaveText 원본 -> 이미지와 같은 이름의 최종 캡션)
+        반환된 Future 는 기록이 끝나면(실패해도) 완료됩니다. (결과 전달 전에 최종 캡션을 기다릴 때 사용)
+        """
+        written = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((path, text, tags, source, written))
+        return written
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _worker(self):
+        while True:
+            path, text, tags, source, written = await self._queue.get()
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(_write_caption, path, text, tags, source)
+                self.written += 1
+                stage_seconds.observe(time.perf_counter() - start, "caption_write")
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"❌ 캡션 파일 기록 실패: {path} ({e})")
+            finally:
+                if not written.done():
+                    written.set_result(None)
+                self._queue.task_done()
+
+
+def _write_caption(path: Path, text: Optional[str], tags: List[str], source: Optional[Path] = None):
+    source = source or path
+    if text is None:
+        # 프롬프트 실행이 완전히 끝난 뒤이므로 SaveText 노드가 이미 파일을 저장한 상태
+        text = source.read_text(encoding="utf-8")
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(build_caption(text, tags), encoding="utf-8")
+    os.replace(tmp, path)
+    if source != path:
+        source.unlink(missing_ok=True)
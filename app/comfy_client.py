@@ -0,0 +1,236 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import httpx
+import websockets
+
+# 재연결 대기 시간 (초): 실패할 때마다 두 배씩 늘려 최대값까지
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+# 아직 기다리는 쪽이 등록되지 않은 프롬프트의 완료 결과를 보관할 최대 개수
+MAX_UNCLAIMED_RESULTS = 1000
+
+
+class ComfyUIError(Exception):
+    """ComfyUI 실행 중 발생한 오류 (execution_error / execution_interrupted)"""
+
+
+class ComfyUICancelled(ComfyUIError):
+    """API 측에서 취소해 ComfyUI 큐에서 지웠거나 실행을 중단한 프롬프트"""
+
+
+class ComfyUIDisconnected(ComfyUIError):
+    """ComfyUI 서버와의 연결이 끊겨 작업 결과를 받을 수 없음 (다른 서버로 재전송 가능)"""
+
+
+class ComfyUIClient:
+    """
+    프로세스 전체가 공유하는 ComfyUI 클라이언트.
+
+    하나의 client_id로 웹소켓을 하나만 열어두고, 들어오는 이벤트를
+    prompt_id 별 Future로 분배합니다. 연결이 끊기면 백오프로 재연결하고,
+    끊긴 동안 놓친 완료 이벤트는 /history 로 확인해 채워 넣습니다.
+    """
+
+    def __init__(self, base_url: str, ws_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.ws_url = ws_url
+        self.client_id = str(uuid.uuid4())
+        self.reconnects = 0
+        self.disconnected_at: Optional[float] = None  # 연결이 끊긴 시각 (연결 중이면 None)
+        self._http: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._connected: Optional[asyncio.Event] = None
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._outputs: Dict[str, dict] = {}
+        self._started: Dict[str, float] = {}  # prompt_id -> execution_start 수신 시각 (monotonic)
+        self._unclaimed: "OrderedDict[str, object]" = OrderedDict()
+
+    async def start(self, http_client: httpx.AsyncClient):
+        """웹소켓 수신 태스크를 시작합니다."""
+        self._http = http_client
+        self._connected = asyncio.Event()
+        self.disconnected_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected is not None and self._connected.is_set()
+
+    @property
+    def in_flight(self) -> int:
+        """전송했지만 아직 완료되지 않은 프롬프트 수"""
+        return len(self._outputs)
+
+    async def queue_length(self) -> int:
+        """ComfyUI /queue 기준 실행 중 + 대기 중인 프롬프트 수"""
+        res = await self._http.get(f"{self.base_url}/queue", timeout=5)
+        res.raise_for_status()
+        queue = res.json()
+        return len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+
+    async def view(self, filename: str, subfolder: str = "", folder_type: str = "output") -> bytes:
+        """ComfyUI /view 엔드포인트로 출력 파일을 내려받습니다."""
+        params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
+        res = await self._http.get(f"{self.base_url}/view", params=params, timeout=60)
+        res.raise_for_status()
+        return res.content
+
+    def fail_pending(self, error: Exception):
+        """완료를 기다리는 모든 프롬프트를 error 로 종료합니다. (서버가 죽은 경우)"""
+        for prompt_id in list(self._outputs):
+            self._outputs.pop(prompt_id, None)
+            self._resolve(prompt_id, error)
+
+    async def submit(self, workflow: dict) -> str:
+        """워크플로우를 ComfyUI 큐에 넣고 prompt_id를 반환합니다."""
+        # 연결 전에 전송하면 이벤트를 놓칠 수 있으므로 연결될 때까지 대기
+        await self._connected.wait()
+        payload = {"prompt": workflow, "client_id": self.client_id}
+        res = await self._http.post(f"{self.base_url}/prompt", json=payload, timeout=20)
+        res.raise_for_status()
+        prompt_id = res.json()["prompt_id"]
+        self._outputs.setdefault(prompt_id, {})
+        return prompt_id
+
+    async def cancel(self, prompt_id: str) -> bool:
+        """
+        프롬프트를 취소합니다. ComfyUI 큐에서 대기 중이면 큐에서 삭제하고, 실행 중이면 /interrupt 합니다.
+        이미 끝났거나 모르는 프롬프트면 False.
+        """
+        res = await self._http.get(f"{self.base_url}/queue", timeout=5)
+        res.raise_for_status()
+        queue = res.json()
+        if any(item[1] == prompt_id for item in queue.get("queue_pending", [])):
+            res = await self._http.post(f"{self.base_url}/queue", json={"delete": [prompt_id]}, timeout=5)
+            res.raise_for_status()
+            # 큐에서 지운 프롬프트는 완료 이벤트가 오지 않으므로 직접 종료
+            self._outputs.pop(prompt_id, None)
+            self._resolve(prompt_id, ComfyUICancelled("취소되어 ComfyUI 큐에서 삭제되었습니다."))
+            return True
+        if any(item[1] == prompt_id for item in queue.get("queue_running", [])):
+            # prompt_id 를 받지 않는 이전 버전 ComfyUI는 지금 실행 중인 프롬프트를 중단 (바로 위에서 이 프롬프트임을 확인)
+            res = await self._http.post(f"{self.base_url}/interrupt", json={"prompt_id": prompt_id}, timeout=5)
+            res.raise_for_status()
+            return True
+        return False
+
+    def pop_execution_start(self, prompt_id: str) -> Optional[float]:
+        """ComfyUI가 프롬프트 실행을 시작한 시각 (time.monotonic 기준, 모르면 None)"""
+        return self._started.pop(prompt_id, None)
+
+    async def wait(self, prompt_id: str, timeout: Optional[float] = None) -> dict:
+        """
+        프롬프트 실행이 끝날 때까지 기다립니다.
+
+        Returns:
+            dict: 출력 노드 ID -> executed 메시지의 output
+        """
+        if prompt_id in self._unclaimed:
+            result = self._unclaimed.pop(prompt_id)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[prompt_id] = future
+            try:
+                result = await asyncio.wait_for(future, timeout)
+            finally:
+                self._waiters.pop(prompt_id, None)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def _run(self):
+        delay = RECONNECT_MIN_DELAY
+        first = True
+        while True:
+            try:
+                url = f"{self.ws_url}?clientId={self.client_id}"
+                async with websockets.connect(url, max_size=None) as websocket:
+                    logging.info(f"🔌 ComfyUI 웹소켓 연결됨 (client_id: {self.client_id})")
+                    if not first:
+                        self.reconnects += 1
+                        await self._recover_missed()
+                    first = False
+                    delay = RECONNECT_MIN_DELAY
+                    self._connected.set()
+                    self.disconnected_at = None
+                    async for message in websocket:
+                        # 미리보기 이미지 등 바이너리 프레임은 디코딩하지 않고 무시
+                        if isinstance(message, str):
+                            self._dispatch(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"⚠️ ComfyUI 웹소켓 연결 끊김: {e}. {delay}초 후 재연결...")
+            if self._connected.is_set():
+                self.disconnected_at = time.monotonic()
+            self._connected.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def _dispatch(self, raw: str):
+        # prompt_id가 없는 메시지(status, crystools 모니터 등)는 파싱하지 않음
+        if '"prompt_id"' not in raw:
+            return
+        message = json.loads(raw)
+        msg_type = message.get("type")
+        data = message.get("data", {})
+        prompt_id = data.get("prompt_id")
+        if prompt_id is None:
+            return
+
+        if msg_type == "execution_start":
+            self._started[prompt_id] = time.monotonic()
+        elif msg_type == "executed":
+            self._outputs.setdefault(prompt_id, {})[data.get("node")] = data.get("output")
+        elif msg_type == "execution_success" or (msg_type == "executing" and data.get("node") is None):
+            self._resolve(prompt_id, self._outputs.pop(prompt_id, {}))
+        elif msg_type == "execution_error":
+            self._outputs.pop(prompt_id, None)
+            error = ComfyUIError(f"{data.get('node_type')}: {data.get('exception_message')}")
+            self._resolve(prompt_id, error)
+        elif msg_type == "execution_interrupted":
+            self._outputs.pop(prompt_id, None)
+            self._resolve(prompt_id, ComfyUIError("실행이 중단되었습니다."))
+
+    def _resolve(self, prompt_id: str, result):
+        future = self._waiters.get(prompt_id)
+        if future is not None:
+            if not future.done():
+                future.set_result(result)
+            return
+        # wait()가 아직 호출되지 않은 경우 결과를 잠시 보관
+        self._unclaimed[prompt_id] = result
+        while len(self._unclaimed) > MAX_UNCLAIMED_RESULTS:
+            self._unclaimed.popitem(last=False)
+
+    async def _recover_missed(self):
+        """연결이 끊긴 동안 끝난 프롬프트를 /history 로 확인합니다."""
+        for prompt_id in list(self._outputs):
+            try:
+                res = await self._http.get(f"{self.base_url}/history/{prompt_id}", timeout=10)
+                res.raise_for_status()
+                history = res.json().get(prompt_id)
+            except Exception as e:
+                logging.warning(f"⚠️ 히스토리 조회 실패 (프롬프트 ID: {prompt_id}): {e}")
+                continue
+            if not history:
+                continue
+            status = history.get("status", {})
+            if status.get("status_str") == "error":
+                self._outputs.pop(prompt_id, None)
+                self._resolve(prompt_id, ComfyUIError("실행 중 오류가 발생했습니다. (history)"))
+            elif status.get("completed", True):
+                self._outputs.pop(prompt_id, None)
+                self._resolve(prompt_id, history.get("outputs", {}))
@@ -0,0 +1,43 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+
+class MtimeCache:
+    """
+    파일을 한 번만 파싱해 메모리에 보관하는 캐시.
+
+    매 조회마다 os.stat 으로 수정 시각(mtime)과 크기만 확인하고,
+    파일이 바뀐 경우에만 다시 읽습니다. 서버 재시작 없이 파일 수정이 반영됩니다.
+    """
+
+    def __init__(self, loader: Callable[[Path], Any] = None):
+        self._loader = loader or _load_json
+        self._entries: Dict[Path, Tuple[Tuple[int, int], Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: Path) -> Any:
+        """캐시된 파싱 결과를 반환합니다. 파일이 없으면 FileNotFoundError."""
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = self._loader(path)
+        self._entries[path] = (key, value)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _load_json(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
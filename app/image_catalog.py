@@ -0,0 +1,110 @@
+import heapq
+import itertools
+import os
+import random
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 지원하는 입력 이미지 선택 방식
+PICK_STRATEGIES = ("random", "round_robin", "least_used")
+
+CatalogKey = Tuple[str, str, str, str]  # (character, shot_type, expression, angle)
+
+_UNSCANNED = object()
+
+
+class _Bucket:
+    """(character, shot_type, expression, angle) 하나에 해당하는 이미지 목록"""
+
+    def __init__(self):
+        self.dir_key = _UNSCANNED    # 디렉토리 (mtime_ns, size) - 바뀌면 다시 스캔
+        self.paths: List[str] = []   # output 폴더 기준 상대 경로
+        self.cursor = 0              # round_robin 위치
+        self.uses: Dict[str, int] = {}
+        self.heap: List[tuple] = []  # least_used 용 (사용 횟수, 순번, 경로)
+
+
+class ImageCatalog:
+    """
+    표정 모드 입력 이미지 인덱스.
+
+    요청마다 glob 하지 않고, 키별 디렉토리의 mtime이 바뀐 경우에만 다시 스캔합니다.
+    (organize_output.py 가 파일을 옮기면 디렉토리 mtime이 바뀌므로 자동 반영)
+    선택은 random / round_robin 이 O(1), least_used 가 O(log n) 입니다.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._buckets: Dict[CatalogKey, _Bucket] = {}
+        self._seq = itertools.count()
+        self.rescans = 0
+
+    def _directory(self, key: CatalogKey) -> Path:
+        character, shot_type, expression, angle = key
+        return self.root / character / shot_type / expression / angle
+
+    def _refresh(self, key: CatalogKey) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        directory = self._directory(key)
+        try:
+            stat = os.stat(directory)
+            dir_key = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            dir_key = None
+        if bucket.dir_key == dir_key:
+            return bucket
+
+        # 디렉토리가 바뀐 경우에만 다시 스캔 (사용 횟수는 유지)
+        self.rescans += 1
+        prefix = directory.relative_to(self.root).as_posix()
+        paths = []
+        if dir_key is not None:
+            with os.scandir(directory) as entries:
+                paths = [f"{prefix}/{entry.name}" for entry in entries
+                         if entry.name.endswith(".png") and entry.is_file()]
+        paths.sort()
+        bucket.dir_key = dir_key
+        bucket.paths = paths
+        bucket.uses = {path: bucket.uses.get(path, 0) for path in paths}
+        self._rebuild_heap(bucket)
+        return bucket
+
+    def _rebuild_heap(self, bucket: _Bucket):
+        bucket.heap = [(count, next(self._seq), path) for path, count in bucket.uses.items()]
+        heapq.heapify(bucket.heap)
+
+    def count(self, key: CatalogKey) -> int:
+        return len(self._refresh(key).paths)
+
+    def pick(self, key: CatalogKey, strategy: str = "random", rng=None) -> Optional[str]:
+        """
+        키에 해당하는 이미지 하나를 골라 output 폴더 기준 상대 경로로 반환합니다.
+        이미지가 없으면 None 을 반환합니다.
+        random 방식은 rng(random.Random)를 넘기면 시드에 따라 항상 같은 이미지를 고릅니다.
+        """
+        if strategy not in PICK_STRATEGIES:
+            raise ValueError(f"지원하지 않는 선택 방식입니다: {strategy} (가능: {', '.join(PICK_STRATEGIES)})")
+        bucket = self._refresh(key)
+        if not bucket.paths:
+            return None
+
+        if strategy == "random":
+            path = (rng or random).choice(bucket.paths)
+        elif strategy == "round_robin":
+            path = bucket.paths[bucket.cursor % len(bucket.paths)]
+            bucket.cursor += 1
+        else:
+            # 힙에는 오래된 항목이 남아있을 수 있으므로 현재 사용 횟수와 일치하는 것만 사용
+            while True:
+                count, _, path = heapq.heappop(bucket.heap)
+                if bucket.uses.get(path) == count:
+                    break
+
+        bucket.uses[path] += 1
+        heapq.heappush(bucket.heap, (bucket.uses[path], next(self._seq), path))
+        # 오래된 항목이 너무 많이 쌓이면 힙을 다시 구성
+        if len(bucket.heap) > 4 * len(bucket.paths):
+            self._rebuild_heap(bucket)
+        return path
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.model import GenerateRequest
+from app.scheduler import DEFAULT_PRIORITY, FairScheduler
+
+# 완료된 작업을 메모리에 보관할 최대 개수 (오래된 것부터 삭제)
+MAX_FINISHED_JOBS = 10000
+
+
+@dataclass
+class Job:
+    """API 측에서 관리하는 단일 생성 작업"""
+    req: GenerateRequest
+    prompt: str
+    workflow: dict
+    meta: dict = field(default_factory=dict)
+    batch_key: Optional[str] = None  # 같은 값을 가진 작업끼리 하나의 워크플로우로 묶을 수 있음
+    job_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "queued"  # queued -> submitted -> done | failed (queued, submitted -> cancelled)
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    future: Optional[asyncio.Future] = None
+
+    @property
+    def priority(self) -> str:
+        return self.req.priority or DEFAULT_PRIORITY
+
+    @property
+    def flow(self):
+        """공정 분배 단위: (테넌트 또는 캐릭터, 생성 모드)"""
+        return self.req.tenant or self.req.character_name, self.req.generation_mode
+
+    def to_status(self):
+        """상태 조회 응답용 딕셔너리를 반환합니다."""
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "generation_mode": self.req.generation_mode,
+            "character_name": self.req.character_name,
+            "index": self.req.index,
+            "priority": self.priority,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    생성 작업을 큐에 쌓아두고, ComfyUI 큐에 항상 queue_depth 개의 작업이
+    올라가 있도록 워커를 돌립니다.
+
+    워커 하나가 작업 하나를 ComfyUI에 전송하고 완료될 때까지 기다리므로,
+    워커 수(queue_depth)가 곧 ComfyUI에 동시에 올라가는 작업 수가 됩니다.
+    queue_depth >= 2 이면 샘플러가 끝나는 즉시 다음 작업이 대기 중이게 됩니다.
+
+    batch_size > 1 이면 대기열에서 batch_key 가 같은 작업을 최대 batch_size 개까지
+    모아 runner 에 한 번에 넘깁니다. (하나의 ComfyUI 워크플로우로 실행)
+
+    대기열은 FairScheduler 로 우선순위(high > normal > low)를 지키고, 같은 우선순위 안에서는
+    (테넌트 또는 캐릭터, 모드) 흐름마다 weights 비율로 번갈아 꺼냅니다.
+    admission_limits 는 우선순위별 대기 작업 수 한도입니다. 그 우선순위의 대기 작업이 한도를 넘게 되면
+    새 작업을 받지 않습니다. (다른 우선순위의 대기 작업은 세지 않음, None 이면 무제한)
+    canceller 는 이미 ComfyUI에 전송된 작업 묶음이 모두 취소되었을 때 호출됩니다. (큐 삭제 / 중단)
+    """
+
+    def __init__(self, runner: Callable[[List[Job]], Awaitable[List[dict]]],
+                 queue_depth: int = 2, batch_size: int = 1, weights: Optional[Dict[str, float]] = None,
+                 admission_limits: Optional[Dict[str, Optional[int]]] = None,
+                 canceller: Optional[Callable[[List[Job]], Awaitable[None]]] = None):
+        self._runner = runner
+        self.queue_depth = queue_depth
+        self.batch_size = batch_size
+        self.weights = weights or {}
+        self.admission_limits = admission_limits or {}
+        self._canceller = canceller
+        self._pending = FairScheduler(lambda job: job.flow, lambda job: job.priority, self._weight)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._finished = deque()
+        self._workers = []
+
+    def start(self):
+        """워커 태스크를 시작합니다. (이벤트 루프 안에서 호출)"""
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.queue_depth)]
+        logging.info(f"🧵 작업 워커 {self.queue_depth}개 시작 (배치 크기: {self.batch_size})")
+
+    async def stop(self):
+        """워커 태스크를 모두 종료합니다."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def admit(self, priority: str, count: int = 1) -> bool:
+        """우선순위 priority 의 작업 count 개를 지금 받을 수 있는지 (그 우선순위의 대기 작업 수로 한도 확인)"""
+        limit = self.admission_limits.get(priority)
+        return limit is None or self._pending.counts().get(priority, 0) + count <= limit
+
+    def submit(self, job: Job) -> Job:
+        """작업을 대기열에 추가하고 즉시 반환합니다."""
+        self._pending.push(job)
+        job.future = asyncio.get_running_loop().create_future()
+        self._jobs[job.job_id] = job
+        self._wakeup.set()
+        return job
+
+    async def cancel(self, job: Job) -> bool:
+        """
+        작업을 취소합니다. 대기 중이면 대기열에서 빼고, ComfyUI에 전송된 상태면
+        같은 묶음의 작업이 모두 취소되었을 때 canceller 로 ComfyUI 측 작업도 지웁니다.
+        이미 끝난 작업이면 False.
+        """
+        if job.status == "queued":
+            self._pending.remove(job)
+            self._finish_cancelled(job)
+            return True
+        if job.status != "submitted":
+            return False
+        job.status = "cancelled"
+        job.error = "cancelled"
+        batch = job.meta.get("batch", [job])
+        if self._canceller and all(other.status == "cancelled" for other in batch):
+            await self._canceller(batch)
+        return True
+
+    def add_done(self, job: Job, result: dict) -> Job:
+        """ComfyUI에 보내지 않고 바로 끝난 작업(결과 캐시 적중 등)을 완료 상태로 등록합니다."""
+        job.future = asyncio.get_running_loop().create_future()
+        job.status = "done"
+        job.result = result
+        job.finished_at = time.time()
+        job.future.set_result(job)
+        self._jobs[job.job_id] = job
+        self._trim(job)
+        return job
+
+    def add_failed(self, job: Job, error: str) -> Job:
+        """준비 단계에서 실패한 작업을 실패 상태로 등록합니다."""
+        job.status = "failed"
+        job.error = error
+        job.finished_at = time.time()
+        self._jobs[job.job_id] = job
+        self._trim(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def pending_count(self) -> int:
+        """아직 ComfyUI에 전송되지 않은 작업 수"""
+        return len(self._pending)
+
+    def pending_by_priority(self) -> Dict[str, int]:
+        return self._pending.counts()
+
+    def scheduler_stats(self) -> dict:
+        return self._pending.stats()
+
+    def _weight(self, flow) -> float:
+        tenant, mode = flow
+        return self.weights.get(f"{tenant}/{mode}", self.weights.get(tenant, 1.0))
+
+    def _finish_cancelled(self, job: Job):
+        job.status = "cancelled"
+        job.error = "cancelled"
+        job.finished_at = time.time()
+        if job.future and not job.future.done():
+            job.future.set_result(job)
+        self._trim(job)
+
+    async def _next_batch(self) -> List[Job]:
+        while True:
+            # 우선순위가 가장 높고 공정 분배 순서상 가장 앞선 흐름의 작업 (같은 흐름의 batch_key 가 같은 작업과 함께)
+            batch = self._pending.pop(self.batch_size, lambda job: job.batch_key)
+            if batch:
+                return batch
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _worker(self, worker_id: int):
+        while True:
+            batch = await self._next_batch()
+            for job in batch:
+                job.status = "submitted"
+                job.meta["batch"] = batch
+            try:
+                results = await self._runner(batch)
+                for job, result in zip(batch, results):
+                    job.result = result
+                    if job.status != "cancelled":
+                        job.status = "done"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if all(job.status == "cancelled" for job in batch):
+                    logging.info(f"🛑 취소된 작업 종료 (job_id: {', '.join(job.job_id for job in batch)})")
+                else:
+                    logging.error(f"❌ 작업 실패 (job_id: {', '.join(job.job_id for job in batch)}): {e}")
+                for job in batch:
+                    if job.status != "cancelled":
+                        job.status = "failed"
+                        job.error = str(e)
+            finally:
+                for job in batch:
+                    job.meta.pop("batch", None)
+                    job.finished_at = time.time()
+                    # 성공/실패 모두 job 자체를 결과로 전달 (호출 측에서 status 확인)
+                    if job.future and not job.future.done():
+                        job.future.set_result(job)
+                    self._trim(job)
+
+    def _trim(self, job: Job):
+        """완료된 작업이 MAX_FINISHED_JOBS 를 넘으면 오래된 것부터 삭제합니다."""
+        self._finished.append(job.job_id)
+        while len(self._finished) > MAX_FINISHED_JOBS:
+            self._jobs.pop(self._finished.popleft(), None)
@@ -1,36 +1,118 @@
-from fastapi import FastAPI, HTTPException
-from app.model import GenerateRequest
-from app.prompt_util import generate_prompt, load_prompt_set
-from app.workflow_builder import build_workflow
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from app.backend_pool import Backend, BackendPool
+from app.caption_writer import CaptionWriter, caption_name, caption_tags, extract_caption_text
+from app.comfy_client import ComfyUICancelled
+from app.image_catalog import ImageCatalog
+from app.job_manager import Job, JobManager
+from app.metrics import Trace, job_seconds, jobs_total, registry, stage_seconds, throughput
+from app.model import GenerateRequest, JobStatusRequest, PromptPlanRequest, SubmitJobsRequest
+from app.prompt_planner import PlannerCache, PromptPlanner, plan_seed
+from app.prompt_util import derive_seed, load_prompt_bundle, load_prompt_set, prompt_set_cache
+from app.reference_cache import ReferenceCache
+from app.result_stream import ARCHIVE_FORMATS, SSE_KEEPALIVE, archive_chunks, output_images, resolve_output, result_files, sse_event
+from app.scheduler import DEFAULT_PRIORITY, PRIORITIES
+from app.result_cache import ResultCache, workflow_hash
+from app.workflow_builder import build_batch_workflow, build_workflow, workflow_branch, workflow_template_cache
+import asyncio
 import httpx
-import websockets
 import json
-import uuid
 import logging
 import random
-import glob
-import asyncio
+import time
 from pathlib import Path
+from typing import List, Optional, Set
 
 # --- 기본 설정 ---
 # 로깅 설정: 시간, 로그 레벨, 메시지 형식 지정
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# ComfyUI API 및 웹소켓 주소
-COMFYUI_API_URL = "http://localhost:9000/prompt"
+# ComfyUI API 및 웹소켓 주소 (기본 로컬 서버)
+COMFYUI_BASE_URL = "http://localhost:9000"
 COMFYUI_WS_URL = "ws://localhost:9000/ws"
 # ComfyUI의 입력 이미지가 저장된 디렉토리 (사용자 지정 경로)
 COMFYUI_INPUT_DIR = Path("/home/jonathan/Desktop/NewSSD500GB/newssd/pythonProject/ComfyUI/output")
 
+# 생성 결과 캐시 디렉토리 (같은 워크플로우는 다시 생성하지 않음)
+RESULT_CACHE_DIR = Path("cache/results")
+
+# 참조 이미지를 Kontext 해상도로 미리 축소해 두고 워크플로우가 축소본을 읽도록 할지 여부
+# 축소본은 API 서버의 output 폴더에만 만들어지므로 같은 폴더를 쓰는 로컬 서버에만 축소본 워크플로우를 보내고,
+# 원격 서버(fetch_outputs=True)에는 원본 참조 이미지를 쓰는 워크플로우를 보냄
+REFERENCE_CACHE_ENABLED = False
+# 사전 축소본 전체 크기 상한 (넘으면 오래 쓰지 않은 것부터 삭제)
+REFERENCE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# 표정 모드 입력 이미지 선택 방식 기본값 ('random', 'round_robin', 'least_used')
+INPUT_PICK_STRATEGY = "random"
+
+# 프롬프트 조합 방식 기본값 ('random', 'uniform', 'stratified', 'latin_hypercube')
+# 같은 프롬프트셋 + run_id 의 작업들은 하나의 계획을 공유하고, 인덱스로 계획 안의 위치를 정함
+PROMPT_PLAN_STRATEGY = "uniform"
+
+# ComfyUI 큐에 동시에 올려둘 작업 수 (2 이상이면 샘플러가 쉬지 않고 다음 작업을 처리)
+COMFYUI_QUEUE_DEPTH = 2
+
+# 작업을 분배할 ComfyUI 서버 목록
+# - weight: 클수록 더 많은 작업을 배정
+# - max_queue_depth: 해당 서버에 동시에 올려둘 최대 작업 수
+# - fetch_outputs: True 이면 결과 파일을 /view 로 내려받아 COMFYUI_INPUT_DIR 에 저장 (원격 서버용)
+COMFYUI_BACKENDS = [
+    {"name": "local", "base_url": COMFYUI_BASE_URL, "ws_url": COMFYUI_WS_URL,
+     "weight": 1.0, "max_queue_depth": COMFYUI_QUEUE_DEPTH, "fetch_outputs": False},
+    # {"name": "gpu2", "base_url": "http://192.168.0.12:8188", "ws_url": "ws://192.168.0.12:8188/ws",
+    #  "weight": 1.0, "max_queue_depth": 2, "fetch_outputs": True},
+]
+# 같은 입력 이미지를 쓰는 작업을 하나의 워크플로우로 묶을 최대 개수 (1이면 묶지 않음)
+COMFYUI_BATCH_SIZE = 1
+
+# 대기열 공정 분배 가중치: 테넌트(없으면 캐릭터) 또는 "캐릭터/모드" -> 가중치 (없으면 1.0)
+# 예: {"ellie": 2.0, "ryder/expression": 0.5}
+TENANT_WEIGHTS = {}
+# 우선순위별 대기열 한도: 그 우선순위의 대기 작업이 이 수를 넘게 되면 새 작업을 429로 거절 (None 이면 무제한)
+# (다른 우선순위의 대기 작업은 세지 않으므로 low 작업이 쌓여 있어도 normal 작업은 normal 한도까지 받음)
+# high 는 한도를 두지 않아 대기열이 꽉 차 있어도 급한 작업은 받음
+ADMISSION_LIMITS = {"high": None, "normal": 50000, "low": 20000}
+# 거절 응답의 Retry-After (초)
+ADMISSION_RETRY_AFTER = 30
+
 # FastAPI 앱 생성
 app = FastAPI()
 
-# --- API 엔드포인트 ---
-@app.post("/generateDataset")
-async def generate_dataset(req: GenerateRequest):
-    """데이터셋 생성을 위한 메인 API 엔드포인트"""
-    logging.info(f"🚀 생성 모드({req.generation_mode}), 인덱스({req.index}) 요청 접수")
+# 연결 재사용을 위한 공용 HTTP 클라이언트 (startup 시 생성)
+http_client: Optional[httpx.AsyncClient] = None
+# (프롬프트셋, run_id, 방식)별 프롬프트 조합 계획
+planner_cache = PlannerCache()
+# 표정 모드 입력 이미지 인덱스
+image_catalog = ImageCatalog(COMFYUI_INPUT_DIR)
+# Kontext 해상도로 미리 축소한 참조 이미지 캐시
+reference_cache = ReferenceCache(COMFYUI_INPUT_DIR, REFERENCE_CACHE_MAX_BYTES)
+# 워크플로우 해시 기반 생성 결과 캐시
+result_cache = ResultCache(RESULT_CACHE_DIR)
+# 최종 캡션 파일 기록기 (요청 처리와 분리된 백그라운드 워커)
+caption_writer = CaptionWriter()
+# ComfyUI 서버 풀 (서버마다 웹소켓 하나를 공유)
+backend_pool = BackendPool(COMFYUI_BACKENDS)
+# ComfyUI에 전송되어 실행 중인 작업 수 (배치 안의 작업을 각각 셈)
+jobs_in_flight = 0
+# 실행 중인 백그라운드 작업 (이벤트 루프는 약한 참조만 가지므로 끝날 때까지 여기서 참조를 유지)
+background_tasks: Set[asyncio.Task] = set()
+
+
+async def prepare_job(req: GenerateRequest) -> Job:
+    """
+    요청을 바탕으로 프롬프트와 워크플로우를 만들어 Job 객체를 생성합니다.
+    참조 이미지 사전 축소(처음 한 번은 디코딩 + Lanczos 축소 + 해시)는 이벤트 루프를 막지 않도록 스레드에서 실행합니다.
+    """
     shot_type = None
+    if req.priority is not None and req.priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"잘못된 우선순위입니다: {req.priority} (가능: {', '.join(PRIORITIES)})")
+    # 단계별 소요 시간 (stage_seconds 히스토그램 + X-Trace 응답)
+    trace = Trace()
+    # 작업마다 결정적인 시드: 입력 이미지 선택과 KSampler 시드에 사용하고,
+    # 요청에 시드를 지정했거나 프롬프트 조합 방식이 random 이면 프롬프트 선택에도 사용
+    seed = req.seed if req.seed is not None else derive_seed(
+        req.character_name, req.generation_mode, req.index, req.run_id or "")
 
     # 1. 생성 모드에 따라 프롬프트와 입력 이미지 결정
     if req.generation_mode == "shot_type":
@@ -41,6 +123,8 @@ async def generate_dataset(req: GenerateRequest):
         
         input_image_name = f"{shot_type}_{req.trigger_word}.png"
         prompt_set_filename = f"{req.character_name}/{shot_type}/PromptSet.json"
+        # 같은 샷 타입의 작업은 인덱스가 3씩 건너뛰므로 계획 안의 위치는 연속이 되도록 나눔
+        plan_position = req.index // len(shot_type_map)
         
     elif req.generation_mode == "expression":
         # --- '표정' 모드 ---
@@ -48,25 +132,25 @@ async def generate_dataset(req: GenerateRequest):
             raise HTTPException(status_code=400, detail="'표정' 모드에서는 expression과 angle 값이 반드시 필요합니다.")
         
         shot_type = "bustShot"
-        # 표정과 앵글에 맞는 입력 이미지들을 동적으로 찾아 랜덤 선택
-        image_pattern = f"{req.character_name}/{shot_type}/{req.expression}/{req.angle}/*.png"
-        full_search_path = str(COMFYUI_INPUT_DIR / image_pattern)
-        logging.info(f"🔍 입력 이미지 검색 경로: {full_search_path}")
-        image_files = glob.glob(full_search_path)
-        
-        if not image_files:
-            # 해당 패턴의 입력 이미지를 찾지 못하면 즉시 에러 발생
+        # 표정과 앵글에 맞는 입력 이미지를 카탈로그에서 선택 (디렉토리가 바뀐 경우에만 다시 스캔)
+        catalog_key = (req.character_name, shot_type, req.expression, req.angle)
+        strategy = req.input_pick_strategy or INPUT_PICK_STRATEGY
+        try:
+            with trace.stage("image_pick"):
+                input_image_name = image_catalog.pick(catalog_key, strategy, rng=random.Random(f"{seed}:image"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if input_image_name is None:
+            # 해당 키의 입력 이미지를 찾지 못하면 즉시 에러 발생
+            image_pattern = "/".join(catalog_key) + "/*.png"
             error_msg = f"입력 이미지를 찾을 수 없습니다. 경로: '{COMFYUI_INPUT_DIR}', 패턴: '{image_pattern}'"
             logging.error(error_msg)
             raise HTTPException(status_code=404, detail=error_msg)
-            
-        # 찾은 이미지 중 하나를 랜덤으로 선택
-        selected_image_path = Path(random.choice(image_files))
-        # ComfyUI가 하위 폴더의 이미지를 찾을 수 있도록 output 폴더 기준의 상대 경로를 전달
-        input_image_name = selected_image_path.relative_to(COMFYUI_INPUT_DIR).as_posix()
-        logging.info(f"'{image_pattern}' 패턴으로 {len(image_files)}개의 이미지 발견. 랜덤 선택: {input_image_name}")
+        logging.info(f"{image_catalog.count(catalog_key)}개의 이미지 중 선택({strategy}): {input_image_name}")
 
         prompt_set_filename = f"{req.character_name}/{req.expression}/{req.angle}_PromptSet.json"
+        plan_position = req.index
 
     else:
         raise HTTPException(status_code=400, detail=f"잘못된 생성 모드입니다: {req.generation_mode}")
@@ -76,79 +160,550 @@ async def generate_dataset(req: GenerateRequest):
     
     # 2. 프롬프트 생성 및 워크플로우 빌드
     try:
-        prompt_set = load_prompt_set(prompt_set_filename)
+        with trace.stage("prompt_set"):
+            prompt_set = load_prompt_set(prompt_set_filename)
     except FileNotFoundError:
         logging.error(f"❌ 프롬프트셋 파일을 찾을 수 없습니다: {prompt_set_filename}")
         raise HTTPException(status_code=404, detail=f"프롬프트셋 파일을 찾을 수 없습니다: {prompt_set_filename}")
 
-    prompt = generate_prompt(prompt_set)
-    workflow = build_workflow(req, prompt, input_image_name)
-    
-    # 3. ComfyUI에 생성 요청 전송
-    client_id = str(uuid.uuid4())
-    payload = {"prompt": workflow, "client_id": client_id}
-
-    async with httpx.AsyncClient() as client:
-        res = await client.post(COMFYUI_API_URL, json=payload, timeout=20)
-        res.raise_for_status()
-        prompt_id = res.json()["prompt_id"]
-        logging.info(f"✅ ComfyUI에 작업 전송 완료. 프롬프트 ID: {prompt_id}")
-
-    # 4. 웹소켓으로 작업 완료 '확실하게' 대기 (try/except 제거)
-    # 이제 웹소켓 연결 실패 시, 에러가 발생하여 generate_loop.py가 다음 요청을 보내지 않습니다.
-    ws_url = f"{COMFYUI_WS_URL}?clientId={client_id}"
-    async with websockets.connect(ws_url) as websocket:
-        logging.info(f"⏳ 작업 완료 대기 중 (프롬프트 ID: {prompt_id})...")
-        while True:
-            out = await websocket.recv()
-            if isinstance(out, str):
-                message = json.loads(out)
-                if message.get('type') == 'executed' and message.get('data', {}).get('prompt_id') == prompt_id:
-                    logging.info(f"🎉 작업 완료 (프롬프트 ID: {prompt_id}).")
-
-                    # --- 작업 완료 후 텍스트 파일에 expression 추가 ---
-                    if req.generation_mode == "expression" and req.expression:
-                        output_dir = COMFYUI_INPUT_DIR # ComfyUI의 output 폴더를 사용
-                        txt_filename = f"{req.trigger_word}_expression_{(req.index):05d}_.txt"
-                        txt_filepath = output_dir / txt_filename
-                        
-                        # --- 재시도 로직 추가 ---
-                        max_retries = 5
-                        retry_delay = 0.2 # 200ms
-                        for attempt in range(max_retries):
-                            try:
-                                # 파일을 읽고, 맨 뒤의 공백/개행을 제거한 후 expression 추가
-                                with open(txt_filepath, "r+", encoding="utf-8") as f:
-                                    content = f.read()
-                                    f.seek(0)
-                                    # 맨 뒤에 쉼표와 함께 expression 추가
-                                    new_content = content.rstrip() + f", {req.expression}"
-                                    f.write(new_content)
-                                    f.truncate()
-                                logging.info(f"✅ 텍스트 파일에 expression '{req.expression}' 추가 완료: {txt_filepath}")
-                                break # 성공 시 루프 탈출
-                            except FileNotFoundError:
-                                if attempt < max_retries - 1:
-                                    logging.warning(f"테스트 파일을 아직 찾을 수 없습니다. {retry_delay}초 후 재시도... ({attempt + 1}/{max_retries})")
-                                    await asyncio.sleep(retry_delay)
-                                else:
-                                    logging.error(f"❌ 텍스트 파일을 찾을 수 없어 expression을 추가하지 못했습니다: {txt_filepath}")
-                            except Exception as e:
-                                logging.error(f"❌ 텍스트 파일에 expression 추가 중 오류 발생: {e}")
-                                break # 다른 종류의 에러 발생 시 재시도 중단
-                        # -----------------------
-
-                    # -----------------------------------------
-
-                    break
-        
-    logging.info(f"✅ 인덱스({req.index}) 요청 처리 완료.")
-    
-    # 5. API 응답 반환
-    output_image_name = f"{req.trigger_word}_{(req.expression)}_{(req.index):05d}_.png"
+    # 프롬프트셋 조합 계획에서 이 작업 위치의 프롬프트를 선택 (중복 없이 고르게 분포)
+    # 시드를 지정한 요청(재생성 등)과 random 방식은 계획 위치 대신 시드로 선택하므로 시드를 바꾸면 프롬프트도 바뀜
+    prompt_strategy = req.prompt_strategy or PROMPT_PLAN_STRATEGY
+    try:
+        with trace.stage("prompt_plan"):
+            planner = planner_cache.get(prompt_set_filename, prompt_set, req.run_id or "", prompt_strategy)
+            if req.seed is not None or prompt_strategy == "random":
+                prompt = planner.seeded_prompt(seed)
+            else:
+                prompt = planner.prompt(plan_position)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 참조 이미지를 미리 축소해 둔 파일로 교체 (작업이 끝날 때까지 삭제되지 않도록 pin)
+    reference_image, prescaled = input_image_name, False
+    if REFERENCE_CACHE_ENABLED:
+        try:
+            with trace.stage("reference"):
+                reference_image = await asyncio.to_thread(reference_cache.prepare, input_image_name)
+                prescaled = True
+        except OSError as e:
+            logging.warning(f"⚠️ 참조 이미지를 미리 축소하지 못해 원본을 사용합니다: {input_image_name} ({e})")
+
+    with trace.stage("build_workflow"):
+        workflow = build_workflow(req, prompt, reference_image, seed, prescaled=prescaled)
+    with trace.stage("workflow_hash"):
+        cache_key = workflow_hash(workflow)
+    meta = {
+        "input_image_name": input_image_name,
+        "reference_image": reference_image,
+        "prescaled": prescaled,
+        "seed": seed,
+        "cache_key": cache_key,
+        "trace": trace,
+    }
+    return Job(req=req, prompt=prompt, workflow=workflow, meta=meta, batch_key=reference_image)
+
+
+def release_reference(job: Job):
+    """작업이 끝나면 사전 축소본의 pin 을 풉니다."""
+    if job.meta.get("prescaled"):
+        reference_cache.release(job.meta["reference_image"])
+
+
+def enqueue_job(job: Job) -> Job:
+    """결과 캐시에 같은 워크플로우가 있으면 바로 완료 처리하고, 없으면 대기열에 넣습니다."""
+    with job.meta["trace"].stage("result_cache"):
+        cached = result_cache.lookup(job.meta["cache_key"])
+    if cached is not None:
+        logging.info(f"♻️ 결과 캐시 적중: 인덱스({job.req.index})")
+        release_reference(job)
+        result, files = cached
+        job_manager.add_done(job, {**result, **cached_output_names(result, files), "cached": True})
+        observe_job(job, "cached")
+        return job
+    job.meta["enqueued_at"] = time.monotonic()
+    return job_manager.submit(job)
+
+
+def cached_output_names(result: dict, files: List[str]) -> dict:
+    """
+    실제 출력 파일명(images, caption)이 없는 이전 형식의 캐시 결과는 기록된 파일 경로로 채웁니다.
+    (파일 목록은 이미지들 다음에 캡션 파일 순서)
+    """
+    if "images" in result or not files:
+        return {}
+    try:
+        names = [Path(path).relative_to(COMFYUI_INPUT_DIR).as_posix() for path in files]
+    except ValueError:
+        return {}
+    return {"image": names[0] if len(names) > 1 else result.get("image"), "images": names[:-1], "caption": names[-1]}
+
+
+def admit_jobs(reqs: List[GenerateRequest]):
+    """대기열이 우선순위별 한도를 넘게 되면 429로 거절합니다. (클라이언트는 Retry-After 후 재시도)"""
+    counts = {}
+    for req in reqs:
+        priority = req.priority or DEFAULT_PRIORITY
+        counts[priority] = counts.get(priority, 0) + 1
+    for priority, count in counts.items():
+        if not job_manager.admit(priority, count):
+            raise HTTPException(status_code=429, headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+                                detail=f"대기열이 가득 찼습니다 (우선순위 {priority}, "
+                                       f"대기 {job_manager.pending_by_priority().get(priority, 0)}개)")
+
+
+def observe_job(job: Job, status: str):
+    """끝난 작업을 지표에 반영합니다. (status: done, failed, cached, cancelled)"""
+    req = job.req
+    job_seconds.observe(time.time() - job.created_at, req.generation_mode, status)
+    jobs_total.inc(req.character_name, req.generation_mode, status)
+    if status == "done":
+        throughput.record(req.character_name, req.generation_mode)
+
+
+async def run_jobs(jobs: List[Job]) -> List[dict]:
+    """
+    작업(또는 같은 입력 이미지를 쓰는 작업 묶음)을 ComfyUI에 전송하고 완료될 때까지 기다립니다.
+    (JobManager 워커에서 호출)
+    """
+    global jobs_in_flight
+    now = time.monotonic()
+    for job in jobs:
+        job.meta["trace"].add("queue_wait", now - job.meta["enqueued_at"])
+    jobs_in_flight += len(jobs)
+    try:
+        results = await _run_jobs(jobs)
+    except Exception:
+        for job in jobs:
+            observe_job(job, "cancelled" if job.status == "cancelled" else "failed")
+        raise
+    finally:
+        jobs_in_flight -= len(jobs)
+        for job in jobs:
+            release_reference(job)
+    for job in jobs:
+        observe_job(job, "cancelled" if job.status == "cancelled" else "done")
+    return results
+
+
+def record_submission(jobs: List[Job], backend: Backend, prompt_id: str):
+    """ComfyUI 큐에 들어간 프롬프트를 기록합니다. 그 사이 모두 취소되었으면 바로 ComfyUI 측도 취소합니다."""
+    for job in jobs:
+        job.meta["comfy"] = (backend, prompt_id)
+    if all(job.status == "cancelled" for job in jobs):
+        run_in_background(cancel_submitted(jobs))
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """코루틴을 백그라운드 작업으로 실행합니다. 끝나면 참조를 버리고, 예외는 로그로 남깁니다."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+
+def _background_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"❌ 백그라운드 작업 실패: {task.exception()!r}")
+
+
+async def cancel_submitted(jobs: List[Job]):
+    """모두 취소된 작업 묶음의 ComfyUI 프롬프트를 큐에서 지우거나 실행을 중단합니다. (JobManager canceller)"""
+    comfy = jobs[0].meta.get("comfy")
+    if comfy is None:
+        # 아직 ComfyUI에 전송하기 전이면 전송 직후 record_submission 에서 취소
+        return
+    backend, prompt_id = comfy
+    try:
+        if await backend.client.cancel(prompt_id):
+            logging.info(f"🛑 [{backend.name}] ComfyUI 프롬프트 취소: {prompt_id}")
+    except httpx.HTTPError as e:
+        logging.warning(f"⚠️ [{backend.name}] ComfyUI 프롬프트 취소 실패 ({prompt_id}): {e!r}")
+
+
+def build_remote_workflow(jobs: List[Job]) -> dict:
+    """사전 축소본 대신 원본 참조 이미지를 쓰는 워크플로우 (output 폴더를 공유하지 않는 원격 서버용)"""
+    job = jobs[0]
+    if len(jobs) == 1:
+        return build_workflow(job.req, job.prompt, job.meta["input_image_name"], job.meta["seed"])
+    items = [(job.req, job.prompt, job.meta["seed"]) for job in jobs]
+    return build_batch_workflow(items, job.meta["input_image_name"])[0]
+
+
+async def _run_jobs(jobs: List[Job]) -> List[dict]:
+    # 묶음 전체가 함께 거치는 단계 (끝나면 작업별 트레이스에 합침)
+    batch_trace = Trace()
+    if len(jobs) == 1:
+        workflow = jobs[0].workflow
+        branches = [workflow_branch(jobs[0].req)]
+    else:
+        # 배치 모드: 참조 이미지 인코딩을 공유하는 하나의 워크플로우로 합침
+        items = [(job.req, job.prompt, job.meta["seed"]) for job in jobs]
+        with batch_trace.stage("build_batch"):
+            workflow, branches = build_batch_workflow(items, jobs[0].meta["reference_image"], prescaled=jobs[0].meta["prescaled"])
+
+    # 원격 서버에는 사전 축소본이 없으므로 원본 참조 이미지를 쓰는 워크플로우를 따로 준비
+    remote_workflow = None
+    if jobs[0].meta["prescaled"] and backend_pool.has_remote:
+        with batch_trace.stage("build_remote"):
+            remote_workflow = build_remote_workflow(jobs)
+
+    # 3. 서버 풀에서 가장 한가한 ComfyUI 서버에 전송하고 완료 대기
+    if all(job.status == "cancelled" for job in jobs):
+        raise ComfyUICancelled("전송 전에 취소되었습니다.")
+    logging.info(f"⏳ 작업 {len(jobs)}개 전송 및 완료 대기 중...")
+    try:
+        outputs, backend = await backend_pool.run(
+            workflow, batch_trace, on_submit=lambda backend, prompt_id: record_submission(jobs, backend, prompt_id),
+            remote_workflow=remote_workflow)
+    finally:
+        for job in jobs:
+            job.meta["trace"].merge(batch_trace)
+    logging.info(f"🎉 [{backend.name}] 작업 완료.")
+
+    # 4. 원격 서버에서 생성된 경우 결과 파일을 output 폴더로 가져옴
+    caption_files = [branch["caption_file"] for branch in branches]
+    fetch_start = time.perf_counter()
+    await backend_pool.fetch_outputs(backend, outputs, COMFYUI_INPUT_DIR, caption_files)
+    fetch_seconds = time.perf_counter() - fetch_start
+    stage_seconds.observe(fetch_seconds, "fetch_outputs")
+
+    results = []
+    for job, branch in zip(jobs, branches):
+        req = job.req
+        trace = job.meta["trace"]
+        trace.add("fetch_outputs", fetch_seconds, observe=False)
+        finalize_start = time.perf_counter()
+        # 브랜치의 출력 노드 결과를 원래 작업에 연결
+        job.meta["outputs"] = {
+            "image": outputs.get(branch["image_node"]),
+            "caption": outputs.get(branch["caption_node"]),
+            "caption_file": branch["caption_file"],
+        }
+        # 결과 반환: SaveImage executed 출력에 담긴 실제 파일명 (output 폴더 기준 상대 경로)
+        images = output_images(outputs.get(branch["image_node"]))
+
+        # 최종 캡션(DeepDanbooru 캡션 + 모드별 태그)은 저장된 이미지와 같은 이름으로 백그라운드에서 한 번에 기록
+        # (이미지 번호는 ComfyUI 가 매기므로 SaveText 원본은 요청 인덱스 이름으로 받은 뒤 옮김 -> organize_output 이 이름으로 짝지음)
+        # (결과 스트림/다운로드는 caption_written 이 끝난 뒤 캡션을 내보냄)
+        caption_file = caption_name(images[0]) if images else branch["caption_file"]
+        caption_text = extract_caption_text(outputs.get(branch["caption_node"]))
+        job.meta["caption_written"] = caption_writer.submit(COMFYUI_INPUT_DIR / caption_file, caption_text,
+                                                            caption_tags(req), source=COMFYUI_INPUT_DIR / branch["caption_file"])
+
+        logging.info(f"✅ 인덱스({req.index}) 요청 처리 완료.")
+
+        result = {
+            "status": "ok",
+            "prompt": job.prompt,
+            "seed": job.meta["seed"],
+            "image": images[0] if images else None,
+            "images": images,
+            "caption": caption_file,
+        }
+        results.append(result)
+
+        # 같은 워크플로우가 다시 들어오면 재사용할 수 있도록 결과 캐시에 기록
+        result_cache.put(job.meta["cache_key"], result, [COMFYUI_INPUT_DIR / name for name in result_files(result)])
+        trace.add("finalize", time.perf_counter() - finalize_start)
+    return results
+
+
+# 워커 수 = 모든 서버의 max_queue_depth 합 (모든 서버의 큐를 채워둠)
+job_manager = JobManager(run_jobs, queue_depth=backend_pool.capacity, batch_size=COMFYUI_BATCH_SIZE,
+                         weights=TENANT_WEIGHTS, admission_limits=ADMISSION_LIMITS, canceller=cancel_submitted)
+
+# /metrics 조회 시점에 계산하는 지표
+registry.gauge("comfy_api_jobs_pending", "Jobs waiting in the API queue",
+               collect=lambda: {(): job_manager.pending_count()})
+registry.gauge("comfy_api_jobs_pending_by_priority", "Jobs waiting in the API queue per priority", ["priority"],
+               collect=lambda: {(priority,): count for priority, count in job_manager.pending_by_priority().items()})
+registry.gauge("comfy_api_jobs_in_flight", "Jobs submitted to ComfyUI and not finished yet",
+               collect=lambda: {(): jobs_in_flight})
+registry.gauge("comfy_api_captions_pending", "Caption files waiting to be written",
+               collect=lambda: {(): caption_writer.pending()})
+registry.gauge("comfyui_prompts_in_flight", "Workflows this API is waiting on per backend", ["backend"],
+               collect=lambda: {(b.name,): b.in_flight for b in backend_pool.backends})
+registry.gauge("comfyui_queue_length", "Running + pending prompts reported by ComfyUI /queue", ["backend"],
+               collect=lambda: {(b.name,): b.queue_length for b in backend_pool.backends})
+registry.gauge("comfyui_backend_healthy", "1 if the backend is connected and answering /queue", ["backend"],
+               collect=lambda: {(b.name,): int(b.healthy) for b in backend_pool.backends})
+registry.gauge("comfyui_ws_reconnects_total", "Websocket reconnects per backend", ["backend"],
+               collect=lambda: {(b.name,): b.client.reconnects for b in backend_pool.backends},
+               metric_type="counter")
+
+
+@app.on_event("startup")
+async def startup():
+    global http_client
+    http_client = httpx.AsyncClient()
+    # 프롬프트 번들을 미리 읽어둠 (첫 요청이 번들 로드를 기다리지 않도록)
+    bundle = load_prompt_bundle()
+    if bundle is not None:
+        logging.info(f"📦 프롬프트 번들 로드: 프롬프트셋 {len(bundle.sets)}개 (build {bundle.build})")
+    await backend_pool.start(http_client)
+    caption_writer.start()
+    job_manager.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_manager.stop()
+    # 진행 중인 ComfyUI 취소 요청은 서버 풀을 닫기 전에 마무리
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await caption_writer.stop()
+    await backend_pool.stop()
+    await http_client.aclose()
+
+
+# --- API 엔드포인트 ---
+@app.post("/generateDataset")
+async def generate_dataset(req: GenerateRequest, response: Response, x_trace: Optional[str] = Header(default=None)):
+    """
+    데이터셋 생성을 위한 메인 API 엔드포인트 (작업 완료까지 대기)
+    X-Trace 헤더를 보내면 단계별 소요 시간을 Server-Timing 응답 헤더로 돌려줍니다.
+    """
+    logging.info(f"🚀 생성 모드({req.generation_mode}), 인덱스({req.index}) 요청 접수")
+    admit_jobs([req])
+    job = enqueue_job(await prepare_job(req))
+    await job.future
+    trace = job.meta["trace"]
+    if x_trace:
+        logging.info(f"🔍 트레이스 (job_id: {job.job_id}): {trace.to_dict()}")
+    if job.status != "done":
+        headers = {"Server-Timing": trace.server_timing(), "X-Trace-Id": job.job_id} if x_trace else None
+        if job.status == "cancelled":
+            raise HTTPException(status_code=409, detail="작업이 취소되었습니다.", headers=headers)
+        raise HTTPException(status_code=502, detail=f"ComfyUI 작업 실패: {job.error}", headers=headers)
+    if x_trace:
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Trace-Id"] = job.job_id
+    return job.result
+
+
+@app.post("/jobs")
+async def submit_jobs(body: SubmitJobsRequest):
+    """
+    여러 작업을 한 번에 대기열에 넣고 job_id 목록을 즉시 반환합니다.
+    대기열 한도를 넘게 되면 묶음 전체를 429로 거절합니다.
+    """
+    admit_jobs(body.jobs)
+    job_ids = []
+    failed = 0
+    for req in body.jobs:
+        try:
+            job = enqueue_job(await prepare_job(req))
+        except HTTPException as e:
+            job = job_manager.add_failed(Job(req=req, prompt="", workflow={}), str(e.detail))
+            failed += 1
+        job_ids.append(job.job_id)
+    logging.info(f"📥 작업 {len(job_ids)}개 접수 (준비 실패 {failed}개)")
+    return {"job_ids": job_ids, "queued": len(job_ids) - failed, "failed": failed}
+
+
+@app.post("/jobs/status")
+async def get_jobs_status(body: JobStatusRequest):
+    """여러 작업의 상태를 한 번에 조회합니다. (알 수 없는 job_id는 제외)"""
+    jobs = (job_manager.get(job_id) for job_id in body.job_ids)
+    return {"jobs": [job.to_status() for job in jobs if job is not None]}
+
+
+@app.post("/jobs/cancel")
+async def cancel_jobs(body: JobStatusRequest):
+    """
+    여러 작업을 취소합니다. 대기 중인 작업은 대기열에서 빼고, ComfyUI에 전송된 작업은
+    같은 워크플로우의 작업이 모두 취소되면 ComfyUI 큐에서 삭제하거나 실행을 중단합니다.
+    """
+    cancelled, finished, unknown = [], [], []
+    for job_id in body.job_ids:
+        job = job_manager.get(job_id)
+        if job is None:
+            unknown.append(job_id)
+        elif await job_manager.cancel(job):
+            cancelled.append(job_id)
+        else:
+            finished.append(job_id)
+    if cancelled:
+        logging.info(f"🛑 작업 {len(cancelled)}개 취소")
+    return {"cancelled": cancelled, "finished": finished, "unknown": unknown}
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """작업 하나를 취소합니다."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"작업을 찾을 수 없습니다: {job_id}")
+    if not await job_manager.cancel(job):
+        raise HTTPException(status_code=409, detail=f"이미 끝난 작업입니다 (상태: {job.status})")
+    return job.to_status()
+
+
+async def job_event(job: Job, captions: bool) -> str:
+    """끝난 작업 하나의 SSE 이벤트 (captions 이면 최종 캡션 내용 포함)"""
+    written = job.meta.get("caption_written")
+    if written is not None:
+        await written
+    status = job.to_status()
+    caption = (job.result or {}).get("caption") if job.status == "done" else None
+    if captions and caption:
+        try:
+            status["caption_text"] = await asyncio.to_thread(
+                resolve_output(COMFYUI_INPUT_DIR, caption).read_text, encoding="utf-8")
+        except (OSError, ValueError):
+            status["caption_text"] = None
+    return sse_event("job", status)
+
+
+@app.post("/jobs/stream")
+async def stream_jobs(body: JobStatusRequest, captions: bool = True):
+    """
+    작업이 끝나는 대로 결과를 server-sent events 로 보냅니다.
+    - job: 작업 상태 (result 에 실제 이미지/캡션 파일 경로, captions 이면 caption_text 포함).
+      파일은 /files/{경로} 로 내려받음
+    - end: 모든 작업이 끝나면 {"finished": 개수, "unknown": [모르는 job_id]}
+    """
+    jobs, unknown = [], []
+    for job_id in body.job_ids:
+        job = job_manager.get(job_id)
+        if job is None:
+            unknown.append(job_id)
+        else:
+            jobs.append(job)
+
+    async def events():
+        waiting = {}
+        for job in jobs:
+            if job.future is None or job.future.done():
+                yield await job_event(job, captions)
+            else:
+                waiting[job.future] = job
+        while waiting:
+            done, _ = await asyncio.wait(waiting, timeout=SSE_KEEPALIVE, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                yield ": keepalive\n\n"
+            for future in done:
+                yield await job_event(waiting.pop(future), captions)
+        yield sse_event("end", {"finished": len(jobs), "unknown": unknown})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/jobs/archive")
+async def download_jobs(body: JobStatusRequest, format: str = "tar"):
+    """
+    끝난 작업들의 이미지와 캡션을 tar / zip 하나로 내려받습니다. (작업별 상태는 jobs.jsonl)
+    output 폴더의 파일을 바로 읽어 흘려보내므로 사본을 만들지 않습니다.
+    아직 끝나지 않은 작업이 있으면 409.
+    """
+    if format not in ARCHIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"지원하지 않는 형식입니다: {format} (가능: {', '.join(ARCHIVE_FORMATS)})")
+    jobs = [job for job in map(job_manager.get, body.job_ids) if job is not None]
+    if not jobs:
+        raise HTTPException(status_code=404, detail="작업을 찾을 수 없습니다.")
+    running = [job.job_id for job in jobs if job.status in ("queued", "submitted")]
+    if running:
+        raise HTTPException(status_code=409, detail=f"아직 끝나지 않은 작업이 {len(running)}개 있습니다.")
+    # 최종 캡션 기록이 끝난 뒤 묶음
+    await asyncio.gather(*(job.meta["caption_written"] for job in jobs if "caption_written" in job.meta))
+    files = [name for job in jobs if job.status == "done" for name in result_files(job.result)]
+    manifest = "".join(json.dumps(job.to_status(), ensure_ascii=False) + "\n" for job in jobs).encode("utf-8")
+    logging.info(f"📦 결과 묶음 다운로드: 작업 {len(jobs)}개, 파일 {len(files)}개 ({format})")
+    filename = f"jobs_{time.strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(archive_chunks(COMFYUI_INPUT_DIR, files, format, {"jobs.jsonl": manifest}),
+                             media_type="application/x-tar" if format == "tar" else "application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.get("/files/{path:path}")
+async def get_output_file(path: str):
+    """output 폴더 기준 상대 경로의 결과 파일 (작업 결과의 images / caption 경로)"""
+    try:
+        file = resolve_output(COMFYUI_INPUT_DIR, path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not file.is_file():
+        raise HTTPException(status_code=404, detail=f"파일을 찾을 수 없습니다: {path}")
+    return FileResponse(file)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, x_trace: Optional[str] = Header(default=None)):
+    """작업 상태를 조회합니다. X-Trace 헤더를 보내면 단계별 소요 시간(ms)을 함께 반환합니다."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"작업을 찾을 수 없습니다: {job_id}")
+    status = job.to_status()
+    if x_trace and "trace" in job.meta:
+        status["trace"] = job.meta["trace"].to_dict()
+    return status
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """완료된 작업의 결과를 조회합니다."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"작업을 찾을 수 없습니다: {job_id}")
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"작업 실패: {job.error}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"작업이 아직 완료되지 않았습니다 (상태: {job.status})")
+    return job.result
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """단계별 지연 시간, 대기열/실행 중 작업 수, 서버 상태, 처리량을 Prometheus 텍스트 형식으로 반환합니다."""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/queue")
+async def get_queue():
+    """API 측 대기열 상태를 조회합니다."""
+    return {
+        "pending": job_manager.pending_count(),
+        "pending_by_priority": job_manager.pending_by_priority(),
+        "queue_depth": job_manager.queue_depth,
+        "backends": backend_pool.stats(),
+        "captions_pending": caption_writer.pending(),
+    }
+
+
+@app.post("/prompts/plan")
+async def plan_prompts(body: PromptPlanRequest):
+    """프롬프트셋 하나에 대해 N 개의 조합을 미리 계획하고 카테고리별 사용 히스토그램을 반환합니다."""
+    try:
+        prompt_set = load_prompt_set(body.prompt_set)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"프롬프트셋 파일을 찾을 수 없습니다: {body.prompt_set}")
+    strategy = body.strategy or PROMPT_PLAN_STRATEGY
+    try:
+        planner = PromptPlanner(prompt_set, plan_seed(body.prompt_set, body.run_id or ""), strategy,
+                                block_size=body.count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def build():
+        plan = planner.plan(body.count)
+        return planner.coverage(plan), planner.prompts(plan[:body.sample])
+
+    coverage, sample = await asyncio.to_thread(build)
+    return {**coverage, "sample": sample}
+
 
+@app.get("/cache")
+async def get_cache_stats():
+    """프롬프트셋 / 워크플로우 템플릿 캐시의 적중(hit)/미스(miss) 횟수를 조회합니다."""
+    bundle = load_prompt_bundle()
     return {
-        "status": "ok",
-        "prompt": prompt,
-        "image": output_image_name
+        "prompt_sets": prompt_set_cache.stats(),
+        "prompt_bundle": bundle.stats() if bundle is not None else None,
+        "prompt_planners": planner_cache.stats(),
+        "workflow_template": workflow_template_cache.stats(),
+        "image_catalog_rescans": image_catalog.rescans,
+        "results": result_cache.stats(),
+        "references": reference_cache.stats(),
     }
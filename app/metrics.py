@@ -0,0 +1,193 @@
+import bisect
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 단계별 지연 시간 히스토그램 구간 (초): 밀리초 단위 준비 단계부터 수 분 걸리는 샘플링까지
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# images/min 을 계산할 최근 구간 (초)
+THROUGHPUT_WINDOW = 300
+
+Labels = Tuple[str, ...]
+_LE_INF = 'le="+Inf"'
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    """라벨별 관측값 분포. 관측 한 번은 bisect 한 번과 덧셈 몇 번"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, list] = {}  # 라벨 -> [구간별 개수, 합계, 개수]
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, _LE_INF)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge:
+    """
+    조회 시점에 collect() 로 값을 계산하는 지표 (대기열 길이, 연결 상태 등).
+    다른 객체가 이미 세고 있는 누적값(재연결 횟수 등)은 metric_type="counter" 로 내보냅니다.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Labels, float]]] = None, metric_type: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.metric_type = metric_type
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.metric_type}"
+        for labels, value in sorted((self.collect() if self.collect else {}).items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Registry:
+    """Prometheus 텍스트 형식(/metrics)으로 내보낼 지표 목록"""
+
+    def __init__(self):
+        self._metrics: List = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self._add(Histogram(*args, **kwargs))
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self._add(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self._add(Gauge(*args, **kwargs))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+class Throughput:
+    """(캐릭터, 모드)별 최근 THROUGHPUT_WINDOW 초 동안의 분당 완료 이미지 수"""
+
+    def __init__(self, window: float = THROUGHPUT_WINDOW):
+        self.window = window
+        self._started = time.monotonic()
+        self._events: Dict[Labels, Deque[float]] = {}
+
+    def record(self, *labels: str):
+        self._events.setdefault(labels, deque()).append(time.monotonic())
+
+    def per_minute(self) -> Dict[Labels, float]:
+        now = time.monotonic()
+        span = min(self.window, now - self._started) or 1.0
+        rates = {}
+        for labels, events in self._events.items():
+            while events and now - events[0] > self.window:
+                events.popleft()
+            rates[labels] = len(events) * 60 / span
+        return rates
+
+
+class Trace:
+    """
+    작업 하나의 단계별 소요 시간 (초).
+    단계를 기록할 때마다 stage_seconds 히스토그램에도 함께 관측합니다.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float, observe: bool = True):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if observe:
+            stage_seconds.observe(seconds, name)
+
+    def merge(self, other: "Trace"):
+        """배치로 함께 실행된 단계를 작업별 트레이스에 합칩니다. (히스토그램은 이미 관측됨)"""
+        for name, seconds in other.stages.items():
+            self.add(name, seconds, observe=False)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Server-Timing 응답 헤더 값 (밀리초)"""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.to_dict().items())
+
+
+# --- 프로세스 전체가 공유하는 지표 ---
+registry = Registry()
+stage_seconds = registry.histogram(
+    "comfy_api_stage_seconds", "Time spent in each job stage", ["stage"])
+job_seconds = registry.histogram(
+    "comfy_api_job_seconds", "Job wall time from submission to completion", ["mode", "status"])
+jobs_total = registry.counter(
+    "comfy_api_jobs_total", "Finished jobs", ["character", "mode", "status"])
+throughput = Throughput()
+registry.gauge(
+    "comfy_api_images_per_minute", f"Images completed per minute over the last {THROUGHPUT_WINDOW}s",
+    ["character", "mode"], collect=throughput.per_minute)
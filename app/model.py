@@ -1,5 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.prompt_util import SEED_MASK
 
 class GenerateRequest(BaseModel):
     generation_mode: str = "shot_type"  # Default to 'shot_type' for backward compatibility
@@ -8,3 +10,23 @@ class GenerateRequest(BaseModel):
     index: int
     expression: Optional[str] = None
     angle: Optional[str] = None
+    input_pick_strategy: Optional[str] = None  # 'random', 'round_robin', 'least_used' (None이면 서버 기본값)
+    prompt_strategy: Optional[str] = None  # 'random', 'uniform', 'stratified', 'latin_hypercube' (None이면 서버 기본값)
+    run_id: Optional[str] = None  # 시드 계산에 포함되는 실행 ID (같은 run_id + index 면 같은 결과)
+    # 지정하면 계산된 시드 대신 사용 (프롬프트도 계획 위치 대신 이 시드로 선택). KSampler 시드 범위(0 ~ SEED_MASK)만 허용
+    seed: Optional[int] = Field(default=None, ge=0, le=SEED_MASK)
+    priority: Optional[str] = None  # 'high', 'normal', 'low' (None이면 'normal')
+    tenant: Optional[str] = None  # 공정 분배 단위 (None이면 캐릭터 이름)
+
+class SubmitJobsRequest(BaseModel):
+    jobs: List[GenerateRequest]
+
+class JobStatusRequest(BaseModel):
+    job_ids: List[str]
+
+class PromptPlanRequest(BaseModel):
+    prompt_set: str  # data/ 기준 프롬프트셋 경로 (예: "ellie/smile/front_PromptSet.json")
+    count: int = Field(gt=0, le=10_000_000)
+    strategy: Optional[str] = None
+    run_id: Optional[str] = None
+    sample: int = Field(default=10, ge=0, le=1000)  # 응답에 포함할 앞쪽 프롬프트 수
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 번들 파일 형식 버전 (구조가 바뀌면 올려서 이전 번들을 전부 다시 빌드)
+BUNDLE_FORMAT = 1
+# 표정/앵글 프롬프트셋의 기반이 되는 샷 타입 프롬프트셋
+EXPRESSION_BASE = "bustShot/PromptSet.json"
+# 기반 프롬프트셋에서 표정/앵글 정의로 바꿔 넣는 카테고리
+EXPRESSION_CATEGORY = "expression"
+ANGLE_CATEGORY = "camera_angle"
+
+
+class PromptBundle:
+    """
+    data/ 아래 모든 프롬프트셋을 하나로 묶은 번들.
+
+    문장과 카테고리 이름은 strings 배열에 한 번만 저장하고, 프롬프트셋은 그 인덱스로만 표현합니다.
+    시작 시 JSON 파일 하나만 읽으면 되고, 프롬프트셋은 처음 조회할 때 한 번만 풀어서 보관하므로
+    이후 조회는 딕셔너리 조회 한 번입니다. (반환값은 공유되므로 수정하지 마세요)
+    """
+
+    def __init__(self, data: dict):
+        if data.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"지원하지 않는 프롬프트 번들 형식입니다: {data.get('format')} (필요: {BUNDLE_FORMAT})")
+        self.build = data["build"]
+        self.strings: List[str] = data["strings"]
+        self.sets: Dict[str, dict] = data["sets"]
+        self._decoded: Dict[str, List[dict]] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "PromptBundle":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def get(self, name: str) -> Optional[List[dict]]:
+        """data/ 기준 프롬프트셋 경로 (예: "ellie/smile/front_PromptSet.json")의 프롬프트셋. 없으면 None"""
+        prompt_set = self._decoded.get(name)
+        if prompt_set is None:
+            entry = self.sets.get(name)
+            if entry is None:
+                return None
+            strings = self.strings
+            prompt_set = self._decoded[name] = [
+                {"category": strings[category], "prompts": [strings[i] for i in prompts]}
+                for category, prompts in entry["categories"]
+            ]
+        return prompt_set
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sets
+
+    def base_of(self, name: str) -> str:
+        """파일 없이 만든(derived) 프롬프트셋의 기반 프롬프트셋 경로"""
+        return self.sets[name].get("base") or f"{name.split('/', 1)[0]}/{EXPRESSION_BASE}"
+
+    def is_current(self, name: str, data_dir: Path) -> bool:
+        """
+        번들 항목이 data_dir 의 원본과 같은지 확인합니다. (컴파일 때 기록한 (mtime, size)와 비교)
+        번들을 다시 컴파일하지 않고 data/ 의 파일을 고친 경우 False 가 되어 원본을 다시 읽어야 합니다.
+        derived 항목은 같은 경로에 파일이 새로 생겼거나 기반 프롬프트셋이 바뀌면 False.
+        """
+        entry = self.sets[name]
+        if entry["source"] == "derived":
+            if (data_dir / name).exists():
+                return False
+            name = self.base_of(name)
+            entry = self.sets.get(name, {})
+        try:
+            stat = (data_dir / name).stat()
+        except FileNotFoundError:
+            return False
+        return entry.get("stat") == [stat.st_mtime_ns, stat.st_size]
+
+    def rederive(self, name: str, base: List[dict]) -> List[dict]:
+        """derived 항목을 바뀐 기반 프롬프트셋으로 다시 만듭니다. (표정/앵글 문장은 번들의 것을 그대로 사용)"""
+        prompts = {category["category"]: category["prompts"] for category in self.get(name)}
+        return derive_expression_set(base, prompts.get(EXPRESSION_CATEGORY, []), prompts.get(ANGLE_CATEGORY, []))
+
+    def names(self) -> List[str]:
+        return sorted(self.sets)
+
+    def stats(self) -> dict:
+        return {
+            "build": self.build,
+            "sets": len(self.sets),
+            "strings": len(self.strings),
+            "decoded": len(self._decoded),
+        }
+
+
+def _file_hash(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()[:32]
+
+
+def _derived_hash(base_hash: str, expression: List[str], angle: List[str]) -> str:
+    key = json.dumps([BUNDLE_FORMAT, base_hash, expression, angle], ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def derive_expression_set(base: List[dict], expression: List[str], angle: List[str]) -> List[dict]:
+    """기반 프롬프트셋의 expression / camera_angle 카테고리를 표정/앵글 문장으로 바꿉니다."""
+    prompt_set = []
+    for category in base:
+        if category["category"] == EXPRESSION_CATEGORY:
+            prompt_set.append({"category": EXPRESSION_CATEGORY, "prompts": list(expression)})
+        elif category["category"] == ANGLE_CATEGORY:
+            prompt_set.append({"category": ANGLE_CATEGORY, "prompts": list(angle)})
+        else:
+            prompt_set.append(category)
+    return prompt_set
+
+
+def _load_previous(bundle_path: Path) -> Tuple[Optional[PromptBundle], Dict[str, dict]]:
+    try:
+        previous = PromptBundle.load(bundle_path)
+    except (FileNotFoundError, ValueError, KeyError):
+        return None, {}
+    return previous, previous.sets
+
+
+def compile_bundle(data_dir: Path, bundle_path: Path, expressions: Dict[str, List[str]],
+                   angles: Dict[str, List[str]], force: bool = False) -> dict:
+    """
+    data_dir 아래 모든 캐릭터의 프롬프트셋을 번들 하나로 컴파일합니다.
+
+    - data_dir/<캐릭터>/**/*PromptSet.json 은 그대로 포함 (직접 다듬은 표정 프롬프트셋 포함)
+    - 파일이 없는 (캐릭터, 표정, 앵글) 조합은 <캐릭터>/bustShot/PromptSet.json 에서 만들어 채움
+    - 입력(파일 내용 해시, 표정/앵글 정의)이 이전 번들과 같은 프롬프트셋은 다시 파싱하지 않음.
+      파일의 (mtime, size)가 그대로면 해시도 다시 계산하지 않음
+    - 결과가 이전 번들과 같으면 파일을 다시 쓰지 않음
+    """
+    data_dir, bundle_path = Path(data_dir), Path(bundle_path)
+    previous, previous_sets = (None, {}) if force else _load_previous(bundle_path)
+
+    # 1. 입력 목록 (data_dir 기준 경로 -> 입력 정보)
+    sources: Dict[str, dict] = {}
+    characters = sorted(entry.name for entry in os.scandir(data_dir) if entry.is_dir())
+    for character in characters:
+        for path in sorted((data_dir / character).rglob("*PromptSet.json")):
+            stat = path.stat()
+            name = path.relative_to(data_dir).as_posix()
+            old = previous_sets.get(name)
+            if old and old.get("stat") == [stat.st_mtime_ns, stat.st_size]:
+                digest = old["hash"]
+            else:
+                digest = _file_hash(path)
+            sources[name] = {"source": "file", "path": path, "stat": [stat.st_mtime_ns, stat.st_size], "hash": digest}
+
+    for character in characters:
+        base = sources.get(f"{character}/{EXPRESSION_BASE}")
+        if base is None:
+            continue
+        for expression, expression_prompts in expressions.items():
+            for angle, angle_prompts in angles.items():
+                name = f"{character}/{expression}/{angle}_PromptSet.json"
+                if name not in sources:
+                    sources[name] = {"source": "derived", "base": f"{character}/{EXPRESSION_BASE}",
+                                     "expression": expression_prompts, "angle": angle_prompts,
+                                     "hash": _derived_hash(base["hash"], expression_prompts, angle_prompts)}
+
+    # 2. 바뀐 프롬프트셋만 다시 파싱
+    prompt_sets: Dict[str, List[dict]] = {}
+    rebuilt, reused = [], 0
+    for name, source in sources.items():
+        old = previous_sets.get(name)
+        if old and old["hash"] == source["hash"]:
+            prompt_sets[name] = previous.get(name)
+            reused += 1
+            continue
+        if source["source"] == "file":
+            with open(source["path"], "r", encoding="utf-8") as f:
+                prompt_sets[name] = json.load(f)
+        else:
+            base = prompt_sets.get(source["base"]) or _read_json(data_dir / source["base"])
+            prompt_sets[name] = derive_expression_set(base, source["expression"], source["angle"])
+        rebuilt.append(name)
+    removed = sorted(set(previous_sets) - set(sources))
+
+    build = hashlib.sha256(json.dumps(
+        [BUNDLE_FORMAT, sorted((name, source["hash"]) for name, source in sources.items())]
+    ).encode("utf-8")).hexdigest()[:16]
+    result = {"build": build, "sets": len(sources), "rebuilt": rebuilt, "reused": reused, "removed": removed,
+              "derived": sum(1 for source in sources.values() if source["source"] == "derived"),
+              "written": False}
+    # 내용은 같고 수정 시각만 바뀐 파일이 있으면 다음 빌드에서 해시를 다시 계산하지 않도록 새로 씀
+    stale_stats = any(source.get("stat") != previous_sets.get(name, {}).get("stat")
+                      for name, source in sources.items() if source["source"] == "file")
+    if previous is not None and previous.build == build and not rebuilt and not removed and not stale_stats:
+        return result
+
+    # 3. 문장/카테고리 이름을 한 번씩만 저장 (strings 인덱스)
+    strings: List[str] = []
+    index: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        i = index.get(value)
+        if i is None:
+            i = index[value] = len(strings)
+            strings.append(value)
+        return i
+
+    sets = {}
+    for name in sorted(sources):
+        source = sources[name]
+        entry = {"source": source["source"], "hash": source["hash"],
+                 "categories": [[intern(category["category"]), [intern(p) for p in category["prompts"]]]
+                                for category in prompt_sets[name]]}
+        if "stat" in source:
+            entry["stat"] = source["stat"]
+        if "base" in source:
+            entry["base"] = source["base"]
+        sets[name] = entry
+
+    bundle_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = bundle_path.with_name(f".{bundle_path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"format": BUNDLE_FORMAT, "build": build, "strings": strings, "sets": sets},
+                  f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, bundle_path)
+    result["written"] = True
+    result["strings"] = len(strings)
+    result["bytes"] = bundle_path.stat().st_size
+    return result
+
+
+def _read_json(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
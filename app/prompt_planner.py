@@ -0,0 +1,216 @@
+import hashlib
+import math
+import random
+from collections import OrderedDict
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# 지원하는 프롬프트 조합 방식
+PLAN_STRATEGIES = ("random", "uniform", "stratified", "latin_hypercube")
+
+# int64 로 (a * r + b) 를 계산해도 넘치지 않는 조합 공간 크기 상한
+_INT64_SAFE_SPACE = 1 << 31
+# latin_hypercube 에서 계획 크기를 모를 때(작업별 조회) 사용하는 블록 크기
+LHS_BLOCK_SIZE = 1024
+# 재사용할 PromptPlanner 최대 개수 ((프롬프트셋, run_id, 방식) 조합 수)
+PLANNER_CACHE_SIZE = 4096
+
+_MASK64 = np.uint64((1 << 64) - 1)
+
+
+def plan_seed(*parts) -> int:
+    """계획 하나를 식별하는 값들(프롬프트셋 파일, run_id 등)로부터 시드를 만듭니다."""
+    key = "|".join(str(part) for part in parts)
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big")
+
+
+def _affine(rng: random.Random, size: int):
+    """
+    [0, size) 의 순열 r -> (a * r + b) % size 를 위한 (a, b, step).
+    a 가 size 와 서로소이므로 size 개의 연속 위치는 모든 값을 정확히 한 번씩 가집니다.
+    step 은 블록(한 바퀴)마다 더하는 이동량입니다.
+    """
+    if size == 1:
+        return 1, 0, 0
+    a = rng.randrange(1, size)
+    while math.gcd(a, size) != 1:
+        a = a % (size - 1) + 1
+    return a, rng.randrange(size), rng.randrange(1, size)
+
+
+class PromptPlanner:
+    """
+    프롬프트셋의 카테고리별 문장 조합(카테시안 곱)에서 N 개의 조합을 미리 계획합니다.
+
+    조합 공간을 나열하지 않고 위치(0, 1, 2, ...) -> 조합 인덱스를 산술식으로 바로 계산하므로
+    계획 크기와 무관하게 메모리를 쓰지 않고, NumPy 배열로 한 번에 수백만 개를 만들 수 있습니다.
+    같은 (프롬프트셋, 시드, 방식)이면 같은 위치는 항상 같은 조합입니다.
+
+    - random: 위치마다 독립적으로 선택 (기존 generate_prompt 와 같은 분포)
+    - uniform: 조합 공간 전체의 순열. 공간 크기만큼은 중복 없음
+    - stratified: 카테고리마다 문장 수 단위 블록 안에서 모든 문장을 한 번씩 사용
+    - latin_hypercube: 블록 크기 B 안에서 카테고리마다 B 개 구간을 한 번씩 사용
+    """
+
+    def __init__(self, prompt_set: List[dict], seed: int, strategy: str = "uniform", block_size: int = LHS_BLOCK_SIZE):
+        if strategy not in PLAN_STRATEGIES:
+            raise ValueError(f"지원하지 않는 프롬프트 조합 방식입니다: {strategy} (가능: {', '.join(PLAN_STRATEGIES)})")
+        self.categories = [category.get("category", str(i)) for i, category in enumerate(prompt_set)]
+        self.sentences = [[_sentence(s) for s in category["prompts"]] for category in prompt_set]
+        self.radices = [len(sentences) for sentences in self.sentences]
+        if not self.radices or min(self.radices) == 0:
+            raise ValueError("프롬프트셋에 문장이 없는 카테고리가 있습니다.")
+        self.space = math.prod(self.radices)
+        self.seed = seed
+        self.strategy = strategy
+        self.block_size = max(1, block_size)
+
+        rng = random.Random(seed)
+        self._space_perm = _affine(rng, self.space) if self.space < _INT64_SAFE_SPACE else None
+        self._coprimes = [np.array([a for a in range(1, n + 1) if math.gcd(a, n) == 1], dtype=np.int64)
+                          for n in self.radices]
+        self._block_perms = [_affine(rng, self.block_size) for _ in self.radices]
+        self._salts = [np.uint64(rng.getrandbits(64)) for _ in self.radices]
+
+    def plan(self, count: int, start: int = 0) -> np.ndarray:
+        """위치 start ~ start+count-1 의 조합을 (count, 카테고리 수) 배열(문장 인덱스)로 반환합니다."""
+        positions = np.arange(start, start + count, dtype=np.int64)
+        columns = getattr(self, f"_plan_{self.strategy}")(positions)
+        return np.stack(columns, axis=1) if columns else np.empty((count, 0), dtype=np.int64)
+
+    def choices(self, position: int) -> List[int]:
+        return self.plan(1, position)[0].tolist()
+
+    def prompt(self, position: int) -> str:
+        """위치 하나의 프롬프트 문자열"""
+        return " ".join(sentences[i] for sentences, i in zip(self.sentences, self.choices(position)))
+
+    def seeded_prompt(self, seed: int) -> str:
+        """
+        작업 시드로 고른 프롬프트. 계획 위치와 무관하게 시드마다 카테고리별로 독립적으로 고릅니다.
+        (random 방식과 같은 분포, 시드가 같으면 같은 프롬프트)
+        """
+        # 범위 밖(음수, 2^63 이상) 시드도 int64 로 만들다 넘치지 않도록 uint64 로 접어서 사용
+        columns = self._plan_random(np.array([seed & ((1 << 64) - 1)], dtype=np.uint64))
+        return " ".join(sentences[int(column[0])] for sentences, column in zip(self.sentences, columns))
+
+    def prompts(self, plan: np.ndarray) -> List[str]:
+        return [" ".join(sentences[i] for sentences, i in zip(self.sentences, row)) for row in plan.tolist()]
+
+    def coverage(self, plan: np.ndarray) -> dict:
+        """카테고리별 문장 사용 횟수 히스토그램과 중복 조합 수"""
+        categories = []
+        for c, (name, n) in enumerate(zip(self.categories, self.radices)):
+            counts = np.bincount(plan[:, c], minlength=n)
+            categories.append({
+                "category": name,
+                "options": n,
+                "min": int(counts.min()),
+                "max": int(counts.max()),
+                "counts": counts.tolist(),
+            })
+        if self.space < _INT64_SAFE_SPACE:
+            codes = np.zeros(len(plan), dtype=np.int64)
+            for c, n in enumerate(self.radices):
+                codes = codes * n + plan[:, c]
+            unique = int(np.unique(codes).size)
+        else:
+            unique = int(np.unique(plan, axis=0).shape[0])
+        return {
+            "strategy": self.strategy,
+            "plans": int(len(plan)),
+            "space": self.space,
+            "unique": unique,
+            "duplicates": int(len(plan)) - unique,
+            "categories": categories,
+        }
+
+    # --- 방식별 계산 (positions: int64 배열) ---
+    def _plan_random(self, positions):
+        keys = positions.astype(np.uint64) ^ np.uint64(self.seed & ((1 << 64) - 1))
+        return [(_splitmix64(keys ^ salt) % np.uint64(n)).astype(np.int64)
+                for salt, n in zip(self._salts, self.radices)]
+
+    def _plan_uniform(self, positions):
+        if self._space_perm is None:
+            # 공간이 너무 크면 int64 순열을 만들 수 없음. 이 경우 중복 확률은 N^2 / 공간 수준으로 무시할 만함
+            return self._plan_random(positions)
+        a, b, step = self._space_perm
+        cycle, r = np.divmod(positions, self.space)
+        index = (a * r + b + cycle * step) % self.space
+        columns = []
+        for n in reversed(self.radices):
+            index, choice = np.divmod(index, n)
+            columns.append(choice)
+        return columns[::-1]
+
+    def _plan_stratified(self, positions):
+        # 블록마다 순열(a, b)을 새로 골라 카테고리 사이의 짝이 블록마다 달라지게 함
+        columns = []
+        for salt, coprimes, n in zip(self._salts, self._coprimes, self.radices):
+            block, r = np.divmod(positions, n)
+            mixed = _splitmix64(block.astype(np.uint64) ^ salt)
+            a = coprimes[(mixed >> np.uint64(32)) % np.uint64(len(coprimes))]
+            b = (mixed % np.uint64(n)).astype(np.int64)
+            columns.append((a * r + b) % n)
+        return columns
+
+    def _plan_latin_hypercube(self, positions):
+        size = self.block_size
+        block, r = np.divmod(positions, size)
+        columns = []
+        for (a, b, step), n in zip(self._block_perms, self.radices):
+            stratum = (a * r + b + block * step) % size
+            columns.append(stratum * n // size)
+        return columns
+
+
+class PlannerCache:
+    """
+    (프롬프트셋 파일, run_id, 방식)별 PromptPlanner 를 재사용합니다.
+    같은 실행의 작업들은 계획을 공유하므로 요청마다 문장 목록과 순열을 다시 만들 필요가 없습니다.
+    프롬프트셋 객체가 바뀌면(파일 수정, 번들 재컴파일) 새로 만듭니다.
+    """
+
+    def __init__(self, max_entries: int = PLANNER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, filename: str, prompt_set: List[dict], run_id: str, strategy: str) -> PromptPlanner:
+        key = (filename, run_id, strategy)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is prompt_set:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+        self.misses += 1
+        planner = PromptPlanner(prompt_set, plan_seed(filename, run_id), strategy)
+        self._entries[key] = (prompt_set, planner)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return planner
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _sentence(sentence: str) -> str:
+    return sentence if sentence.endswith(".") else sentence + "."
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        x = (x + np.uint64(0x9E3779B97F4A7C15)) & _MASK64
+        x = ((x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)) & _MASK64
+        x = ((x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)) & _MASK64
+        return x ^ (x >> np.uint64(31))
+
+
+def plan_prompts(prompt_set: List[dict], count: int, seed: int, strategy: str = "uniform") -> Sequence[str]:
+    """프롬프트 N 개를 한 번에 계획합니다. latin_hypercube 는 N 전체를 하나의 블록으로 균형을 맞춥니다."""
+    planner = PromptPlanner(prompt_set, seed, strategy, block_size=count)
+    return planner.prompts(planner.plan(count))
@@ -1,21 +1,70 @@
-import json
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import hashlib
 import random
 
-PROMPT_SET_PATH = Path("data/PromptSet.json")
+from app.file_cache import MtimeCache
+from app.prompt_bundle import PromptBundle
+
+PROMPT_DATA_DIR = Path("data")
+PROMPT_SET_PATH = PROMPT_DATA_DIR / "PromptSet.json"
+# create_expression_prompts.py 로 컴파일한 프롬프트 번들 (없으면 data/ 의 개별 파일을 읽음)
+PROMPT_BUNDLE_PATH = Path("cache/prompt_bundle.json")
+
+# KSampler 시드 범위 (53비트: JSON / 웹 UI에서 정밀도 손실 없이 다룰 수 있는 정수)
+SEED_MASK = (1 << 53) - 1
+
+# 파싱된 프롬프트셋 캐시 (파일 수정 시 자동으로 다시 읽음)
+prompt_set_cache = MtimeCache()
+# 프롬프트 번들 캐시 (번들을 다시 컴파일하면 자동으로 다시 읽음)
+prompt_bundle_cache = MtimeCache(PromptBundle.load)
+# 번들 컴파일 뒤 기반 프롬프트셋이 바뀐 derived 항목 (경로 -> (번들, 기반 프롬프트셋, 다시 만든 프롬프트셋))
+_rederived: Dict[str, Tuple[PromptBundle, List[dict], List[dict]]] = {}
+
+def load_prompt_bundle() -> Optional[PromptBundle]:
+    """컴파일된 프롬프트 번들을 반환합니다. 번들이 없으면 None."""
+    try:
+        return prompt_bundle_cache.get(PROMPT_BUNDLE_PATH)
+    except FileNotFoundError:
+        return None
 
 def load_prompt_set(filename: str = "PromptSet.json"):
-    prompt_set_path = Path("data") / filename
-    with open(prompt_set_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    """
+    프롬프트셋을 불러옵니다. 반환값은 캐시와 공유되므로 수정하지 마세요.
+    번들에 있고 원본이 컴파일 이후 바뀌지 않았으면 번들에서, 아니면 data/ 의 파일에서 읽습니다.
+    (파일 없이 만든 표정/앵글 프롬프트셋은 바뀐 기반 프롬프트셋으로 다시 만듦)
+    """
+    bundle = load_prompt_bundle()
+    if bundle is not None and filename in bundle:
+        if bundle.is_current(filename, PROMPT_DATA_DIR):
+            return bundle.get(filename)
+        if bundle.sets[filename]["source"] == "derived" and not (PROMPT_DATA_DIR / filename).exists():
+            base = prompt_set_cache.get(PROMPT_DATA_DIR / bundle.base_of(filename))
+            cached = _rederived.get(filename)
+            if cached is None or cached[0] is not bundle or cached[1] is not base:
+                cached = _rederived[filename] = (bundle, base, bundle.rederive(filename, base))
+            return cached[2]
+    return prompt_set_cache.get(PROMPT_DATA_DIR / filename)
 
-def generate_prompt(prompt_set):
+def derive_seed(character_name: str, generation_mode: str, index: int, run_id: str = "") -> int:
+    """
+    (캐릭터, 생성 모드, 인덱스, 실행 ID)로부터 항상 같은 시드를 만듭니다.
+    같은 작업을 다시 실행하면 같은 프롬프트와 같은 KSampler 시드가 나옵니다.
+    """
+    key = f"{character_name}|{generation_mode}|{index}|{run_id}"
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & SEED_MASK
+
+def generate_prompt(prompt_set, rng=None):
+    """
+    카테고리마다 문장을 하나씩 골라 프롬프트를 만듭니다.
+    rng(random.Random)를 넘기면 그 시드에 따라 항상 같은 결과가 나옵니다.
+    """
+    rng = rng or random
     lines = []
     for category in prompt_set:
-        sentence = random.choice(category["prompts"])
+        sentence = rng.choice(category["prompts"])
         if not sentence.endswith("."):
             sentence += "."
         lines.append(sentence)
     return " ".join(lines)
-
-
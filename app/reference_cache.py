@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.file_cache import MtimeCache
+
+# FluxKontextImageScale 이 고르는 해상도 목록 (ComfyUI comfy_extras/nodes_flux.py 와 동일)
+PREFERRED_KONTEXT_RESOLUTIONS = [
+    (672, 1568), (688, 1504), (720, 1456), (752, 1392), (800, 1328), (832, 1248),
+    (880, 1184), (944, 1104), (1024, 1024), (1104, 944), (1184, 880), (1248, 832),
+    (1328, 800), (1392, 752), (1456, 720), (1504, 688), (1568, 672),
+]
+# 사전 축소본을 저장할 폴더 (ComfyUI output 폴더 기준, LoadImageOutput 으로 읽음)
+ASSET_SUBDIR = "kontext_cache"
+# 축소 방식이 바뀌면 올려서 이전 축소본을 무효화
+ASSET_VERSION = 1
+
+# PPM(P6) 헤더: 매직, 너비, 높이, 최댓값 뒤 공백 하나 다음부터 픽셀
+_PPM_HEADER = re.compile(rb"P6\s+(\d+)\s+(\d+)\s+255\s")
+
+
+def kontext_size(width: int, height: int) -> Tuple[int, int]:
+    """FluxKontextImageScale 과 같은 방식으로 종횡비가 가장 가까운 (너비, 높이)를 고릅니다."""
+    aspect_ratio = width / height
+    _, w, h = min((abs(aspect_ratio - w / h), w, h) for w, h in PREFERRED_KONTEXT_RESOLUTIONS)
+    return w, h
+
+
+def prescale(image: Image.Image) -> Image.Image:
+    """
+    LoadImage -> FluxKontextImageScale 과 같은 결과가 되도록
+    EXIF 회전 적용, RGB 변환, 가운데 자르기, Lanczos 축소를 합니다.
+    """
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    old_width, old_height = image.size
+    width, height = kontext_size(old_width, old_height)
+    old_aspect, new_aspect = old_width / old_height, width / height
+    x = y = 0
+    if old_aspect > new_aspect:
+        x = round((old_width - old_width * (new_aspect / old_aspect)) / 2)
+    elif old_aspect < new_aspect:
+        y = round((old_height - old_height * (old_aspect / new_aspect)) / 2)
+    if x or y:
+        image = image.crop((x, y, old_width - x, old_height - y))
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.LANCZOS)
+    return image
+
+
+def _content_hash(path: Path) -> str:
+    digest = hashlib.sha256(f"kontext-v{ASSET_VERSION}:".encode("ascii"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+class ReferenceCache:
+    """
+    참조 이미지를 Kontext 해상도로 미리 축소해 두는 캐시.
+
+    원본 이미지 내용의 해시를 키로 RGB 원시 픽셀 파일(PPM, 헤더 + 픽셀 배열)을
+    root/kontext_cache/ 에 한 번만 만들어 두고, 워크플로우는 이 파일을 직접 읽도록 바꿉니다.
+    ComfyUI는 매 작업마다 큰 PNG를 디코딩하고 FluxKontextImageScale 을 실행하는 대신
+    이미 축소된 픽셀을 그대로 읽기만 하면 됩니다. (API 측에서는 np.memmap 으로 바로 열 수 있음)
+
+    원본의 해시는 (mtime, size)가 바뀔 때만 다시 계산합니다.
+    전체 크기가 max_bytes 를 넘으면 가장 오래 쓰지 않은 축소본부터 지우되,
+    대기열에 있는 작업이 쓰는(pin 된) 축소본은 지우지 않습니다.
+
+    prepare() 는 이벤트 루프를 막지 않도록 asyncio.to_thread 로 부를 수 있습니다.
+    장부(LRU, pin, 크기)는 잠금으로 보호하고 해시 계산과 축소는 잠금 밖에서 합니다.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._digests = MtimeCache(_content_hash)
+        self._assets: "OrderedDict[str, int]" = OrderedDict()  # digest -> 파일 크기 (LRU 순서)
+        self._pins: Dict[str, int] = {}
+        self._scanned = False
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def directory(self) -> Path:
+        return self.root / ASSET_SUBDIR
+
+    def asset_name(self, digest: str) -> str:
+        """root 기준 축소본 경로 (LoadImageOutput 입력값)"""
+        return f"{ASSET_SUBDIR}/{digest}.ppm"
+
+    def prepare(self, source_name: str) -> str:
+        """
+        root 기준 원본 경로의 축소본을 만들고(없을 때만) 그 이름을 반환합니다.
+        반환된 축소본은 release() 할 때까지 지우지 않습니다. 원본이 없으면 FileNotFoundError.
+        """
+        with self._lock:
+            self._scan()
+        digest = self._digests.get(self.root / source_name)
+        with self._lock:
+            if digest in self._assets and not (self.directory / f"{digest}.ppm").exists():
+                # 외부에서 지워진 축소본은 다시 만듦
+                self.bytes -= self._assets.pop(digest)
+            hit = digest in self._assets
+            if hit:
+                self.hits += 1
+                self._assets.move_to_end(digest)
+                self._pins[digest] = self._pins.get(digest, 0) + 1
+        if not hit:
+            size = self._build(self.root / source_name, digest)
+            with self._lock:
+                self.misses += 1
+                # 다른 스레드가 같은 축소본을 먼저 등록했으면 크기를 두 번 더하지 않음
+                self.bytes += size - self._assets.get(digest, 0)
+                self._assets[digest] = size
+                self._pins[digest] = self._pins.get(digest, 0) + 1
+        with self._lock:
+            self._evict()
+        return self.asset_name(digest)
+
+    def release(self, asset_name: str):
+        digest = Path(asset_name).stem
+        with self._lock:
+            count = self._pins.get(digest, 0) - 1
+            if count > 0:
+                self._pins[digest] = count
+            else:
+                self._pins.pop(digest, None)
+            self._evict()
+
+    def array(self, asset_name: str) -> np.ndarray:
+        """축소본 픽셀을 복사 없이 (높이, 너비, 3) uint8 배열로 엽니다."""
+        path = self.root / asset_name
+        with open(path, "rb") as f:
+            header = _PPM_HEADER.match(f.read(64))
+        width, height = int(header.group(1)), int(header.group(2))
+        return np.memmap(path, dtype=np.uint8, mode="r", offset=header.end(), shape=(height, width, 3))
+
+    def stats(self) -> dict:
+        return {
+            "assets": len(self._assets),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "pinned": len(self._pins),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _build(self, source: Path, digest: str) -> int:
+        with Image.open(source) as image:
+            scaled = prescale(image)
+        target = self.directory / f"{digest}.ppm"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # 같은 축소본을 동시에 만드는 스레드끼리 임시 파일이 겹치지 않도록 스레드별 이름 사용
+        tmp = target.with_name(f".{target.name}.{threading.get_ident()}.tmp")
+        scaled.save(tmp, format="PPM")
+        os.replace(tmp, target)
+        logging.info(f"🖼️ 참조 이미지 사전 축소: {source.name} {scaled.size[0]}x{scaled.size[1]} -> {target.name}")
+        return target.stat().st_size
+
+    def _scan(self):
+        """재시작 후 이전 실행에서 만든 축소본을 수정 시각 순서로 다시 등록합니다."""
+        if self._scanned:
+            return
+        self._scanned = True
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.name.endswith(".ppm") and not entry.name.startswith(".")]
+        except FileNotFoundError:
+            return
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            size = entry.stat().st_size
+            self._assets[entry.name[:-len(".ppm")]] = size
+            self.bytes += size
+
+    def _evict(self):
+        if self.bytes <= self.max_bytes:
+            return
+        for digest in list(self._assets):
+            if self.bytes <= self.max_bytes:
+                break
+            if digest in self._pins:
+                continue
+            size = self._assets.pop(digest)
+            self.bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.directory / f"{digest}.ppm")
+            except FileNotFoundError:
+                pass
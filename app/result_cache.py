@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+def workflow_hash(workflow: dict) -> str:
+    """최종 워크플로우(프롬프트, 시드, 입력 이미지, 파일명 포함)의 내용 해시"""
+    encoded = json.dumps(workflow, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    워크플로우 해시를 키로 하는 생성 결과 캐시.
+
+    완전히 같은 워크플로우가 다시 들어오면 ComfyUI에 보내지 않고 이전 결과를 돌려줍니다.
+    항목은 cache_dir/<해시 앞 2자리>/<해시>.json 에 저장하며, 기록된 출력 파일이
+    하나라도 없어졌으면(삭제, 다른 곳으로 이동 등) 캐시 미스로 처리합니다.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        """캐시된 결과를 반환합니다. 없거나 출력 파일이 사라졌으면 None."""
+        entry = self.lookup(key)
+        return entry[0] if entry is not None else None
+
+    def lookup(self, key: str) -> Optional[Tuple[dict, List[str]]]:
+        """캐시된 (결과, 출력 파일 경로 목록)을 반환합니다. 없거나 출력 파일이 사라졌으면 None."""
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        if not all(os.path.exists(path) for path in entry.get("files", [])):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["result"], entry.get("files", [])
+
+    def put(self, key: str, result: dict, files: List[Path]):
+        """결과와 그 결과를 이루는 출력 파일 경로를 기록합니다."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"result": result, "files": [str(f) for f in files]}
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
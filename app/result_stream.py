@@ -0,0 +1,159 @@
+import json
+import os
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# SSE 연결 유지용 주석을 보낼 간격 (초): 프록시가 유휴 연결을 끊지 않도록
+SSE_KEEPALIVE = 15
+# 묶음 다운로드 형식
+ARCHIVE_FORMATS = ("tar", "zip")
+# 아카이브에 파일을 복사할 때 한 번에 읽을 크기 (바이트)
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+
+def output_path(image: dict) -> Optional[str]:
+    """SaveImage executed 출력의 이미지 항목 -> output 폴더 기준 상대 경로 (output 이 아닌 temp 등은 None)"""
+    if image.get("type", "output") != "output":
+        return None
+    subfolder = image.get("subfolder", "")
+    return f"{subfolder}/{image['filename']}" if subfolder else image["filename"]
+
+
+def output_images(output: Optional[dict]) -> List[str]:
+    """SaveImage 노드의 executed 출력에서 실제로 저장된 이미지 경로 목록"""
+    if not output:
+        return []
+    return [path for path in map(output_path, output.get("images", [])) if path]
+
+
+def result_files(result: Optional[dict]) -> List[str]:
+    """작업 결과가 가리키는 출력 파일 (이미지들, 캡션) 상대 경로"""
+    if not result:
+        return []
+    files = list(result.get("images") or [])
+    if result.get("caption"):
+        files.append(result["caption"])
+    return files
+
+
+def resolve_output(root: Path, relative: str) -> Path:
+    """output 폴더 기준 상대 경로를 실제 경로로 바꿉니다. 폴더 밖을 가리키면 ValueError."""
+    root = root.resolve()
+    path = (root / relative).resolve()
+    if not path.is_relative_to(root):
+        raise ValueError(f"output 폴더 밖의 경로입니다: {relative}")
+    return path
+
+
+def sse_event(event: str, data: dict) -> str:
+    """server-sent events 메시지 하나"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class _Sink:
+    """zipfile 이 쓰는 바이트를 모아뒀다가 꺼내가는 쓰기 전용 스트림 (seek 불가 -> zipfile 이 데이터 디스크립터 사용)"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def archive_chunks(root: Path, files: Iterable[str], fmt: str, extra: Dict[str, bytes] = None) -> Iterator[bytes]:
+    """
+    output 폴더의 파일들을 tar / zip 으로 묶어 조각 단위로 내보냅니다.
+    임시 파일이나 전체 사본 없이 파일을 ARCHIVE_CHUNK_SIZE 씩 읽어 바로 흘려보내므로
+    메모리 사용량은 조각 하나 크기로 유지됩니다. extra 는 아카이브 앞에 함께 넣을 (이름 -> 내용)입니다.
+    없어진 파일은 건너뜁니다.
+    """
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"지원하지 않는 아카이브 형식입니다: {fmt} (가능: {', '.join(ARCHIVE_FORMATS)})")
+    if fmt == "tar":
+        yield from _tar_chunks(root, files, extra or {})
+    else:
+        yield from _zip_chunks(root, files, extra or {})
+
+
+def _open_outputs(root: Path, files: Iterable[str]):
+    """(상대 경로, 열린 파일, stat) 를 차례로 돌려줍니다. 없어진 파일은 건너뜀"""
+    for relative in files:
+        try:
+            source = open(resolve_output(root, relative), "rb")
+        except FileNotFoundError:
+            continue
+        with source:
+            yield relative, source, os.fstat(source.fileno())
+
+
+def _read_exactly(source, size: int) -> Iterator[bytes]:
+    """파일에서 size 바이트를 조각 단위로 읽습니다. (도중에 줄어든 파일은 0으로 채워 헤더 크기를 지킴)"""
+    remaining = size
+    while remaining > 0:
+        chunk = source.read(min(ARCHIVE_CHUNK_SIZE, remaining))
+        if not chunk:
+            chunk = bytes(min(ARCHIVE_CHUNK_SIZE, remaining))
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _tar_header(name: str, size: int, mtime: float) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size, info.mtime, info.mode = size, int(mtime), 0o644
+    return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+
+def _tar_padding(size: int) -> bytes:
+    return bytes(-size % tarfile.BLOCKSIZE)
+
+
+def _tar_chunks(root: Path, files: Iterable[str], extra: Dict[str, bytes]) -> Iterator[bytes]:
+    # tarfile.addfile 은 파일 하나를 한 번에 복사하므로 헤더와 블록 패딩을 직접 써서 조각마다 내보냄
+    written = 0
+    for name, data in extra.items():
+        block = _tar_header(name, len(data), time.time()) + data + _tar_padding(len(data))
+        written += len(block)
+        yield block
+    for relative, source, stat in _open_outputs(root, files):
+        header = _tar_header(relative, stat.st_size, stat.st_mtime)
+        written += len(header)
+        yield header
+        for chunk in _read_exactly(source, stat.st_size):
+            yield chunk
+        padding = _tar_padding(stat.st_size)
+        written += stat.st_size + len(padding)
+        yield padding
+    # 아카이브 끝 표시 (빈 블록 2개) + tarfile 과 같은 레코드 단위 패딩
+    end = bytes(2 * tarfile.BLOCKSIZE)
+    written += len(end)
+    yield end + bytes(-written % tarfile.RECORDSIZE)
+
+
+def _zip_chunks(root: Path, files: Iterable[str], extra: Dict[str, bytes]) -> Iterator[bytes]:
+    sink = _Sink()
+    # PNG 는 이미 압축되어 있으므로 압축 없이 저장
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for name, data in extra.items():
+            archive.writestr(name, data)
+            yield sink.drain()
+        for relative, source, stat in _open_outputs(root, files):
+            info = zipfile.ZipInfo(relative, time.localtime(stat.st_mtime)[:6])
+            info.file_size = stat.st_size
+            with archive.open(info, "w") as target:
+                for chunk in _read_exactly(source, stat.st_size):
+                    target.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,136 @@
+import heapq
+import itertools
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+# 우선순위 (앞쪽일수록 먼저 처리). 높은 우선순위 작업이 있으면 낮은 우선순위는 기다림
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+# 배치를 모을 때 같은 흐름의 대기열에서 살펴볼 최대 작업 수
+BATCH_SCAN_LIMIT = 256
+
+Flow = Tuple[str, str]  # (테넌트 또는 캐릭터, 생성 모드)
+
+
+class _Class:
+    """우선순위 하나의 흐름별 대기열과 가상 시간"""
+
+    def __init__(self):
+        self.flows: Dict[Flow, Deque[tuple]] = {}   # 흐름 -> [(시작 태그, 종료 태그, 작업)]
+        self.last_finish: Dict[Flow, float] = {}    # 흐름의 마지막 작업 종료 태그
+        self.heap: List[tuple] = []                 # (흐름 맨 앞 작업의 종료 태그, 순번, 흐름)
+        self.virtual = 0.0
+        self.count = 0
+
+
+class FairScheduler:
+    """
+    우선순위별 가중 공정 큐 (start-time fair queuing).
+
+    작업은 (테넌트 또는 캐릭터, 생성 모드) 흐름으로 나뉘고, 흐름마다 가중치에 반비례하는
+    가상 종료 시각이 붙습니다. 꺼낼 때는 가장 높은 우선순위에서 종료 시각이 가장 이른 흐름의
+    맨 앞 작업을 고르므로, 먼저 쌓인 5천 개짜리 흐름이 있어도 새로 들어온 흐름은 곧바로
+    자기 몫(가중치 비율)만큼 처리됩니다. 같은 흐름 안에서는 들어온 순서를 지킵니다.
+
+    취소된 작업은 대기열에서 바로 빼지 않고 표시만 해 두었다가 꺼낼 때 건너뜁니다. (O(1))
+    """
+
+    def __init__(self, flow_of: Callable[[object], Flow], priority_of: Callable[[object], str],
+                 weight_of: Callable[[Flow], float] = lambda flow: 1.0):
+        self._flow_of = flow_of
+        self._priority_of = priority_of
+        self._weight_of = weight_of
+        self._classes = {priority: _Class() for priority in PRIORITIES}
+        self._removed: set = set()
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return sum(cls.count for cls in self._classes.values())
+
+    def push(self, job):
+        priority = self._priority_of(job)
+        cls = self._classes.get(priority)
+        if cls is None:
+            raise ValueError(f"지원하지 않는 우선순위입니다: {priority} (가능: {', '.join(PRIORITIES)})")
+        flow = self._flow_of(job)
+        start = max(cls.virtual, cls.last_finish.get(flow, 0.0))
+        finish = start + 1.0 / max(self._weight_of(flow), 1e-9)
+        cls.last_finish[flow] = finish
+        queue = cls.flows.get(flow)
+        if queue is None:
+            queue = cls.flows[flow] = deque()
+        if not queue:
+            heapq.heappush(cls.heap, (finish, next(self._seq), flow))
+        queue.append((start, finish, job))
+        cls.count += 1
+
+    def pop(self, batch_size: int = 1, batch_key: Callable[[object], Optional[Hashable]] = lambda job: None) -> List:
+        """
+        다음 작업을 꺼냅니다. batch_size > 1 이면 같은 흐름에서 batch_key 가 같은 작업을
+        최대 batch_size 개까지 함께 꺼냅니다. 대기 중인 작업이 없으면 빈 목록.
+        """
+        for cls in self._classes.values():
+            while cls.heap:
+                _, _, flow = heapq.heappop(cls.heap)
+                queue = cls.flows[flow]
+                start, _, job = queue.popleft()
+                if id(job) in self._removed:
+                    self._removed.discard(id(job))
+                    self._requeue_flow(cls, flow, queue)
+                    continue
+                cls.virtual = max(cls.virtual, start)
+                cls.count -= 1
+                batch = [job]
+                key = batch_key(job)
+                if batch_size > 1 and key is not None and queue:
+                    batch += self._take_matching(cls, queue, batch_key, key, batch_size - 1)
+                self._requeue_flow(cls, flow, queue)
+                return batch
+        return []
+
+    def remove(self, job) -> bool:
+        """대기 중인 작업을 취소 표시합니다. (이미 꺼낸 작업이면 호출하지 말 것)"""
+        if id(job) in self._removed:
+            return False
+        cls = self._classes[self._priority_of(job)]
+        self._removed.add(id(job))
+        cls.count -= 1
+        return True
+
+    def counts(self) -> Dict[str, int]:
+        return {priority: cls.count for priority, cls in self._classes.items()}
+
+    def stats(self) -> dict:
+        """우선순위별 대기 작업 수와 흐름별 대기 작업 수 (취소 표시된 작업 포함)"""
+        return {
+            priority: {
+                "pending": cls.count,
+                "flows": {"/".join(flow): len(queue) for flow, queue in cls.flows.items() if queue},
+            }
+            for priority, cls in self._classes.items()
+        }
+
+    def _take_matching(self, cls: _Class, queue: Deque[tuple], batch_key, key, limit: int) -> List:
+        taken, kept = [], []
+        scanned = 0
+        while queue and len(taken) < limit and scanned < BATCH_SCAN_LIMIT:
+            entry = queue.popleft()
+            scanned += 1
+            job = entry[2]
+            if id(job) not in self._removed and batch_key(job) == key:
+                taken.append(job)
+                cls.virtual = max(cls.virtual, entry[0])
+                cls.count -= 1
+            else:
+                kept.append(entry)
+        queue.extendleft(reversed(kept))
+        return taken
+
+    def _requeue_flow(self, cls: _Class, flow: Flow, queue: Deque[tuple]):
+        if queue:
+            heapq.heappush(cls.heap, (queue[0][1], next(self._seq), flow))
+        else:
+            # 빈 흐름은 정리 (다음에 들어오면 현재 가상 시간부터 다시 시작)
+            del cls.flows[flow]
+            if cls.last_finish.get(flow, 0.0) <= cls.virtual:
+                cls.last_finish.pop(flow, None)
@@ -1,16 +1,56 @@
-import json
 from pathlib import Path
+from typing import List, Optional, Tuple
+from app.file_cache import MtimeCache
 from app.model import GenerateRequest
 
 # 워크플로우 템플릿 파일 경로
 WORKFLOW_TEMPLATE_PATH = Path("workflow/flux_1_kontext_dev_FH.json")
 
+# 프롬프트가 들어가는 노드 (CLIPTextEncode). 배치 모드에서는 이 노드의 하위 노드들이 프롬프트별로 복제됨
+PROMPT_NODE_ID = "192"
+# 참조 이미지 노드 (LoadImageOutput)와 그 뒤의 크기 조정 노드 (ImageStitch -> FluxKontextImageScale)
+REFERENCE_NODE_ID = "142"
+REFERENCE_SCALE_NODE_IDS = ("146", "42")
+# 배치 모드에서 복제된 노드 ID = 원래 노드 ID + OFFSET * (브랜치 번호 + 1)
+BATCH_NODE_ID_OFFSET = 1000
+
+# 파싱된 워크플로우 템플릿 캐시 (파일 수정 시 자동으로 다시 읽음)
+workflow_template_cache = MtimeCache()
+
 def load_workflow_template():
-    """워크플로우 템플릿 JSON 파일을 불러옵니다."""
-    with open(WORKFLOW_TEMPLATE_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """
+    워크플로우 템플릿을 불러옵니다.
+    반환값은 캐시와 공유되므로 직접 수정하지 말고 build_workflow를 사용하세요.
+    """
+    return workflow_template_cache.get(WORKFLOW_TEMPLATE_PATH)
+
+def patch_node(workflow: dict, node_id: str, **inputs):
+    """
+    노드 하나만 복사한 뒤 입력값을 덮어씁니다.
+    나머지 노드는 템플릿과 공유하므로 전체 그래프를 deepcopy 하지 않아도 됩니다.
+    """
+    node = dict(workflow[node_id])
+    node["inputs"] = {**node["inputs"], **inputs}
+    workflow[node_id] = node
+
+def use_prescaled_reference(workflow: dict):
+    """
+    참조 이미지가 이미 Kontext 해상도로 축소되어 있으면 크기 조정 노드를 건너뛰고
+    LoadImageOutput 출력을 바로 VAEEncode 에 연결합니다.
+    """
+    scale_output = REFERENCE_SCALE_NODE_IDS[-1]
+    for node_id, node in list(workflow.items()):
+        if any(isinstance(value, list) and value and value[0] == scale_output for value in node["inputs"].values()):
+            patch_node(workflow, node_id, **{
+                name: [REFERENCE_NODE_ID, 0]
+                for name, value in node["inputs"].items()
+                if isinstance(value, list) and value and value[0] == scale_output
+            })
+    for node_id in REFERENCE_SCALE_NODE_IDS:
+        workflow.pop(node_id, None)
 
-def build_workflow(req: GenerateRequest, prompt: str, input_image_name: str):
+def build_workflow(req: GenerateRequest, prompt: str, input_image_name: str, seed: Optional[int] = None,
+                   prescaled: bool = False):
     """
     요청 정보를 바탕으로 ComfyUI 워크플로우를 구성합니다.
 
@@ -18,12 +58,101 @@ def build_workflow(req: GenerateRequest, prompt: str, input_image_name: str):
         req (GenerateRequest): API 요청 모델 객체
         prompt (str): 생성된 전체 프롬프트 문자열
         input_image_name (str): 사용할 입력 이미지 파일명
+        seed (int, optional): KSampler 시드 (None이면 템플릿 값 사용)
+        prescaled (bool): 입력 이미지가 ReferenceCache 의 사전 축소본이면 True
 
     Returns:
         dict: ComfyUI에 전송할 워크플로우 딕셔너리
     """
-    workflow = load_workflow_template()
+    # 최상위 dict만 얕은 복사하고, 값을 바꾸는 노드만 patch_node로 복사
+    workflow = dict(load_workflow_template())
+    caption_file, image_filename_prefix = _output_names(req)
+
+    # 워크플로우의 각 노드에 필요한 값을 채워넣음
+    patch_node(workflow, "192", text=prompt)
+    patch_node(workflow, "136", filename_prefix=image_filename_prefix)
+    patch_node(workflow, "189", prefix=req.trigger_word)
+    patch_node(workflow, "190", file=caption_file)
+    patch_node(workflow, "142", image=f"{input_image_name} [output]")
+    if seed is not None:
+        patch_node(workflow, "31", seed=seed)
+    if prescaled:
+        use_prescaled_reference(workflow)
+
+    return workflow
+
+def build_batch_workflow(items: List[Tuple[GenerateRequest, str, Optional[int]]], input_image_name: str,
+                         prescaled: bool = False):
+    """
+    같은 입력 이미지를 쓰는 여러 요청을 하나의 ComfyUI 워크플로우로 합칩니다.
 
+    모델 로더와 참조 이미지 인코딩(LoadImageOutput -> FluxKontextImageScale -> VAEEncode)은
+    한 번만 실행하고, 프롬프트 노드 이하(텍스트 인코딩, KSampler, 디코딩, 저장, 캡션)만
+    요청 수만큼 복제합니다.
+
+    Args:
+        items (list): (요청, 프롬프트, KSampler 시드) 튜플 목록
+        input_image_name (str): 공통으로 사용할 입력 이미지 파일명
+        prescaled (bool): 입력 이미지가 ReferenceCache 의 사전 축소본이면 True
+
+    Returns:
+        tuple: (워크플로우 딕셔너리, 브랜치 목록)
+            브랜치 목록의 각 항목은 items 와 같은 순서이며
+            index, image_node, caption_node, caption_file 을 담고 있습니다.
+    """
+    template = load_workflow_template()
+    branch_ids = _branch_node_ids(template)
+
+    # 공유 노드는 템플릿과 그대로 공유
+    workflow = {node_id: node for node_id, node in template.items() if node_id not in branch_ids}
+    patch_node(workflow, "142", image=f"{input_image_name} [output]")
+    if prescaled:
+        use_prescaled_reference(workflow)
+
+    branches = []
+    for k, (req, prompt, seed) in enumerate(items):
+        offset = BATCH_NODE_ID_OFFSET * (k + 1)
+        remap = {node_id: str(offset + int(node_id)) for node_id in branch_ids}
+        for node_id in branch_ids:
+            node = template[node_id]
+            inputs = {
+                name: [remap[value[0]], value[1]] if isinstance(value, list) and value and value[0] in remap else value
+                for name, value in node["inputs"].items()
+            }
+            workflow[remap[node_id]] = {**node, "inputs": inputs}
+
+        caption_file, image_filename_prefix = _output_names(req)
+        patch_node(workflow, remap["192"], text=prompt)
+        patch_node(workflow, remap["136"], filename_prefix=image_filename_prefix)
+        patch_node(workflow, remap["189"], prefix=req.trigger_word)
+        patch_node(workflow, remap["190"], file=caption_file)
+        if seed is not None:
+            patch_node(workflow, remap["31"], seed=seed)
+        branches.append({
+            "index": req.index,
+            "image_node": remap["136"],
+            "caption_node": remap["190"],
+            "caption_file": caption_file,
+        })
+
+    return workflow, branches
+
+def workflow_branch(req: GenerateRequest):
+    """build_workflow로 만든 단일 워크플로우의 브랜치 정보 (build_batch_workflow 와 같은 형식)"""
+    caption_file, _ = _output_names(req)
+    return {
+        "index": req.index,
+        "image_node": "136",
+        "caption_node": "190",
+        "caption_file": caption_file,
+    }
+
+def _output_names(req: GenerateRequest):
+    """
+    (SaveText 캡션 파일명, 이미지 파일명 프리픽스)를 반환합니다.
+    SaveText 가 저장하는 캡션은 최종 캡션의 원본일 뿐이고, 최종 캡션은 저장된 이미지와 같은 이름으로 따로 기록하므로
+    이미지 이름과 겹치지 않도록 끝에 danbooru 를 붙입니다.
+    """
     if req.generation_mode == "expression":
         # 'expression' 모드에서는 expression을 파일명에 포함
         text_filename_base = f"{req.trigger_word}_expression_{(req.index):05d}_"
@@ -32,12 +161,20 @@ def build_workflow(req: GenerateRequest, prompt: str, input_image_name: str):
         # 'shot_type' 모드에서는 expression을 파일명에 포함하지 않음
         text_filename_base = f"{req.trigger_word}_{(req.index):05d}_"
         image_filename_prefix = f"{req.trigger_word}"
-    
-    # 워크플로우의 각 노드에 필요한 값을 채워넣음
-    workflow["192"]["inputs"]["text"] = prompt
-    workflow["136"]["inputs"]["filename_prefix"] = image_filename_prefix
-    workflow["189"]["inputs"]["prefix"] = req.trigger_word
-    workflow["190"]["inputs"]["file"] = f"{text_filename_base}.txt"
-    workflow["142"]["inputs"]["image"] = f"{input_image_name} [output]"
+    return f"{text_filename_base}danbooru.txt", image_filename_prefix
 
-    return workflow
+def _branch_node_ids(template: dict):
+    """프롬프트 노드와 그 하위(프롬프트 결과에 의존하는) 노드 ID 집합을 구합니다."""
+    branch_ids = {PROMPT_NODE_ID}
+    changed = True
+    while changed:
+        changed = False
+        for node_id, node in template.items():
+            if node_id in branch_ids:
+                continue
+            for value in node["inputs"].values():
+                if isinstance(value, list) and value and value[0] in branch_ids:
+                    branch_ids.add(node_id)
+                    changed = True
+                    break
+    return branch_ids
@@ -0,0 +1,128 @@
+"""
+ComfyUI 서버 풀 벤치마크 (속도가 다른 서버 여러 대 / 서버 장애, GPU 없이 가짜 ComfyUI 사용)
+
+속도(KSampler 지연 시간)가 다른 가짜 ComfyUI 여러 대와 app.main:app 을 새 프로세스로 띄우고 다음을 확인합니다.
+1. 분배: 작업을 쌓아 두고 모두 끝난 뒤 서버별 완료 비율이 속도 비율(1 / 지연 시간)에 가까워야 함
+   (빨리 끝나는 서버가 큐 자리를 먼저 비우므로 더 많은 작업을 받음)
+2. 장애: 다시 작업을 쌓고 도중에 가장 빠른 서버 프로세스를 강제 종료(SIGKILL)
+   -> 그 서버에 올라가 있던 작업은 다른 서버로 재전송되어 실패 없이 모두 끝나야 함
+
+하나라도 어긋나면 종료 코드 1.
+
+실행 (저장소 루트에서): python -m benchmarks.bench_backend_pool --latencies 0.1 0.2 0.4 --jobs 300
+"""
+import argparse
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+from app.backend_pool import BACKEND_DOWN_TIMEOUT
+from benchmarks.bench_captions import _wait_all
+from benchmarks.bench_scheduler import Checks, _payload, _submit
+from benchmarks.bench_service import API_PORT, COMFY_PORT, _prepare_inputs, _serve_api, _wait_ready
+from benchmarks.fake_comfyui import DEFAULT_NODE_LATENCY, FakeComfyConfig, serve
+
+CHARACTER = "ellie"
+
+
+def _completed(http: httpx.Client) -> dict:
+    return {backend["name"]: backend["completed"] for backend in http.get("/queue").json()["backends"]}
+
+
+def _backends(http: httpx.Client) -> dict:
+    return {backend["name"]: backend for backend in http.get("/queue").json()["backends"]}
+
+
+def run(args, http: httpx.Client, stubs: list, checks: Checks):
+    run_id = f"bench-{uuid.uuid4().hex[:8]}"
+    names = [f"fake{i}" for i in range(len(args.latencies))]
+
+    # 1. 분배: 서버별 완료 비율 vs 속도 비율
+    job_ids = _submit(http, [_payload(CHARACTER, i, run_id, "normal") for i in range(args.jobs)])
+    statuses = _wait_all(http, job_ids, args.timeout)
+    done = sum(s["status"] == "done" for s in statuses)
+    completed = _completed(http)
+    total = sum(completed.values())
+    speeds = [1 / latency for latency in args.latencies]
+    print(f"작업 {args.jobs}개 완료 {done}, 서버별 완료 {completed}")
+    checks.check(done == args.jobs, "작업 완료", f"{done}/{args.jobs}")
+    for name, latency, speed in zip(names, args.latencies, speeds):
+        share = completed[name] / total if total else 0.0
+        expected = speed / sum(speeds)
+        checks.check(abs(share - expected) <= args.share_tolerance, f"{name} 분배 (KSampler {latency}s)",
+                     f"비율 {share:.2f} (기대 {expected:.2f} ± {args.share_tolerance})")
+
+    # 2. 장애: 작업을 쌓고 가장 빠른 서버를 강제 종료
+    fastest = min(range(len(names)), key=lambda i: args.latencies[i])
+    before = _backends(http)
+    job_ids = _submit(http, [_payload(CHARACTER, args.jobs + i, run_id, "normal") for i in range(args.jobs)])
+    time.sleep(args.kill_after)
+    stubs[fastest].kill()
+    stubs[fastest].join()
+    killed_at = time.monotonic()
+    statuses = _wait_all(http, job_ids, args.timeout + BACKEND_DOWN_TIMEOUT)
+    after = _backends(http)
+    counts = {status: sum(s["status"] == status for s in statuses) for status in ("done", "failed")}
+    killed = names[fastest]
+    redispatched = after[killed]["failed"] - before[killed]["failed"]
+    survivors = sum(after[name]["completed"] - before[name]["completed"] for name in names if name != killed)
+    print(f"{killed} 종료 후 {time.monotonic() - killed_at:.1f}s 안에 끝남: {counts}, "
+          f"재전송 {redispatched}, 남은 서버 완료 {survivors}, {killed} 상태 healthy={after[killed]['healthy']}")
+    checks.check(counts["done"] == args.jobs and not counts["failed"], "서버 장애 중 작업 완료",
+                 f"완료 {counts['done']}/{args.jobs}, 실패 {counts['failed']}")
+    checks.check(redispatched > 0 and not after[killed]["healthy"], "죽은 서버 작업 재전송",
+                 f"{killed} 에서 다른 서버로 재전송 {redispatched}건")
+
+
+def main(args):
+    workdir = Path(tempfile.mkdtemp(prefix="bench_backend_pool_"))
+    root = workdir / "output"
+    root.mkdir()
+    _prepare_inputs(root, [CHARACTER], [], [])
+    ports = [COMFY_PORT + i for i in range(len(args.latencies))]
+    stubs = []
+    for i, (port, latency) in enumerate(zip(ports, args.latencies)):
+        # KSampler 외 노드는 지연 없이 (참조 이미지 노드는 샷 타입이 바뀔 때마다 다시 실행되므로 속도 비율을 흐림)
+        node_latency = {**{node: 0.0 for node in DEFAULT_NODE_LATENCY}, "KSampler": latency}
+        config = FakeComfyConfig(output_dir=root, node_latency=node_latency, latency_jitter=args.jitter,
+                                 seed=args.seed + i)
+        stubs.append(multiprocessing.Process(target=serve, args=(port, config), daemon=True))
+    api = multiprocessing.Process(target=_serve_api, args=(API_PORT, ports, root, args.queue_depth, 1), daemon=True)
+    for process in stubs + [api]:
+        process.start()
+    api_url = f"http://127.0.0.1:{API_PORT}"
+    checks = Checks()
+    try:
+        _wait_ready(api_url)
+        with httpx.Client(base_url=api_url, timeout=30) as http:
+            run(args, http, stubs, checks)
+    finally:
+        # API 서버를 먼저 종료 (가짜 ComfyUI 가 먼저 내려가면 재연결을 시도함)
+        for process in [api] + stubs:
+            if process.is_alive():
+                process.terminate()
+        for process in [api] + stubs:
+            process.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("통과" if not checks.failed else f"실패 {checks.failed}건")
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latencies", nargs="+", type=float, default=[0.1, 0.2, 0.4],
+                        help="KSampler seconds of each fake ComfyUI server")
+    parser.add_argument("--jobs", type=int, default=300, help="jobs per phase")
+    parser.add_argument("--queue-depth", type=int, default=2, help="max_queue_depth of each server")
+    parser.add_argument("--share-tolerance", type=float, default=0.08)
+    parser.add_argument("--kill-after", type=float, default=2.0, help="seconds into phase 2 before killing a server")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,73 @@
+"""
+배치 워크플로우 구조 확인 및 노드 실행 횟수 비교
+
+스텁 실행기가 워크플로우 그래프를 위상 정렬 순서로 "실행"하면서 class_type 별
+실행 횟수를 셉니다. 같은 입력 이미지를 쓰는 K개 요청을 단일 워크플로우 K번으로
+보낼 때와 build_batch_workflow 로 한 번에 보낼 때를 비교합니다.
+
+실행: python -m benchmarks.bench_batch_workflow --batch 8
+"""
+import argparse
+from collections import Counter
+
+from app.model import GenerateRequest
+from app.workflow_builder import build_batch_workflow, build_workflow
+
+EXPENSIVE = ("UNETLoader", "DualCLIPLoader", "VAELoader", "LoadImageOutput",
+             "FluxKontextImageScale", "VAEEncode", "KSampler", "SaveImage")
+
+
+def execute(workflow: dict, counter: Counter):
+    """모든 노드를 의존성 순서대로 한 번씩 평가하고 class_type 별 횟수를 기록합니다."""
+    done = set()
+
+    def visit(node_id):
+        if node_id in done:
+            return
+        for value in workflow[node_id]["inputs"].values():
+            if isinstance(value, list) and value and value[0] in workflow:
+                visit(value[0])
+        counter[workflow[node_id]["class_type"]] += 1
+        done.add(node_id)
+
+    for node_id in workflow:
+        visit(node_id)
+
+
+def check_structure(workflow: dict, branches: list, batch: int):
+    """배치 워크플로우가 공유 노드 1벌 + 브랜치 K벌로 구성됐는지 확인합니다."""
+    classes = Counter(node["class_type"] for node in workflow.values())
+    assert classes["VAEEncode"] == 1 and classes["LoadImageOutput"] == 1
+    assert classes["KSampler"] == batch and classes["SaveImage"] == batch
+    assert len({b["image_node"] for b in branches}) == batch
+    for branch in branches:
+        assert workflow[branch["image_node"]]["class_type"] == "SaveImage"
+        assert workflow[branch["caption_node"]]["inputs"]["file"] == branch["caption_file"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=8)
+    args = parser.parse_args()
+
+    reqs = [GenerateRequest(trigger_word="fh_ellie", character_name="ellie", index=i) for i in range(args.batch)]
+    items = [(req, f"prompt {req.index}", req.index) for req in reqs]
+
+    single = Counter()
+    for req, prompt, seed in items:
+        execute(build_workflow(req, prompt, "bustShot_fh_ellie.png", seed), single)
+
+    batched = Counter()
+    workflow, branches = build_batch_workflow(items, "bustShot_fh_ellie.png")
+    check_structure(workflow, branches, args.batch)
+    execute(workflow, batched)
+
+    print(f"{'class_type':<24}{'single x' + str(args.batch):>12}{'batch':>8}")
+    for class_type in EXPENSIVE:
+        print(f"{class_type:<24}{single[class_type]:>12}{batched[class_type]:>8}")
+    print(f"{'total nodes':<24}{sum(single.values()):>12}{sum(batched.values()):>8}")
+    print(f"{'submitted prompts':<24}{args.batch:>12}{1:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+캡션 기록 동시성 검증 (GPU 없이 가짜 ComfyUI 사용)
+
+가짜 ComfyUI 와 app.main:app 을 새 프로세스로 띄우고 표정 모드 작업을 여러 클라이언트가 동시에 보냅니다.
+작업이 실행되는 동안 별도 스레드가 output 폴더의 캡션 파일을 계속 읽으면서 읽은 내용이 다음 중 하나인지 확인합니다.
+- ComfyUI 가 저장한 캡션 ("{트리거}, {태그들}", SaveText 원본 *danbooru.txt)
+- 최종 캡션 (위 캡션 + ", {표정}", 저장된 이미지와 같은 이름의 .txt)
+그 밖의 내용(빈 파일, 잘린 캡션, 표정 태그가 두 번 붙은 캡션)은 한 번이라도 읽히면 실패입니다.
+모든 작업이 끝나면 작업 결과의 캡션이 이미지와 같은 이름인지, 트리거와 표정 태그가 정확히 한 번씩 들어 있는지,
+SaveText 원본이 지워졌는지, 같은 작업을 다시 보내(결과 캐시 적중) 캡션이 바뀌지 않는지도 확인합니다.
+
+하나라도 어긋나면 종료 코드 1.
+
+실행 (저장소 루트에서): python -m benchmarks.bench_captions --jobs 300 --clients 4 --queue-depth 4 --batch-size 2
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+import generate_loop
+from app.caption_writer import build_caption, caption_name
+from benchmarks.bench_scheduler import Checks, _statuses
+from benchmarks.bench_service import API_PORT, COMFY_PORT, _prepare_inputs, _serve_api, _wait_ready
+from benchmarks.fake_comfyui import FAKE_CAPTION_TAGS, FakeComfyConfig, parse_latency, serve
+
+CHARACTER = "ellie"
+ANGLE = "front"
+# SaveText 가 저장하는 원본 캡션 파일명 끝 (workflow_builder._output_names)
+RAW_CAPTION_SUFFIX = "danbooru.txt"
+# 작업 상태 확인 주기 (초)
+POLL_INTERVAL = 0.1
+
+
+def _payload(index: int, expression: str, run_id: str) -> dict:
+    return {
+        "generation_mode": "expression",
+        "trigger_word": generate_loop.get_trigger_word(CHARACTER),
+        "character_name": CHARACTER,
+        "index": index,
+        "expression": expression,
+        "angle": ANGLE,
+        "run_id": run_id,
+    }
+
+
+def _submit_concurrently(http: httpx.Client, payloads, clients: int) -> list:
+    """payloads 를 clients 개로 나눠 동시에 /jobs 로 보내고 job_id 를 원래 순서대로 반환"""
+    def submit(chunk):
+        res = http.post("/jobs", json={"jobs": chunk})
+        res.raise_for_status()
+        return res.json()["job_ids"]
+
+    chunks = [payloads[i::clients] for i in range(clients)]
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(submit, chunks))
+    job_ids = [None] * len(payloads)
+    for i, ids in enumerate(results):
+        job_ids[i::clients] = ids
+    return job_ids
+
+
+def _wait_all(http: httpx.Client, job_ids, timeout: float) -> list:
+    deadline = time.monotonic() + timeout
+    while True:
+        statuses = _statuses(http, job_ids)
+        if all(s["status"] in ("done", "failed", "cancelled") for s in statuses) or time.monotonic() > deadline:
+            return statuses
+        time.sleep(POLL_INTERVAL)
+
+
+class CaptionReader(threading.Thread):
+    """작업이 도는 동안 캡션 파일을 계속 읽고 내용을 분류합니다."""
+
+    def __init__(self, root: Path, raw: str, finals: set):
+        super().__init__(daemon=True)
+        self.root = root
+        self.raw = raw  # ComfyUI(SaveText) 캡션
+        self.finals = finals  # 가능한 최종 캡션 (표정마다 하나)
+        self.counts = Counter()
+        self.torn = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.scan()
+
+    def scan(self):
+        for entry in os.scandir(self.root):
+            if not entry.name.endswith(".txt") or entry.name.startswith("."):
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    text = f.read()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith(RAW_CAPTION_SUFFIX):
+                kind = "comfyui" if text == self.raw else "torn"
+            else:
+                kind = "final" if text in self.finals else "torn"
+            self.counts[kind] += 1
+            if kind == "torn" and len(self.torn) < 5:
+                self.torn.append((entry.name, text))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _final_captions(root: Path, expected: dict, timeout: float) -> dict:
+    """모든 캡션이 최종 캡션이 될 때까지 (캡션 기록은 작업 완료 직후 백그라운드에서 끝남) 기다린 뒤 내용을 반환"""
+    deadline = time.monotonic() + timeout
+    while True:
+        captions = {}
+        for name in expected:
+            try:
+                captions[name] = (root / name).read_text(encoding="utf-8")
+            except FileNotFoundError:
+                captions[name] = None
+        if all(captions[name] == final for name, final in expected.items()) or time.monotonic() > deadline:
+            return captions
+        time.sleep(POLL_INTERVAL)
+
+
+def run(args, root: Path, http: httpx.Client, checks: Checks):
+    run_id = f"bench-{uuid.uuid4().hex[:8]}"
+    trigger_word = generate_loop.get_trigger_word(CHARACTER)
+    # SaveText 원본 파일명에는 표정이 없으므로 인덱스를 작업마다 다르게 줌
+    payloads = [_payload(i, args.expressions[i % len(args.expressions)], run_id) for i in range(args.jobs)]
+    raw = f"{trigger_word}, {FAKE_CAPTION_TAGS}"
+
+    reader = CaptionReader(root, raw, {build_caption(raw, [expression]) for expression in args.expressions})
+    reader.start()
+    start = time.perf_counter()
+    job_ids = _submit_concurrently(http, payloads, args.clients)
+    statuses = _wait_all(http, job_ids, args.timeout)
+    # 최종 캡션 파일명은 저장된 이미지 이름을 따르므로 작업 결과에서 가져옴
+    results = [s.get("result") or {} for s in statuses]
+    expected = {result["caption"]: build_caption(raw, [payload["expression"]])
+                for payload, result in zip(payloads, results) if result.get("caption")}
+    captions = _final_captions(root, expected, args.timeout)
+    elapsed = time.perf_counter() - start
+    reader.stop()
+
+    done = sum(s["status"] == "done" for s in statuses)
+    print(f"표정 작업 {args.jobs}개 ({args.clients} 클라이언트 동시 전송) {elapsed:.1f}s, "
+          f"캡션 읽기 {sum(reader.counts.values())}회 {dict(reader.counts)}")
+    checks.check(done == args.jobs, "작업 완료", f"{done}/{args.jobs}")
+    checks.check(not reader.counts["torn"], "실행 중 캡션 읽기",
+                 f"잘리거나 잘못된 캡션 {reader.counts['torn']}회 {reader.torn}")
+
+    unpaired = [(result.get("image"), result.get("caption")) for result in results
+                if not result.get("image") or result.get("caption") != caption_name(result["image"])]
+    checks.check(not unpaired, "캡션 이름 = 이미지 이름", f"짝이 안 맞는 결과 {len(unpaired)}개 {unpaired[:3]}")
+
+    wrong = []
+    for payload, result in zip(payloads, results):
+        name = result.get("caption")
+        text = captions.get(name) or ""
+        tags = [tag.strip() for tag in text.split(",")]
+        if text != expected.get(name) or tags.count(trigger_word) != 1 or tags.count(payload["expression"]) != 1:
+            wrong.append((name, text))
+    checks.check(not wrong, "최종 캡션 (트리거/표정 한 번씩)",
+                 f"{len(payloads) - len(wrong)}/{len(payloads)} 정상 {wrong[:3]}")
+    leftover = [entry.name for entry in os.scandir(root) if entry.name.endswith(RAW_CAPTION_SUFFIX)]
+    checks.check(not leftover, "SaveText 원본 정리", f"남은 원본 {len(leftover)}개 {leftover[:3]}")
+
+    # 같은 작업을 다시 보내면 결과 캐시가 적중해야 하고, 캡션에 태그가 다시 붙으면 안 됨
+    statuses = _wait_all(http, _submit_concurrently(http, payloads, args.clients), args.timeout)
+    cached = sum(bool((s.get("result") or {}).get("cached")) for s in statuses)
+    again = _final_captions(root, expected, 0)
+    changed = [name for name in expected if again[name] != captions[name]]
+    checks.check(not changed, "재전송 후 캡션 유지", f"결과 캐시 적중 {cached}/{args.jobs}, 바뀐 캡션 {len(changed)}")
+
+
+def main(args):
+    workdir = Path(tempfile.mkdtemp(prefix="bench_captions_"))
+    root = workdir / "output"
+    root.mkdir()
+    _prepare_inputs(root, [CHARACTER], args.expressions, [ANGLE])
+    config = FakeComfyConfig(output_dir=root, node_latency=parse_latency(args.latency),
+                             latency_jitter=args.jitter, workers=args.gpus, seed=args.seed)
+    api_url = f"http://127.0.0.1:{API_PORT}"
+    processes = [
+        multiprocessing.Process(target=serve, args=(COMFY_PORT, config), daemon=True),
+        multiprocessing.Process(target=_serve_api, args=(API_PORT, COMFY_PORT, root, args.queue_depth,
+                                                         args.batch_size), daemon=True),
+    ]
+    for process in processes:
+        process.start()
+    checks = Checks()
+    try:
+        _wait_ready(api_url)
+        with httpx.Client(base_url=api_url, timeout=30) as http:
+            run(args, root, http, checks)
+    finally:
+        # API 서버를 먼저 종료 (가짜 ComfyUI 가 먼저 내려가면 재연결을 시도함)
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            process.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("통과" if not checks.failed else f"실패 {checks.failed}건")
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=4, help="concurrent /jobs submitters")
+    parser.add_argument("--expressions", nargs="+", default=["smile", "angry", "sad"])
+    parser.add_argument("--queue-depth", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--latency", nargs="*", default=["KSampler=0.01"], metavar="NODE=SECONDS")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--gpus", type=int, default=4, help="prompts the fake ComfyUI executes at once")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    sys.exit(main(parser.parse_args()))
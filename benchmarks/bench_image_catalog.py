@@ -0,0 +1,71 @@
+"""
+표정 모드 입력 이미지 선택 벤치마크
+
+합성 output 트리(기본 100k 파일)를 만들고, 요청마다 glob 하는 기존 방식과
+ImageCatalog.pick 의 요청당 지연 시간을 비교합니다.
+
+실행: python -m benchmarks.bench_image_catalog --files 100000 --requests 200
+"""
+import argparse
+import glob
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from app.image_catalog import ImageCatalog
+
+CHARACTERS = ["ellie", "ryder", "bunta"]
+EXPRESSIONS = ["smile", "angry", "sad"]
+ANGLES = ["front", "left_three_quarter", "right_three_quarter"]
+
+
+def make_tree(root: Path, files: int):
+    keys = [(c, "bustShot", e, a) for c in CHARACTERS for e in EXPRESSIONS for a in ANGLES]
+    for key in keys:
+        (root / Path(*key)).mkdir(parents=True)
+    for i in range(files):
+        key = keys[i % len(keys)]
+        (root / Path(*key) / f"bustShot_{key[0]}_{key[2]}_{key[3]}_{i:06d}_.png").touch()
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        start = time.perf_counter()
+        keys = make_tree(root, args.files)
+        print(f"created {args.files} files in {len(keys)} directories ({time.perf_counter() - start:.1f}s)")
+        picks = [random.choice(keys) for _ in range(args.requests)]
+
+        start = time.perf_counter()
+        for key in picks:
+            random.choice(glob.glob(str(root / "/".join(key) / "*.png")))
+        glob_ms = (time.perf_counter() - start) / args.requests * 1000
+
+        catalog = ImageCatalog(root)
+        start = time.perf_counter()
+        for key in keys:
+            catalog.count(key)
+        warm_ms = (time.perf_counter() - start) * 1000
+
+        results = {}
+        for strategy in ("random", "round_robin", "least_used"):
+            start = time.perf_counter()
+            for key in picks:
+                catalog.pick(key, strategy)
+            results[strategy] = (time.perf_counter() - start) / args.requests * 1000
+
+        print(f"glob per request:        {glob_ms:8.3f} ms")
+        print(f"catalog initial scan:    {warm_ms:8.1f} ms (once)")
+        for strategy, ms in results.items():
+            print(f"catalog pick {strategy:<11} {ms:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+organize_output 벤치마크
+
+합성 output 폴더(기본 200k 파일 = 이미지/캡션 100k 쌍)를 만들어
+기존 방식(os.listdir + 파일별 makedirs 확인 + shutil.move + print)과
+현재 방식(os.scandir + 폴더 일괄 생성 + 병렬 rename + manifest)을 비교합니다.
+같은 파일명으로 여러 번 정리해도 (ComfyUI 는 파일을 옮기고 나면 같은 번호를 다시 씀) 덮어쓰는 파일이 없는지도 확인합니다.
+
+실행: python -m benchmarks.bench_organize_output --files 200000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from organize_output import MANIFEST_LOCK_SUFFIX, MANIFEST_NAME, organize_files
+
+CHARACTERS = ["ellie", "ryder", "bunta"]
+EMOTIONS = ["smile", "angry", "sad"]
+ANGLES = ["front", "left_three_quarter", "right_three_quarter"]
+
+
+def make_files(source_dir, files):
+    for i in range(files // 2):
+        character = CHARACTERS[i % 3]
+        emotion = EMOTIONS[(i // 3) % 3]
+        angle = ANGLES[(i // 9) % 3]
+        stem = f"bustShot_fh_{character}_{emotion}_{angle}_{i:06d}"
+        with open(os.path.join(source_dir, stem + ".png"), "wb") as f:
+            f.write(b"png")
+        with open(os.path.join(source_dir, stem + ".txt"), "w") as f:
+            f.write("fh_ellie, 1girl")
+
+
+def legacy_organize(source_dir):
+    """기존 organize_output.py 의 이동 로직 (.png 만 처리)"""
+    for filename in os.listdir(source_dir):
+        source_file_path = os.path.join(source_dir, filename)
+        if os.path.isfile(source_file_path) and filename.endswith(".png"):
+            parts = filename.split('_')
+            if len(parts) < 5:
+                continue
+            target_dir = os.path.join(source_dir, parts[2], parts[0], parts[3], "_".join(parts[4:-1]))
+            if not os.path.exists(target_dir):
+                os.makedirs(target_dir)
+            if os.path.exists(source_file_path):
+                shutil.move(source_file_path, os.path.join(target_dir, filename))
+                print(f"Moved: {filename} -> {target_dir}")
+
+
+def run(name, organize, files):
+    with tempfile.TemporaryDirectory() as tmp:
+        make_files(tmp, files)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            organize(tmp)
+        elapsed = time.perf_counter() - start
+        manifest = os.path.join(tmp, MANIFEST_NAME)
+        lines = sum(1 for _ in open(manifest)) if os.path.exists(manifest) else 0
+        left = sum(1 for entry in os.scandir(tmp)
+                   if entry.is_file() and entry.name not in (MANIFEST_NAME, MANIFEST_NAME + MANIFEST_LOCK_SUFFIX))
+    moved = files - left
+    print(f"{name:<8} {files} files: {elapsed:6.2f}s, moved={moved} ({moved / elapsed:8.0f} files/s), "
+          f"manifest rows={lines}, left behind={left}")
+
+
+def run_rounds(rounds, files):
+    """같은 파일명으로 rounds 번 정리한 뒤 옮겨진 파일이 모두 남아 있는지 (덮어쓴 파일이 없는지) 확인"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(rounds):
+            make_files(tmp, files)
+            with contextlib.redirect_stdout(io.StringIO()):
+                organize_files(tmp)
+        kept = sum(len([name for name in names if name.endswith((".png", ".txt"))]) for _, _, names in os.walk(tmp))
+        with open(os.path.join(tmp, MANIFEST_NAME)) as manifest:
+            records = [json.loads(line) for line in manifest]
+        paired = sum(os.path.splitext(r["image"])[0] == os.path.splitext(r["caption"] or "")[0] for r in records)
+    ok = kept == rounds * files and paired == len(records) == rounds * files // 2
+    print(f"{'✅' if ok else '❌'} same names x{rounds}: kept {kept}/{rounds * files} files, "
+          f"manifest rows {len(records)}, image/caption paired {paired}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200000)
+    parser.add_argument("--rounds", type=int, default=3, help="organize passes with the same file names")
+    args = parser.parse_args()
+    run("legacy", legacy_organize, args.files)
+    run("current", organize_files, args.files)
+    sys.exit(0 if run_rounds(args.rounds, min(args.files, 2000)) else 1)
@@ -0,0 +1,57 @@
+"""
+프롬프트 / 워크플로우 구성 단계의 요청당 CPU 시간 벤치마크
+
+- uncached: 매 요청마다 PromptSet.json 과 워크플로우 템플릿을 다시 파싱 (기존 방식)
+- cached: MtimeCache + patch_node 를 사용하는 현재 방식
+
+실행 (저장소 루트에서): python -m benchmarks.bench_prompt_build --requests 2000
+"""
+import argparse
+import json
+import time
+
+from app.model import GenerateRequest
+from app.prompt_util import generate_prompt, load_prompt_set
+from app.workflow_builder import WORKFLOW_TEMPLATE_PATH, build_workflow
+
+PROMPT_SETS = [
+    "ellie/bustShot/PromptSet.json",
+    "ellie/smile/front_PromptSet.json",
+    "ryder/angry/left_three_quarter_PromptSet.json",
+]
+
+
+def _uncached(req, filename):
+    with open(f"data/{filename}", "r", encoding="utf-8") as f:
+        prompt_set = json.load(f)
+    prompt = generate_prompt(prompt_set)
+    with open(WORKFLOW_TEMPLATE_PATH, "r", encoding="utf-8") as f:
+        workflow = json.load(f)
+    workflow["192"]["inputs"]["text"] = prompt
+    workflow["136"]["inputs"]["filename_prefix"] = req.trigger_word
+    workflow["189"]["inputs"]["prefix"] = req.trigger_word
+    workflow["190"]["inputs"]["file"] = f"{req.trigger_word}_{req.index:05d}_.txt"
+    workflow["142"]["inputs"]["image"] = "bustShot_fh_ellie.png [output]"
+    return workflow
+
+
+def _cached(req, filename):
+    prompt = generate_prompt(load_prompt_set(filename))
+    return build_workflow(req, prompt, "bustShot_fh_ellie.png")
+
+
+def run(name, build, requests):
+    reqs = [GenerateRequest(trigger_word="fh_ellie", character_name="ellie", index=i) for i in range(requests)]
+    start = time.process_time()
+    for i, req in enumerate(reqs):
+        build(req, PROMPT_SETS[i % len(PROMPT_SETS)])
+    elapsed = time.process_time() - start
+    print(f"{name:<9} {elapsed / requests * 1e6:8.1f} us/request (cpu)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    run("uncached", _uncached, args.requests)
+    run("cached", _cached, args.requests)
@@ -0,0 +1,88 @@
+"""
+프롬프트 번들 벤치마크
+
+data/ 의 캐릭터를 복제해 합성 data 트리(기본 300 캐릭터)를 만들고 다음을 비교합니다.
+- 컴파일: 처음 빌드 / 변경 없음 / 파일 하나 수정 후 다시 빌드
+- 시작: 번들 로드 시간
+- 요청당 프롬프트 결정 (서비스와 같은 경로: load_prompt_set + PlannerCache, 처음 한 번씩 읽은 뒤 측정):
+  files 는 번들 없이 data/ 의 파일 (없는 번들 stat + 프롬프트셋 파일 stat),
+  bundle 은 번들 (번들 파일 stat + 원본 파일 stat). 둘 다 조회마다 stat 두 번이라 요청당 시간은 비슷함.
+  번들의 이점은 시작 시 파일 하나만 읽는 것과 파일 없는 표정/앵글 조합
+
+실행 (저장소 루트에서): python -m benchmarks.bench_prompt_bundle --characters 300 --requests 20000
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from app import prompt_util
+from app.prompt_bundle import PromptBundle, compile_bundle
+from app.prompt_planner import PlannerCache
+from create_expression_prompts import ANGLES, EXPRESSIONS
+
+SOURCE_CHARACTERS = ["ellie", "ryder", "bunta", "lazie", "yuuma", "yui"]
+
+
+def make_tree(root: Path, characters: int):
+    for i in range(characters):
+        shutil.copytree(Path("data") / SOURCE_CHARACTERS[i % len(SOURCE_CHARACTERS)], root / f"char{i:04d}")
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def per_request(data_dir: Path, bundle_path: Path, picks) -> float:
+    """load_prompt_set + PlannerCache 로 picks 의 프롬프트를 정하는 데 걸린 요청당 시간 (초)"""
+    prompt_util.PROMPT_DATA_DIR, prompt_util.PROMPT_BUNDLE_PATH = data_dir, bundle_path
+    prompt_util.prompt_set_cache.clear()
+    prompt_util.prompt_bundle_cache.clear()
+    planners = PlannerCache()
+    for name in set(picks):
+        planners.get(name, prompt_util.load_prompt_set(name), "v1", "uniform")
+    start = time.perf_counter()
+    for i, name in enumerate(picks):
+        planners.get(name, prompt_util.load_prompt_set(name), "v1", "uniform").prompt(i)
+    return (time.perf_counter() - start) / len(picks)
+
+
+def main(characters, requests):
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir, bundle_path = Path(tmp) / "data", Path(tmp) / "prompt_bundle.json"
+        make_tree(data_dir, characters)
+
+        elapsed, result = _timed(lambda: compile_bundle(data_dir, bundle_path, EXPRESSIONS, ANGLES))
+        print(f"compile (cold)      {elapsed:8.3f}s  sets {result['sets']}  strings {result['strings']}  "
+              f"{result['bytes'] / 1024:.0f} KiB")
+        elapsed, result = _timed(lambda: compile_bundle(data_dir, bundle_path, EXPRESSIONS, ANGLES))
+        print(f"compile (no change) {elapsed:8.3f}s  rebuilt {len(result['rebuilt'])}  written {result['written']}")
+        (data_dir / "char0000" / "bustShot" / "PromptSet.json").write_text(
+            (data_dir / "char0001" / "bustShot" / "PromptSet.json").read_text(encoding="utf-8"), encoding="utf-8")
+        elapsed, result = _timed(lambda: compile_bundle(data_dir, bundle_path, EXPRESSIONS, ANGLES))
+        print(f"compile (1 edited)  {elapsed:8.3f}s  rebuilt {len(result['rebuilt'])}  written {result['written']}")
+
+        elapsed, bundle = _timed(lambda: PromptBundle.load(bundle_path))
+        print(f"bundle load         {elapsed:8.3f}s")
+
+        names = [name for name in bundle.names() if (data_dir / name).exists()]
+        rng = random.Random(0)
+        picks = [rng.choice(names) for _ in range(requests)]
+
+        files = per_request(data_dir, Path(tmp) / "no_bundle.json", picks)
+        bundled = per_request(data_dir, bundle_path, picks)
+
+        print(f"\nper request over {requests} requests ({len(names)} prompt sets, load_prompt_set + PlannerCache)")
+        print(f"  files   {files * 1e6:8.1f} us/request")
+        print(f"  bundle  {bundled * 1e6:8.1f} us/request  (x{files / bundled:.2f})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--characters", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.characters, args.requests)
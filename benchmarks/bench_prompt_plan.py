@@ -0,0 +1,65 @@
+"""
+프롬프트 조합 계획 벤치마크
+
+- legacy: 작업마다 random.Random(seed) 로 generate_prompt (기존 방식, 중복/편중을 사후에만 알 수 있음)
+- random / uniform / stratified / latin_hypercube: PromptPlanner 로 N 개를 한 번에 계획
+
+방식별 소요 시간, 고유 조합 수, 카테고리별 사용 횟수의 최소/최대를 출력합니다.
+
+실행 (저장소 루트에서): python -m benchmarks.bench_prompt_plan --plans 1000000
+"""
+import argparse
+import random
+import time
+from collections import Counter
+
+from app.prompt_planner import PLAN_STRATEGIES, PromptPlanner
+from app.prompt_util import derive_seed, generate_prompt, load_prompt_set
+
+PROMPT_SETS = [
+    "ellie/smile/front_PromptSet.json",
+    "yuuma/closeup/PromptSet.json",
+]
+# legacy 는 느리므로 이 개수까지만 실행
+LEGACY_LIMIT = 100000
+
+
+def _legacy(prompt_set, count):
+    prompts = Counter()
+    for index in range(count):
+        prompts[generate_prompt(prompt_set, rng=random.Random(derive_seed("ellie", "expression", index)))] += 1
+    return len(prompts)
+
+
+def _format(balance):
+    return " ".join(f"{low}-{high}" for low, high in balance)
+
+
+def main(plans):
+    for filename in PROMPT_SETS:
+        prompt_set = load_prompt_set(filename)
+        space = PromptPlanner(prompt_set, 0).space
+        print(f"\n{filename} (조합 공간 {space})")
+
+        count = min(plans, LEGACY_LIMIT)
+        start = time.perf_counter()
+        unique = _legacy(prompt_set, count)
+        elapsed = time.perf_counter() - start
+        print(f"  {'legacy':<16} {count:>9} plans {elapsed:7.3f}s  unique {unique:>9}")
+
+        for strategy in PLAN_STRATEGIES:
+            start = time.perf_counter()
+            planner = PromptPlanner(prompt_set, 1234, strategy, block_size=plans)
+            plan = planner.plan(plans)
+            elapsed = time.perf_counter() - start
+            coverage = planner.coverage(plan)
+            balance = [(category["min"], category["max"]) for category in coverage["categories"]]
+            print(f"  {strategy:<16} {plans:>9} plans {elapsed:7.3f}s  unique {coverage['unique']:>9}  "
+                  f"category min-max: {_format(balance)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--plans", type=int, default=1000000)
+    args = parser.parse_args()
+    main(args.plans)
@@ -0,0 +1,169 @@
+"""
+참조 이미지 사전 축소 캐시 벤치마크 (GPU 없이 Pillow 로 측정)
+
+합성 참조 이미지(PNG)를 만들고, 작업마다 ComfyUI 가 하는 참조 이미지 처리를 흉내 냅니다.
+- legacy: 원본 PNG 읽기 + 디코딩 + RGB 변환 + FluxKontextImageScale (가운데 자르기, Lanczos)
+- cached: ReferenceCache 의 사전 축소본(PPM) 읽기 + 디코딩 (축소 없음)
+
+이어서 가짜 ComfyUI 와 app.main:app 을 REFERENCE_CACHE_ENABLED = True 로 띄워 /jobs 로 샷 타입/표정 작업을
+(단일/배치 워크플로우 모두) 보내고 다음을 확인합니다. 하나라도 어긋나면 종료 코드 1.
+- 모든 작업 완료 (가짜 ComfyUI 는 LoadImageOutput 이 읽을 축소본이 output 폴더에 없으면 /prompt 를 400 으로 거절)
+- 모든 작업이 축소본을 쓰고 (원본으로 대체 없음) 같은 내용의 참조 이미지는 축소본 하나를 재사용, 끝나면 pin 이 모두 풀림
+- 축소본을 Pillow 로 열면 Kontext 해상도
+
+실행 (저장소 루트에서): python -m benchmarks.bench_reference_cache --images 8 --jobs 200
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from app.reference_cache import ASSET_SUBDIR, PREFERRED_KONTEXT_RESOLUTIONS, ReferenceCache, prescale
+from benchmarks import bench_captions, bench_scheduler
+from benchmarks.bench_captions import _wait_all
+from benchmarks.bench_scheduler import Checks
+from benchmarks.bench_service import API_PORT, COMFY_PORT, _prepare_inputs, _serve_api, _wait_ready
+from benchmarks.fake_comfyui import FakeComfyConfig, parse_latency, serve
+
+# 합성 원본 이미지 크기 (너비, 높이)
+SOURCE_SIZES = [(2048, 1536), (1536, 2048), (1920, 1080), (1600, 1600)]
+
+
+def make_images(root, count):
+    rng = np.random.default_rng(0)
+    names = []
+    for i in range(count):
+        width, height = SOURCE_SIZES[i % len(SOURCE_SIZES)]
+        # 실제 그림처럼 압축되도록 부드러운 그라디언트 + 약한 노이즈
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        base = np.stack([(x + y) / 2, np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width))], axis=-1)
+        pixels = np.clip(base + rng.normal(0, 4, base.shape), 0, 255).astype(np.uint8)
+        name = f"ref_{i:03d}.png"
+        Image.fromarray(pixels).save(os.path.join(root, name))
+        names.append(name)
+    return names
+
+
+def _to_tensor(image):
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def legacy_job(root, name):
+    with Image.open(os.path.join(root, name)) as image:
+        return _to_tensor(prescale(image))
+
+
+def cached_job(root, asset):
+    with Image.open(os.path.join(root, asset)) as image:
+        return _to_tensor(image.convert("RGB"))
+
+
+def main(images, jobs):
+    with tempfile.TemporaryDirectory() as root:
+        names = make_images(root, images)
+        source_bytes = sum(os.path.getsize(os.path.join(root, name)) for name in names)
+
+        start = time.perf_counter()
+        for i in range(jobs):
+            legacy_job(root, names[i % images])
+        legacy = time.perf_counter() - start
+
+        cache = ReferenceCache(root, max_bytes=1 << 40)
+        start = time.perf_counter()
+        assets = [cache.prepare(name) for name in names]
+        warm = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(jobs):
+            asset = cache.prepare(names[i % images])
+            cached_job(root, asset)
+            cache.release(asset)
+        cached = time.perf_counter() - start
+        asset_bytes = cache.stats()["bytes"]
+
+        same = np.abs(legacy_job(root, names[0]) - cached_job(root, assets[0])).max()
+        print(f"legacy  {jobs} jobs: {legacy:6.2f}s ({legacy / jobs * 1000:6.1f} ms/job), "
+              f"avg source {source_bytes / images / 1e6:.1f} MB")
+        print(f"cached  {jobs} jobs: {cached:6.2f}s ({cached / jobs * 1000:6.1f} ms/job), "
+              f"avg asset {asset_bytes / images / 1e6:.1f} MB, one-time prescale {warm:.2f}s")
+        print(f"max pixel difference: {same:.4f}")
+
+        # 예산을 축소본 절반으로 줄이면 가장 오래 쓰지 않은 것부터 지워짐
+        shutil.rmtree(cache.directory)
+        budget = ReferenceCache(root, max_bytes=asset_bytes // 2)
+        for name in names:
+            budget.release(budget.prepare(name))
+        print(f"LRU with half budget: {budget.stats()}")
+
+
+def check_service(args, checks: Checks):
+    """REFERENCE_CACHE_ENABLED = True 로 서비스를 띄워 /jobs 로 작업을 보냄 (배치 크기 1, 2)"""
+    for batch_size in (1, 2):
+        workdir = Path(tempfile.mkdtemp(prefix="bench_reference_cache_"))
+        root = workdir / "output"
+        root.mkdir()
+        _prepare_inputs(root, [bench_captions.CHARACTER], ["smile"], [bench_captions.ANGLE])
+        config = FakeComfyConfig(output_dir=root, node_latency=parse_latency(args.latency), seed=0)
+        api_url = f"http://127.0.0.1:{API_PORT}"
+        processes = [
+            multiprocessing.Process(target=serve, args=(COMFY_PORT, config), daemon=True),
+            multiprocessing.Process(target=_serve_api, args=(API_PORT, COMFY_PORT, root, 2, batch_size),
+                                    kwargs={"reference_cache": True}, daemon=True),
+        ]
+        for process in processes:
+            process.start()
+        try:
+            _wait_ready(api_url)
+            with httpx.Client(base_url=api_url, timeout=30) as http:
+                run_id = f"bench-{uuid.uuid4().hex[:8]}"
+                payloads = [bench_scheduler._payload(bench_captions.CHARACTER, i, run_id, "normal")
+                            if i % 2 else bench_captions._payload(i, "smile", run_id) for i in range(args.service_jobs)]
+                res = http.post("/jobs", json={"jobs": payloads})
+                res.raise_for_status()
+                statuses = _wait_all(http, res.json()["job_ids"], args.timeout)
+                references = http.get("/cache").json()["references"]
+            done = sum(status["status"] == "done" for status in statuses)
+            errors = {status.get("error") for status in statuses if status["status"] != "done"}
+            checks.check(done == len(payloads), f"축소본 사용 작업 완료 (배치 {batch_size})",
+                         f"{done}/{len(payloads)} {sorted(errors, key=str)[:2]}")
+            # 작업마다 축소본을 한 번씩 준비 (원본 대체 없음), 같은 내용의 참조 이미지는 축소본 하나를 공유
+            checks.check(references["hits"] + references["misses"] == len(payloads)
+                         and references["misses"] == references["assets"] and not references["pinned"],
+                         f"축소본 재사용 (배치 {batch_size})", f"{references}")
+            sizes = set()
+            for asset in (root / ASSET_SUBDIR).glob("*.ppm"):
+                with Image.open(asset) as image:
+                    sizes.add(image.size)
+            checks.check(bool(sizes) and sizes <= set(PREFERRED_KONTEXT_RESOLUTIONS), f"축소본 해상도 (배치 {batch_size})",
+                         f"{sorted(sizes)}")
+        finally:
+            # API 서버를 먼저 종료 (가짜 ComfyUI 가 먼저 내려가면 재연결을 시도함)
+            for process in reversed(processes):
+                process.terminate()
+            for process in processes:
+                process.join()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--service-jobs", type=int, default=20, help="jobs sent through /jobs with the cache enabled")
+    parser.add_argument("--latency", nargs="*", default=["KSampler=0.01"], metavar="NODE=SECONDS")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+    main(args.images, args.jobs)
+    checks = Checks()
+    check_service(args, checks)
+    print("통과" if not checks.failed else f"실패 {checks.failed}건")
+    sys.exit(1 if checks.failed else 0)
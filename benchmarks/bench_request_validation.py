@@ -0,0 +1,84 @@
+"""
+요청 검증 확인 (GPU 없이 가짜 ComfyUI 사용)
+
+가짜 ComfyUI 와 app.main:app 을 새 프로세스로 띄우고 잘못된 값이 들어간 작업 묶음이
+500 으로 묶음 전체를 실패시키지 않고 422 로 거절되는지, 경계값은 받아서 끝까지 처리되는지 확인합니다.
+- seed: -1, SEED_MASK + 1, 2^63 은 422 / 0, SEED_MASK 는 접수 후 완료 (응답 seed 가 그대로여야 함)
+
+하나라도 어긋나면 종료 코드 1.
+
+실행 (저장소 루트에서): python -m benchmarks.bench_request_validation
+"""
+import argparse
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import httpx
+
+from app.prompt_util import SEED_MASK
+from benchmarks.bench_captions import _wait_all
+from benchmarks.bench_scheduler import Checks, _payload
+from benchmarks.bench_service import API_PORT, COMFY_PORT, _prepare_inputs, _serve_api, _wait_ready
+from benchmarks.fake_comfyui import FakeComfyConfig, parse_latency, serve
+
+CHARACTER = "ellie"
+REJECTED_SEEDS = (-1, SEED_MASK + 1, 1 << 63)
+ACCEPTED_SEEDS = (0, SEED_MASK)
+
+
+def run(args, http: httpx.Client, checks: Checks):
+    run_id = f"bench-{uuid.uuid4().hex[:8]}"
+    for seed in REJECTED_SEEDS:
+        res = http.post("/jobs", json={"jobs": [{**_payload(CHARACTER, 0, run_id, "normal"), "seed": seed}]})
+        checks.check(res.status_code == 422, f"seed {seed} 거절", f"HTTP {res.status_code}")
+
+    payloads = [{**_payload(CHARACTER, i, run_id, "normal"), "seed": seed} for i, seed in enumerate(ACCEPTED_SEEDS)]
+    res = http.post("/jobs", json={"jobs": payloads})
+    checks.check(res.status_code == 200, "경계 seed 접수", f"HTTP {res.status_code}")
+    if res.status_code != 200:
+        return
+    statuses = _wait_all(http, res.json()["job_ids"], args.timeout)
+    for seed, status in zip(ACCEPTED_SEEDS, statuses):
+        result = status.get("result") or {}
+        checks.check(status["status"] == "done" and result.get("seed") == seed, f"seed {seed} 생성",
+                     f"상태 {status['status']}, 결과 seed {result.get('seed')}")
+
+
+def main(args):
+    workdir = Path(tempfile.mkdtemp(prefix="bench_request_validation_"))
+    root = workdir / "output"
+    root.mkdir()
+    _prepare_inputs(root, [CHARACTER], [], [])
+    config = FakeComfyConfig(output_dir=root, node_latency=parse_latency(args.latency), seed=0)
+    api_url = f"http://127.0.0.1:{API_PORT}"
+    processes = [
+        multiprocessing.Process(target=serve, args=(COMFY_PORT, config), daemon=True),
+        multiprocessing.Process(target=_serve_api, args=(API_PORT, COMFY_PORT, root, 2, 1), daemon=True),
+    ]
+    for process in processes:
+        process.start()
+    checks = Checks()
+    try:
+        _wait_ready(api_url)
+        with httpx.Client(base_url=api_url, timeout=30) as http:
+            run(args, http, checks)
+    finally:
+        # API 서버를 먼저 종료 (가짜 ComfyUI 가 먼저 내려가면 재연결을 시도함)
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            process.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("통과" if not checks.failed else f"실패 {checks.failed}건")
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", nargs="*", default=["KSampler=0.01"], metavar="NODE=SECONDS")
+    parser.add_argument("--timeout", type=float, default=60)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,179 @@
+"""
+결과 전달 엔드포인트 확인 (GPU 없이 가짜 ComfyUI 사용)
+
+가짜 ComfyUI 와 app.main:app 을 새 프로세스로 띄우고 샷 타입/표정 작업을 섞어 보낸 뒤 다음을 확인합니다.
+1. /jobs/stream: 작업마다 job 이벤트가 한 번씩 오고, result 의 이미지/캡션이 output 폴더에 실제로 저장된 파일 이름이며
+   caption_text 가 캡션 파일 내용과 같아야 함. 마지막 이벤트는 end (끝난 작업 수, 모르는 job_id)
+2. /jobs/archive: tar / zip 을 풀었을 때 파일 목록이 작업 결과와 같고 내용이 output 폴더의 파일과 바이트 단위로 같아야 함
+   (jobs.jsonl 은 작업마다 한 줄)
+3. /files: 결과 파일은 200 으로 같은 내용, output 폴더 밖을 가리키는 .. 경로는 (인코딩 여부와 관계없이) 400
+
+하나라도 어긋나면 종료 코드 1.
+
+실행 (저장소 루트에서): python -m benchmarks.bench_results --jobs 40
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import shutil
+import sys
+import tarfile
+import tempfile
+import uuid
+import zipfile
+from http.client import HTTPConnection
+from pathlib import Path
+
+import httpx
+
+from benchmarks import bench_captions, bench_scheduler
+from benchmarks.bench_captions import _wait_all
+from benchmarks.bench_scheduler import Checks
+from benchmarks.bench_service import API_PORT, COMFY_PORT, _prepare_inputs, _serve_api, _wait_ready
+from benchmarks.fake_comfyui import FakeComfyConfig, parse_latency, serve
+
+CHARACTER = bench_captions.CHARACTER
+EXPRESSIONS = ["smile", "angry"]
+# output 폴더 밖을 가리키는 경로 (그대로 / 슬래시 인코딩 / 점 인코딩)
+TRAVERSALS = ["/files/../../etc/passwd", "/files/..%2F..%2Fetc%2Fpasswd", "/files/%2e%2e/%2e%2e/etc/passwd",
+              "/files/sub/../../../etc/passwd"]
+
+
+def _payloads(jobs: int, run_id: str) -> list:
+    payloads = []
+    for i in range(jobs):
+        if i % 2:
+            payloads.append(bench_captions._payload(i, EXPRESSIONS[i // 2 % len(EXPRESSIONS)], run_id))
+        else:
+            payloads.append(bench_scheduler._payload(CHARACTER, i, run_id, "normal"))
+    return payloads
+
+
+def read_events(http: httpx.Client, job_ids: list, timeout: float) -> list:
+    """/jobs/stream 의 (이벤트 이름, 데이터) 목록 (연결 유지 주석은 건너뜀)"""
+    events, event, data = [], None, []
+    with http.stream("POST", "/jobs/stream", json={"job_ids": job_ids}, timeout=timeout) as res:
+        res.raise_for_status()
+        for line in res.iter_lines():
+            if line.startswith(":"):
+                continue
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data.append(line[len("data: "):])
+            elif not line and event is not None:
+                events.append((event, json.loads("\n".join(data))))
+                event, data = None, []
+    return events
+
+
+def check_stream(http: httpx.Client, root: Path, job_ids: list, args, checks: Checks):
+    unknown = f"missing-{uuid.uuid4().hex[:8]}"
+    events = read_events(http, job_ids + [unknown], args.timeout)
+    jobs = [data for event, data in events if event == "job"]
+    checks.check(sorted(job["job_id"] for job in jobs) == sorted(job_ids), "스트림 작업 이벤트",
+                 f"{len(jobs)}/{len(job_ids)} 작업")
+    checks.check(bool(events) and events[-1] == ("end", {"finished": len(job_ids), "unknown": [unknown]}),
+                 "스트림 end 이벤트", f"마지막 이벤트 {events[-1] if events else None}")
+
+    wrong = []
+    for job in jobs:
+        result = job.get("result") or {}
+        images, caption = result.get("images") or [], result.get("caption")
+        on_disk = [name for name in images + [caption] if name and (root / name).is_file()]
+        caption_text = (root / caption).read_text(encoding="utf-8") if caption in on_disk else None
+        if (job["status"] != "done" or not images or len(on_disk) != len(images) + 1
+                or result.get("image") != images[0] or job.get("caption_text") != caption_text):
+            wrong.append((job["job_id"], job["status"], images, caption))
+    checks.check(not wrong, "스트림 결과 = 저장된 파일", f"{len(jobs) - len(wrong)}/{len(jobs)} 정상 {wrong[:2]}")
+
+
+def _unpack(fmt: str, data: bytes) -> dict:
+    if fmt == "tar":
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            return {member.name: archive.extractfile(member).read() for member in archive.getmembers() if member.isfile()}
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def check_archives(http: httpx.Client, root: Path, job_ids: list, checks: Checks):
+    statuses = bench_scheduler._statuses(http, job_ids)
+    expected = {name for status in statuses for name in (status["result"]["images"] + [status["result"]["caption"]])}
+    for fmt in ("tar", "zip"):
+        res = http.post("/jobs/archive", params={"format": fmt}, json={"job_ids": job_ids})
+        if res.status_code != 200:
+            checks.check(False, f"{fmt} 묶음", f"HTTP {res.status_code}")
+            continue
+        members = _unpack(fmt, res.content)
+        manifest = members.pop("jobs.jsonl", b"").decode("utf-8").splitlines()
+        different = [name for name, data in members.items() if data != (root / name).read_bytes()]
+        checks.check(set(members) == expected and not different and len(manifest) == len(job_ids), f"{fmt} 묶음",
+                     f"파일 {len(members)}/{len(expected)}, 내용 다름 {len(different)}, jobs.jsonl {len(manifest)}줄")
+
+
+def check_files(http: httpx.Client, root: Path, job_ids: list, checks: Checks):
+    result = bench_scheduler._statuses(http, job_ids[:1])[0]["result"]
+    res = http.get(f"/files/{result['image']}")
+    checks.check(res.status_code == 200 and res.content == (root / result["image"]).read_bytes(), "/files 결과 파일",
+                 f"HTTP {res.status_code}")
+    # httpx 는 요청 전에 .. 을 정리하므로 경로를 그대로 보내는 http.client 사용
+    for path in TRAVERSALS:
+        connection = HTTPConnection("127.0.0.1", API_PORT, timeout=10)
+        try:
+            connection.request("GET", path)
+            status = connection.getresponse().status
+        finally:
+            connection.close()
+        checks.check(status == 400, f"/files 경로 거절 {path}", f"HTTP {status}")
+
+
+def run(args, root: Path, http: httpx.Client, checks: Checks):
+    run_id = f"bench-{uuid.uuid4().hex[:8]}"
+    res = http.post("/jobs", json={"jobs": _payloads(args.jobs, run_id)})
+    res.raise_for_status()
+    job_ids = res.json()["job_ids"]
+    # 작업이 도는 동안 스트림을 열어 끝나는 대로 받음
+    check_stream(http, root, job_ids, args, checks)
+    statuses = _wait_all(http, job_ids, args.timeout)
+    done = sum(status["status"] == "done" for status in statuses)
+    checks.check(done == args.jobs, "작업 완료", f"{done}/{args.jobs}")
+    check_archives(http, root, job_ids, checks)
+    check_files(http, root, job_ids, checks)
+
+
+def main(args):
+    workdir = Path(tempfile.mkdtemp(prefix="bench_results_"))
+    root = workdir / "output"
+    root.mkdir()
+    _prepare_inputs(root, [CHARACTER], EXPRESSIONS, [bench_captions.ANGLE])
+    config = FakeComfyConfig(output_dir=root, node_latency=parse_latency(args.latency), seed=0)
+    api_url = f"http://127.0.0.1:{API_PORT}"
+    processes = [
+        multiprocessing.Process(target=serve, args=(COMFY_PORT, config), daemon=True),
+        multiprocessing.Process(target=_serve_api, args=(API_PORT, COMFY_PORT, root, 2, 1), daemon=True),
+    ]
+    for process in processes:
+        process.start()
+    checks = Checks()
+    try:
+        _wait_ready(api_url)
+        with httpx.Client(base_url=api_url, timeout=30) as http:
+            run(args, root, http, checks)
+    finally:
+        # API 서버를 먼저 종료 (가짜 ComfyUI 가 먼저 내려가면 재연결을 시도함)
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            process.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("통과" if not checks.failed else f"실패 {checks.failed}건")
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--latency", nargs="*", default=["KSampler=0.05"], metavar="NODE=SECONDS")
+    parser.add_argument("--timeout", type=float, default=120)
+    sys.exit(main(parser.parse_args()))
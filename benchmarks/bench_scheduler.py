@@ -0,0 +1,205 @@
+"""
+대기열 스케줄러 벤치마크 (우선순위 / 가중 공정 분배 / 대기열 한도 / 취소, GPU 없이 가짜 ComfyUI 사용)
+
+가짜 ComfyUI 와 app.main:app 을 새 프로세스로 띄우고 다음을 차례로 확인합니다.
+1. 부하: 두 테넌트(bulk-a, bulk-b)가 low 우선순위로 대량 작업을 쌓음 (bulk-b 가중치 2배)
+2. 우선순위: 대량 작업이 쌓인 상태에서 다른 캐릭터의 high 작업을 하나씩 보내고 지연 시간을 잼
+   -> high p95 가 --max-high-p95 이하여야 함 (FIFO 였다면 앞의 대량 작업이 모두 끝나야 처리됨)
+3. 공정 분배: 그동안 끝난 대량 작업 중 bulk-b 의 비율이 가중치 비율(2/3)에 가까워야 함
+4. 대기열 한도: low 한도를 넘는 작업 묶음은 429 + Retry-After, high 작업은 그대로 접수
+5. 취소: 남은 대량 작업을 /jobs/cancel 로 취소 -> 모두 cancelled 상태,
+   ComfyUI 큐에서 지워지고 실행 중이던 것은 중단되어 이후 실행 수가 늘지 않아야 함
+
+하나라도 어긋나면 종료 코드 1.
+
+실행 (저장소 루트에서): python -m benchmarks.bench_scheduler --bulk 600 --high 20 --latency KSampler=0.02
+"""
+import argparse
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+import generate_loop
+from benchmarks.bench_service import API_PORT, COMFY_PORT, _percentile, _prepare_inputs, _serve_api, _wait_ready
+from benchmarks.fake_comfyui import FakeComfyConfig, parse_latency, serve
+
+BULK_CHARACTER = "ellie"
+HIGH_CHARACTER = "ryder"
+TENANT_WEIGHTS = {"bulk-a": 1.0, "bulk-b": 2.0}
+# 작업 상태 확인 주기 (초)
+POLL_INTERVAL = 0.05
+# 취소 후 ComfyUI 실행 수가 멈췄는지 볼 때 기다리는 시간 (초)
+SETTLE_SECONDS = 1.0
+
+
+def _payload(character: str, index: int, run_id: str, priority: str, tenant: str = None) -> dict:
+    return {
+        "generation_mode": "shot_type",
+        "trigger_word": generate_loop.get_trigger_word(character),
+        "character_name": character,
+        "index": index,
+        "run_id": run_id,
+        "priority": priority,
+        "tenant": tenant,
+    }
+
+
+def _submit(http: httpx.Client, payloads) -> list:
+    res = http.post("/jobs", json={"jobs": payloads})
+    res.raise_for_status()
+    return res.json()["job_ids"]
+
+
+def _statuses(http: httpx.Client, job_ids) -> list:
+    statuses = []
+    for start in range(0, len(job_ids), 1000):
+        res = http.post("/jobs/status", json={"job_ids": job_ids[start:start + 1000]})
+        res.raise_for_status()
+        statuses.extend(res.json()["jobs"])
+    return statuses
+
+
+def _wait_finished(http: httpx.Client, job_id: str, timeout: float) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = http.get(f"/jobs/{job_id}").json()
+        if status["status"] in ("done", "failed", "cancelled"):
+            return status
+        time.sleep(POLL_INTERVAL)
+    raise RuntimeError(f"작업이 {timeout}초 안에 끝나지 않았습니다: {job_id}")
+
+
+class Checks:
+    """확인 결과를 모아서 출력"""
+
+    def __init__(self):
+        self.failed = 0
+
+    def check(self, ok: bool, name: str, detail: str):
+        print(f"  {'✅' if ok else '❌'} {name:<28} {detail}")
+        if not ok:
+            self.failed += 1
+
+
+def run(args, http: httpx.Client, comfy: httpx.Client, checks: Checks):
+    run_id = f"bench-{uuid.uuid4().hex[:8]}"
+
+    # 1. 부하: 두 테넌트의 low 대량 작업
+    bulk = {
+        tenant: _submit(http, [_payload(BULK_CHARACTER, i, f"{run_id}-{tenant}", "low", tenant)
+                               for i in range(args.bulk)])
+        for tenant in TENANT_WEIGHTS
+    }
+    print(f"대량 작업 {args.bulk}개 x {len(bulk)} 테넌트 접수 (low)")
+    time.sleep(args.warmup)
+
+    # 2. 우선순위: high 작업을 하나씩 보내고 접수 -> 완료 지연 시간 측정
+    latencies = []
+    for i in range(args.high):
+        job_id = _submit(http, [_payload(HIGH_CHARACTER, i, run_id, "high")])[0]
+        status = _wait_finished(http, job_id, args.timeout)
+        if status["status"] == "done":
+            latencies.append(status["finished_at"] - status["created_at"])
+        time.sleep(args.high_interval)
+    p50, p95 = _percentile(latencies, 0.5), _percentile(latencies, 0.95)
+    queue = http.get("/queue").json()
+    print(f"high 작업 {len(latencies)}/{args.high}개 완료, 대기 중 {queue['pending_by_priority']}")
+    checks.check(len(latencies) == args.high, "high 작업 완료", f"{len(latencies)}/{args.high}")
+    checks.check(p95 is not None and p95 <= args.max_high_p95, "high 지연 p95",
+                 f"p50 {p50 or 0:.3f}s p95 {p95 or 0:.3f}s (한도 {args.max_high_p95}s)")
+
+    # 3. 공정 분배: 대량 작업이 모두 쌓여 있는 동안 끝난 작업의 테넌트 비율
+    done = {tenant: sum(s["status"] == "done" for s in _statuses(http, job_ids)) for tenant, job_ids in bulk.items()}
+    total = sum(done.values())
+    share = done["bulk-b"] / total if total else 0.0
+    expected = TENANT_WEIGHTS["bulk-b"] / sum(TENANT_WEIGHTS.values())
+    checks.check(total > 0 and abs(share - expected) <= args.share_tolerance, "가중 공정 분배",
+                 f"완료 {done}, bulk-b 비율 {share:.2f} (기대 {expected:.2f} ± {args.share_tolerance})")
+
+    # 4. 대기열 한도: low 한도를 넘는 묶음은 거절, high 는 접수
+    # 묶음 하나가 한도보다 크면 대기 중인 작업 수와 상관없이 항상 거절되어야 함 (대기 수를 미리 읽으면 그 사이 줄어듦)
+    overflow = args.low_limit + 1
+    res = http.post("/jobs", json={"jobs": [_payload(BULK_CHARACTER, args.bulk + i, run_id, "low", "bulk-a")
+                                            for i in range(overflow)]})
+    checks.check(res.status_code == 429 and "retry-after" in res.headers, "low 한도 초과 거절",
+                 f"{overflow}개 -> HTTP {res.status_code} Retry-After {res.headers.get('retry-after')}")
+    res = http.post("/jobs", json={"jobs": [_payload(HIGH_CHARACTER, args.high, run_id, "high")]})
+    checks.check(res.status_code == 200, "high 는 한도 없이 접수", f"HTTP {res.status_code}")
+
+    # 5. 취소: 남은 대량 작업을 모두 취소
+    job_ids = [job_id for job_ids in bulk.values() for job_id in job_ids]
+    before = comfy.get("/fake/stats").json()
+    res = http.post("/jobs/cancel", json={"job_ids": job_ids}).json()
+    time.sleep(SETTLE_SECONDS)
+    statuses = _statuses(http, job_ids)
+    after_settle = comfy.get("/fake/stats").json()
+    time.sleep(SETTLE_SECONDS)
+    after = comfy.get("/fake/stats").json()
+    cancelled = set(res["cancelled"])
+    wrong = [s for s in statuses if s["job_id"] in cancelled and s["status"] != "cancelled"]
+    checks.check(not wrong and len(cancelled) + len(res["finished"]) == len(job_ids), "대기/전송 작업 취소",
+                 f"취소 {len(cancelled)}, 이미 끝남 {len(res['finished'])}, 상태 불일치 {len(wrong)}")
+    # 취소 시점에 ComfyUI 에 올라가 있던 작업(최대 queue_depth 개)만 마저 끝날 수 있음
+    checks.check(after_settle["executed"] - before["executed"] <= args.queue_depth
+                 and after["executed"] == after_settle["executed"] and after["pending"] == 0,
+                 "ComfyUI 측 취소",
+                 f"취소 후 실행 {after['executed'] - before['executed']}, 큐 삭제 {after['deleted'] - before['deleted']}, "
+                 f"중단 {after['interrupted'] - before['interrupted']}, 남은 큐 {after['pending']}")
+    print(f"API 대기열: {http.get('/queue').json()['pending_by_priority']}")
+
+
+def main(args):
+    workdir = Path(tempfile.mkdtemp(prefix="bench_scheduler_"))
+    root = workdir / "output"
+    root.mkdir()
+    _prepare_inputs(root, [BULK_CHARACTER, HIGH_CHARACTER], [], [])
+    config = FakeComfyConfig(output_dir=root, node_latency=parse_latency(args.latency),
+                             latency_jitter=args.jitter, workers=args.gpus, seed=args.seed)
+    admission_limits = {"high": None, "normal": None, "low": args.low_limit}
+    api_url = f"http://127.0.0.1:{API_PORT}"
+    processes = [
+        multiprocessing.Process(target=serve, args=(COMFY_PORT, config), daemon=True),
+        multiprocessing.Process(target=_serve_api, args=(API_PORT, COMFY_PORT, root, args.queue_depth, 1,
+                                                         TENANT_WEIGHTS, admission_limits), daemon=True),
+    ]
+    for process in processes:
+        process.start()
+    checks = Checks()
+    try:
+        _wait_ready(api_url)
+        with httpx.Client(base_url=api_url, timeout=30) as http, \
+                httpx.Client(base_url=f"http://127.0.0.1:{COMFY_PORT}", timeout=10) as comfy:
+            run(args, http, comfy, checks)
+    finally:
+        # API 서버를 먼저 종료 (가짜 ComfyUI 가 먼저 내려가면 재연결을 시도함)
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            process.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("통과" if not checks.failed else f"실패 {checks.failed}건")
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bulk", type=int, default=600, help="low priority jobs per bulk tenant")
+    parser.add_argument("--high", type=int, default=20, help="high priority jobs sent one at a time under load")
+    parser.add_argument("--high-interval", type=float, default=0.1)
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of bulk-only load before high jobs")
+    parser.add_argument("--max-high-p95", type=float, default=2.0, help="seconds")
+    parser.add_argument("--share-tolerance", type=float, default=0.1)
+    parser.add_argument("--low-limit", type=int, default=2000)
+    parser.add_argument("--queue-depth", type=int, default=2)
+    parser.add_argument("--latency", nargs="*", default=["KSampler=0.02"], metavar="NODE=SECONDS")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--gpus", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,333 @@
+"""
+API 서버 처리량 / 지연 시간 벤치마크 (GPU 없이 가짜 ComfyUI 사용)
+
+시나리오(shot_type, expression, both)와 동시성 수준마다 가짜 ComfyUI(benchmarks.fake_comfyui)와
+app.main:app 을 새 프로세스로 띄우고 작업을 보냅니다. 동시성 수준 = ComfyUI 에 동시에 올리는 작업 수
+(COMFYUI_QUEUE_DEPTH, JobManager 워커 수)
+
+- loop: generate_loop.run_generation 으로 /jobs 에 전송하고 완료까지 대기 (기본)
+  --download 이면 완료된 결과를 /files 로 내려받음 (다른 머신의 클라이언트)
+- sync: 동시성 수준만큼의 클라이언트가 /generateDataset 을 호출
+
+입력 이미지는 임시 폴더에 만들고, 매 실행마다 run_id 를 새로 정해 결과 캐시가 적중하지 않게 합니다.
+결과(images/min, 작업 지연 p50/p95/p99, 단계별 평균 시간)를 표로 출력하고 --output 에 JSON 으로 저장합니다.
+JSON 에는 git 커밋이 기록되므로 --compare 로 다른 커밋의 결과와 비교할 수 있습니다.
+
+실행 (저장소 루트에서):
+  python -m benchmarks.bench_service --scenarios shot_type expression both --concurrency 1 2 4 \
+      --output bench_service_$(git rev-parse --short HEAD).json --compare bench_service_<이전 커밋>.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import re
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import List, Union
+
+import httpx
+from PIL import Image
+
+import generate_loop
+from benchmarks.fake_comfyui import FakeComfyConfig, parse_latency, serve
+
+SCENARIOS = ("shot_type", "expression", "both")
+COMFY_PORT = 19000
+API_PORT = 18000
+# 서버 프로세스가 응답할 때까지 기다리는 최대 시간 (초)
+STARTUP_TIMEOUT = 30
+# 가짜 참조 이미지 크기 (실제 캐릭터 시트와 비슷한 세로형)
+REFERENCE_SIZE = (832, 1216)
+
+SHOT_TYPES = ("closeup", "bustShot", "kneeShot")
+_METRIC_LINE = re.compile(r'^comfy_api_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+
+def _prepare_inputs(root: Path, characters, expressions, angles):
+    """shot_type 참조 이미지({샷}_{트리거}.png)와 표정 모드 입력 이미지({캐릭터}/bustShot/{표정}/{앵글}/*.png)"""
+    image = Image.effect_noise(REFERENCE_SIZE, 64).convert("RGB")
+    for char in characters:
+        trigger_word = generate_loop.get_trigger_word(char)
+        for shot_type in SHOT_TYPES:
+            image.save(root / f"{shot_type}_{trigger_word}.png")
+        for expression in expressions:
+            for angle in angles:
+                directory = root / char / "bustShot" / expression / angle
+                directory.mkdir(parents=True, exist_ok=True)
+                image.save(directory / "ref_0.png")
+
+
+def _serve_api(port: int, comfy_port: Union[int, List[int]], root: Path, queue_depth: int, batch_size: int,
+               weights: dict = None, admission_limits: dict = None, reference_cache: bool = None):
+    """
+    app.main 의 경로/서버 설정을 벤치마크용으로 바꿔서 실행 (별도 프로세스)
+    comfy_port 에 포트 목록을 주면 가짜 ComfyUI 여러 대를 서버 풀에 등록 (이름 fake0, fake1, ...)
+    weights / admission_limits / reference_cache 가 None 이면 app.main 의 TENANT_WEIGHTS / ADMISSION_LIMITS /
+    REFERENCE_CACHE_ENABLED 사용
+    """
+    import uvicorn
+    import app.main as api
+    from app.backend_pool import BackendPool
+    from app.job_manager import JobManager
+    from app.result_cache import ResultCache
+
+    # 주입한 실패 등의 로그가 결과 표를 가리지 않도록 함
+    logging.getLogger().setLevel(logging.CRITICAL)
+    api.COMFYUI_INPUT_DIR = root
+    api.image_catalog.root = root
+    api.reference_cache.root = root
+    if reference_cache is not None:
+        api.REFERENCE_CACHE_ENABLED = reference_cache
+    api.result_cache = ResultCache(root / "cache" / "results")
+    ports = [comfy_port] if isinstance(comfy_port, int) else list(comfy_port)
+    api.backend_pool = BackendPool([{
+        "name": "fake" if len(ports) == 1 else f"fake{i}",
+        "base_url": f"http://127.0.0.1:{port}", "ws_url": f"ws://127.0.0.1:{port}/ws",
+        "max_queue_depth": queue_depth,
+    } for i, port in enumerate(ports)])
+    api.job_manager = JobManager(api.run_jobs, queue_depth=api.backend_pool.capacity, batch_size=batch_size,
+                                 weights=api.TENANT_WEIGHTS if weights is None else weights,
+                                 admission_limits=api.ADMISSION_LIMITS if admission_limits is None else admission_limits,
+                                 canceller=api.cancel_submitted)
+    uvicorn.run(api.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _wait_ready(api_url: str):
+    """API 서버가 뜨고 가짜 ComfyUI 에 연결될 때까지 대기"""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            queue = httpx.get(f"{api_url}/queue", timeout=1).json()
+            if all(backend["healthy"] for backend in queue["backends"]):
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"서버가 {STARTUP_TIMEOUT}초 안에 준비되지 않았습니다: {api_url}")
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _stage_means(metrics_text: str):
+    """/metrics 의 comfy_api_stage_seconds 에서 단계별 평균 시간 (밀리초)"""
+    sums, counts = {}, {}
+    for line in metrics_text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            (sums if kind == "sum" else counts)[stage] = float(value)
+    return {stage: round(sums[stage] / counts[stage] * 1000, 3) for stage in sorted(sums) if counts.get(stage)}
+
+
+def _configure_loop(args, api_url: str, workdir: Path):
+    generate_loop.JOBS_URL = f"{api_url}/jobs"
+    generate_loop.QUEUE_URL = f"{api_url}/queue"
+    generate_loop.FILES_URL = f"{api_url}/files"
+    generate_loop.API_URL = f"{api_url}/generateDataset"
+    generate_loop.LEDGER_PATH = str(workdir / "ledger.db")
+    generate_loop.POLL_INTERVAL = args.poll_interval
+    generate_loop.RETRY_BACKOFF = args.retry_backoff
+    generate_loop.SHOT_TYPE_CHARACTERS = args.characters
+    generate_loop.NUM_SAMPLES_PER_SHOT_TYPE = args.shot_samples
+    generate_loop.EXPRESSION_CHARACTERS = args.characters
+    generate_loop.EXPRESSIONS = args.expressions
+    generate_loop.ANGLES = args.angles
+    generate_loop.NUM_SAMPLES_PER_EXPRESSION = args.expression_samples
+    generate_loop.SEED_RUN_ID = f"bench-{uuid.uuid4().hex[:8]}"
+    # 결과를 /files 로 내려받는 원격 클라이언트 흉내 (NFS 없이 실행)
+    generate_loop.DOWNLOAD_DIR = str(workdir / "downloads") if args.download else None
+
+
+def _drive_loop(scenario: str, api_url: str, workdir: Path):
+    """generate_loop 로 전체 작업을 보내고 원장에 기록된 job_id 의 서버 측 지연 시간을 모읍니다."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_loop.run_generation(scenario)
+    with sqlite3.connect(workdir / "ledger.db") as db:
+        job_ids = [row[0] for row in db.execute("SELECT job_id FROM jobs WHERE job_id IS NOT NULL")]
+    statuses = []
+    for start in range(0, len(job_ids), 1000):
+        res = httpx.post(f"{api_url}/jobs/status", json={"job_ids": job_ids[start:start + 1000]}, timeout=30)
+        statuses.extend(res.json()["jobs"])
+    done = [s for s in statuses if s["status"] == "done"]
+    latencies = [s["finished_at"] - s["created_at"] for s in done if s.get("finished_at")]
+    return len(done), len(statuses) - len(done), latencies
+
+
+async def _drive_sync(scenario: str, api_url: str, clients: int):
+    """clients 개의 클라이언트가 작업을 나눠서 /generateDataset 을 순서대로 호출합니다."""
+    payloads = list(generate_loop.plan_jobs(scenario))
+    latencies, failed = [], 0
+
+    async def client_loop(http, chunk):
+        nonlocal failed
+        for payload in chunk:
+            start = time.perf_counter()
+            try:
+                res = await http.post(f"{api_url}/generateDataset", json=payload)
+                res.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                failed += 1
+
+    async with httpx.AsyncClient(timeout=generate_loop.JOB_DEADLINE) as http:
+        await asyncio.gather(*(client_loop(http, payloads[i::clients]) for i in range(clients)))
+    return len(latencies), failed, latencies
+
+
+def run_case(args, scenario: str, concurrency: int) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="bench_service_"))
+    root = workdir / "output"
+    root.mkdir()
+    _prepare_inputs(root, args.characters, args.expressions, args.angles)
+    config = FakeComfyConfig(output_dir=root, node_latency=parse_latency(args.latency),
+                             latency_jitter=args.jitter, failure_rate=args.failure_rate,
+                             workers=args.gpus, seed=args.seed)
+    api_url = f"http://127.0.0.1:{API_PORT}"
+    comfy_url = f"http://127.0.0.1:{COMFY_PORT}"
+    processes = [
+        multiprocessing.Process(target=serve, args=(COMFY_PORT, config), daemon=True),
+        multiprocessing.Process(target=_serve_api, args=(API_PORT, COMFY_PORT, root, concurrency, args.batch_size),
+                                kwargs={"reference_cache": args.reference_cache}, daemon=True),
+    ]
+    for process in processes:
+        process.start()
+    try:
+        _wait_ready(api_url)
+        _configure_loop(args, api_url, workdir)
+        start = time.perf_counter()
+        if args.driver == "loop":
+            done, failed, latencies = _drive_loop(scenario, api_url, workdir)
+        else:
+            done, failed, latencies = asyncio.run(_drive_sync(scenario, api_url, concurrency))
+        elapsed = time.perf_counter() - start
+        stages = _stage_means(httpx.get(f"{api_url}/metrics", timeout=10).text)
+        comfy = httpx.get(f"{comfy_url}/fake/stats", timeout=10).json()
+    finally:
+        # API 서버를 먼저 종료 (가짜 ComfyUI 가 먼저 내려가면 재연결을 시도함)
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            process.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "driver": args.driver,
+        "jobs": done + failed,
+        "done": done,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "images_per_min": round(done / elapsed * 60, 1) if elapsed else 0.0,
+        "latency_p50": _round(_percentile(latencies, 0.5)),
+        "latency_p95": _round(_percentile(latencies, 0.95)),
+        "latency_p99": _round(_percentile(latencies, 0.99)),
+        "latency_mean": _round(statistics.fmean(latencies) if latencies else None),
+        "comfy_executed": comfy["executed"],
+        "comfy_failed": comfy["failed"],
+        "stage_mean_ms": stages,
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def _git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def _print_result(result: dict, baseline: dict = None):
+    line = (f"  {result['scenario']:<11} c={result['concurrency']:<3} {result['done']:>5}/{result['jobs']:<5} "
+            f"{result['seconds']:8.2f}s {result['images_per_min']:9.1f} img/min  "
+            f"p50 {_fmt(result['latency_p50'])} p95 {_fmt(result['latency_p95'])} p99 {_fmt(result['latency_p99'])}")
+    if baseline:
+        line += (f"  | img/min {_delta(result['images_per_min'], baseline['images_per_min'])}"
+                 f" p95 {_delta(result['latency_p95'], baseline['latency_p95'])}")
+    print(line)
+
+
+def _fmt(seconds):
+    return f"{seconds:7.3f}s" if seconds is not None else "      -"
+
+
+def _delta(value, base):
+    if value is None or not base:
+        return "-"
+    return f"{(value - base) / base * 100:+.1f}%"
+
+
+def main(args):
+    baselines = {}
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        baselines = {(r["scenario"], r["concurrency"], r.get("driver", "loop")): r for r in previous["results"]}
+        print(f"비교 기준: {args.compare} (commit {previous.get('commit')})")
+
+    commit = _git_commit()
+    print(f"commit {commit}  driver={args.driver}  gpus={args.gpus}  batch_size={args.batch_size}  "
+          f"failure_rate={args.failure_rate}")
+    results = []
+    for scenario in args.scenarios:
+        for concurrency in args.concurrency:
+            result = run_case(args, scenario, concurrency)
+            results.append(result)
+            _print_result(result, baselines.get((scenario, concurrency, args.driver)))
+
+    if args.output:
+        report = {
+            "commit": commit,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"결과 저장: {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--driver", choices=("loop", "sync"), default="loop")
+    parser.add_argument("--characters", nargs="+", default=["ellie", "ryder", "bunta"])
+    parser.add_argument("--expressions", nargs="+", default=["smile", "angry", "sad"])
+    parser.add_argument("--angles", nargs="+", default=["front", "left_three_quarter", "right_three_quarter"])
+    parser.add_argument("--shot-samples", type=int, default=30)
+    parser.add_argument("--expression-samples", type=int, default=3)
+    parser.add_argument("--latency", nargs="*", default=[], metavar="NODE=SECONDS",
+                        help="fake ComfyUI per-node-type execution time, e.g. KSampler=0.5")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--gpus", type=int, default=1, help="prompts the fake ComfyUI executes at once")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--download", action="store_true", help="loop driver downloads results through /files")
+    parser.add_argument("--reference-cache", action="store_true", help="prescale reference images (REFERENCE_CACHE_ENABLED)")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--retry-backoff", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON report path")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    main(parser.parse_args())
@@ -0,0 +1,133 @@
+"""
+데이터셋 품질 검사(validate_dataset) 벤치마크
+
+합성 데이터셋(기본 10k 샘플)을 만들고 결함을 심은 뒤 검사 시간과 검출 결과를 확인합니다.
+- 심는 결함: 검정 프레임, 단색 프레임, 앞선 샘플의 근사 복사본(밝기/노이즈 변형),
+  참조 이미지 복사본, 캡션 없음, 빈 캡션(트리거 워드만)
+- 출력: 처음 검사 / 변경 없이 다시 검사 시간, 초당 이미지 수와 100k 환산 시간,
+  결함별 검출률(recall)과 오검출 수, LSH 후보 비교 수 vs 전체 쌍 비교 수
+
+실행 (저장소 루트에서): python -m benchmarks.bench_validate_dataset --samples 10000 --size 512 --workers 8
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import validate_dataset
+from organize_output import MANIFEST_NAME
+
+CHARACTERS = ["ellie", "ryder", "bunta"]
+DEFECTS = ("black_frame", "flat_frame", "near_duplicate", "reference_copy", "missing_caption", "empty_caption")
+
+
+def _random_image(rng: np.random.Generator, size: int) -> np.ndarray:
+    """저주파 무늬 + 약한 노이즈 (샘플마다 pHash 가 다르게)"""
+    base = Image.fromarray(rng.integers(0, 256, (6, 6, 3), dtype=np.uint8)).resize((size, size), Image.BICUBIC)
+    pixels = np.asarray(base, dtype=np.int16) + rng.integers(-12, 13, (size, size, 3), dtype=np.int16)
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def _variant(pixels: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """밝기를 조금 바꾸고 노이즈를 더한 근사 복사본"""
+    shifted = pixels.astype(np.int16) + int(rng.integers(-10, 11)) + rng.integers(-6, 7, pixels.shape, dtype=np.int16)
+    return np.clip(shifted, 0, 255).astype(np.uint8)
+
+
+def make_dataset(root: str, samples: int, size: int, defect_rate: float, seed: int):
+    """합성 데이터셋을 만들고 샘플별로 심은 결함 {image: defect} 을 반환합니다."""
+    rng = np.random.default_rng(seed)
+    picker = random.Random(seed)
+    references = {}
+    for character in CHARACTERS:
+        references[character] = _random_image(rng, size)
+        Image.fromarray(references[character]).save(os.path.join(root, f"bustShot_fh_{character}.png"))
+    os.makedirs(os.path.join(root, "data"), exist_ok=True)
+    planted, kept = {}, {character: [] for character in CHARACTERS}
+    with open(os.path.join(root, "data", MANIFEST_NAME), "w", encoding="utf-8") as manifest:
+        for i in range(samples):
+            character = CHARACTERS[i % len(CHARACTERS)]
+            relative_dir = f"{character}/bustShot/smile/front"
+            os.makedirs(os.path.join(root, "data", relative_dir), exist_ok=True)
+            defect = picker.choice(DEFECTS) if picker.random() < defect_rate else None
+            if defect == "near_duplicate" and not kept[character]:
+                defect = None
+            if defect == "black_frame":
+                pixels = rng.integers(0, 4, (size, size, 3), dtype=np.uint8)
+            elif defect == "flat_frame":
+                pixels = np.full((size, size, 3), int(rng.integers(40, 220)), dtype=np.uint8)
+            elif defect == "near_duplicate":
+                pixels = _variant(picker.choice(kept[character]), rng)
+            elif defect == "reference_copy":
+                pixels = _variant(references[character], rng)
+            else:
+                pixels = _random_image(rng, size)
+                if len(kept[character]) < 50:
+                    kept[character].append(pixels)
+            name = f"bustShot_fh_{character}_smile_front_{i:06d}_.png"
+            Image.fromarray(pixels).save(os.path.join(root, "data", relative_dir, name), compress_level=1)
+            caption = f"{relative_dir}/{name[:-4]}.txt"
+            if defect != "missing_caption":
+                text = "fh_ellie" if defect == "empty_caption" else "fh_ellie, 1girl, solo, smile"
+                with open(os.path.join(root, "data", caption), "w", encoding="utf-8") as f:
+                    f.write(text)
+            image = f"{relative_dir}/{name}"
+            manifest.write(json.dumps({"image": image, "caption": caption, "character": character,
+                                       "shot_type": "bustShot", "emotion": "smile", "angle": "front"}) + "\n")
+            if defect:
+                planted[image] = defect
+    return planted
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        planted = make_dataset(root, args.samples, args.size, args.defect_rate, args.seed)
+        print(f"dataset: {args.samples} samples {args.size}x{args.size}, {len(planted)} planted defects "
+              f"({time.perf_counter() - start:.1f}s to build)")
+        dataset = os.path.join(root, "data")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            validate_dataset.validate_dataset(dataset, root, args.workers)
+            cold = time.perf_counter() - start
+            start = time.perf_counter()
+            validate_dataset.validate_dataset(dataset, root, args.workers)
+            warm = time.perf_counter() - start
+        print(f"validate (cold)      {cold:8.2f}s  {args.samples / cold:8.0f} images/s  "
+              f"-> 100k images ~{100_000 / args.samples * cold / 60:.1f} min ({args.workers} workers)")
+        print(f"validate (no change) {warm:8.2f}s")
+
+        with open(os.path.join(dataset, MANIFEST_NAME), encoding="utf-8") as f:
+            verdicts = {record["image"]: record["quality"] for record in map(json.loads, f)}
+        print("\ndefect            planted  detected  false positives (flagged clean samples)")
+        for defect in DEFECTS:
+            expected = {image for image, kind in planted.items() if kind == defect}
+            flagged = {image for image, quality in verdicts.items() if defect in quality["reasons"]}
+            print(f"  {defect:<16} {len(expected):7d}  {len(expected & flagged):8d}  {len(flagged - set(planted)):15d}")
+        clean = sum(1 for image, quality in verdicts.items() if image not in planted and quality["ok"])
+        print(f"  clean samples passed: {clean}/{args.samples - len(planted)}")
+
+        hashes = np.array([int(q["phash"], 16) for q in verdicts.values()], dtype=np.uint64)
+        groups = np.arange(len(hashes)) % len(CHARACTERS)
+        start = time.perf_counter()
+        pairs = validate_dataset.near_duplicate_pairs(hashes, groups)
+        print(f"\nnear-duplicate search {time.perf_counter() - start:.3f}s, {len(pairs)} pairs "
+              f"(all-pairs comparisons would be {len(hashes) * (len(hashes) - 1) // 2:,})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--defect-rate", type=float, default=0.06)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,113 @@
+"""
+ComfyUI 웹소켓 연결 방식 비교 벤치마크
+
+- per_request: 요청마다 웹소켓을 새로 열고 모든 JSON 프레임을 파싱 (기존 방식)
+- shared: ComfyUIClient 하나로 모든 프롬프트 이벤트를 분배 (현재 방식)
+
+로컬 웹소켓 스텁이 progress / 미리보기 바이너리 / executed / executing 이벤트를
+모든 연결에 브로드캐스트하고, 클라이언트 프로세스의 CPU 시간과 소켓 수를 비교합니다.
+
+실행: python -m benchmarks.bench_ws_mux --concurrency 1 8 32
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+import uuid
+
+import websockets
+
+from app.comfy_client import ComfyUIClient
+
+HOST = "127.0.0.1"
+PORT = 9123
+STEPS = 20
+PREVIEW_BYTES = 64 * 1024
+PREVIEWS_PER_PROMPT = 4
+
+
+def _events(prompt_id):
+    yield json.dumps({"type": "status", "data": {"status": {"exec_info": {"queue_remaining": 1}}}})
+    yield json.dumps({"type": "execution_start", "data": {"prompt_id": prompt_id}})
+    for node in ("37", "38", "39", "142", "42", "124", "192", "31"):
+        yield json.dumps({"type": "executing", "data": {"node": node, "prompt_id": prompt_id}})
+    for step in range(STEPS):
+        yield json.dumps({"type": "progress", "data": {"value": step + 1, "max": STEPS, "prompt_id": prompt_id, "node": "31"}})
+        if step % (STEPS // PREVIEWS_PER_PROMPT) == 0:
+            yield b"\x00\x00\x00\x01" + b"\x00" * PREVIEW_BYTES
+    yield json.dumps({"type": "executed", "data": {"node": "136", "prompt_id": prompt_id, "output": {"images": [{"filename": "x_00001_.png", "subfolder": "", "type": "output"}]}}})
+    yield json.dumps({"type": "executed", "data": {"node": "190", "prompt_id": prompt_id, "output": {"text": ["fh_ellie, 1girl"]}}})
+    yield json.dumps({"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+
+
+def _run_stub(expected_clients, prompt_ids, ready):
+    clients = set()
+
+    async def handler(websocket):
+        clients.add(websocket)
+        try:
+            await websocket.wait_closed()
+        finally:
+            clients.discard(websocket)
+
+    async def main():
+        async with websockets.serve(handler, HOST, PORT, max_size=None):
+            ready.set()
+            while len(clients) < expected_clients:
+                await asyncio.sleep(0.01)
+            for prompt_id in prompt_ids:
+                for event in _events(prompt_id):
+                    websockets.broadcast(clients, event)
+                await asyncio.sleep(0)
+            while clients:
+                await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+
+
+async def _per_request(prompt_id):
+    async with websockets.connect(f"ws://{HOST}:{PORT}/ws?clientId={uuid.uuid4()}", max_size=None) as websocket:
+        while True:
+            out = await websocket.recv()
+            if isinstance(out, str):
+                message = json.loads(out)
+                if message.get("type") == "executed" and message.get("data", {}).get("prompt_id") == prompt_id:
+                    return
+
+
+async def _shared(prompt_ids):
+    client = ComfyUIClient(f"http://{HOST}:{PORT}", f"ws://{HOST}:{PORT}/ws")
+    await client.start(None)
+    await asyncio.gather(*(client.wait(prompt_id) for prompt_id in prompt_ids))
+    await client.stop()
+
+
+def run(mode, concurrency):
+    prompt_ids = [str(uuid.uuid4()) for _ in range(concurrency)]
+    expected_clients = concurrency if mode == "per_request" else 1
+    ready = multiprocessing.Event()
+    stub = multiprocessing.Process(target=_run_stub, args=(expected_clients, prompt_ids, ready))
+    stub.start()
+    ready.wait()
+
+    cpu_start = time.process_time()
+    if mode == "per_request":
+        async def main():
+            await asyncio.gather(*(_per_request(prompt_id) for prompt_id in prompt_ids))
+        asyncio.run(main())
+    else:
+        asyncio.run(_shared(prompt_ids))
+    cpu = time.process_time() - cpu_start
+
+    stub.join()
+    print(f"{mode:<12} concurrency={concurrency:<4} sockets={expected_clients:<4} cpu={cpu * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+    for concurrency in args.concurrency:
+        for mode in ("per_request", "shared"):
+            run(mode, concurrency)
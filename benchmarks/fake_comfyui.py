@@ -0,0 +1,483 @@
+"""
+GPU 없이 API 서버를 시험하기 위한 가짜 ComfyUI 서버
+
+ComfyUI 의 /prompt, /queue, /history, /view, /interrupt, /ws 를 흉내 냅니다.
+- 출력 노드(SaveImage, SaveText|pysssss)에 필요한 노드만 위상 순서로 "실행"하고,
+  노드 종류별 지연 시간만큼 기다립니다. 직전 프롬프트와 입력이 같은 노드는 ComfyUI 처럼 캐시로 건너뜀
+- 웹소켓으로 execution_start / execution_cached / executing / progress / executed /
+  execution_success / execution_error / execution_interrupted 를 프롬프트를 보낸 client_id 에게만 보냄
+- SaveImage 는 작은 PNG, SaveText 는 가짜 DeepDanbooru 캡션을 output 폴더에 기록 (캡션은 원자적으로 교체)
+- failure_rate 확률로 execution_error 를 일으킴
+- LoadImageOutput 이 읽을 파일이 output 폴더에 없으면 ComfyUI 처럼 /prompt 에서 400 (node_errors)
+
+실행: python -m benchmarks.fake_comfyui --port 9000 --output-dir /tmp/fake_comfy_out --latency KSampler=2.0
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import struct
+import time
+import uuid
+import zlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+
+# 노드 종류별 기본 실행 시간 (초). 목록에 없는 노드는 0
+DEFAULT_NODE_LATENCY = {
+    "UNETLoader": 0.5,
+    "DualCLIPLoader": 0.3,
+    "VAELoader": 0.1,
+    "LoadImageOutput": 0.01,
+    "FluxKontextImageScale": 0.02,
+    "VAEEncode": 0.02,
+    "CLIPTextEncode": 0.01,
+    "KSampler": 0.2,
+    "VAEDecode": 0.02,
+    "SaveImage": 0.005,
+    "DeepDanbooruCaption": 0.01,
+}
+# 결과를 저장하는 출력 노드 (이 노드들에 필요한 노드만 실행)
+OUTPUT_NODE_TYPES = {"SaveImage", "PreviewImage", "SaveText|pysssss"}
+# KSampler progress 메시지 단계 수
+SAMPLER_STEPS = 20
+# /history 에 보관할 최대 프롬프트 수
+MAX_HISTORY = 10000
+# DeepDanbooruCaption 이 돌려주는 가짜 태그 (prefix 가 있으면 그 뒤에 붙음)
+FAKE_CAPTION_TAGS = "1girl, solo, looking_at_viewer, simple_background"
+
+
+def _tiny_png() -> bytes:
+    """1x1 회색 PNG"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+    pixels = zlib.compress(b"\x00\x80\x80\x80")
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", pixels) + chunk(b"IEND", b"")
+
+
+FAKE_PNG = _tiny_png()
+
+
+@dataclass
+class FakeComfyConfig:
+    output_dir: Path
+    node_latency: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_NODE_LATENCY))
+    latency_jitter: float = 0.1       # 지연 시간에 곱할 무작위 변동 폭 (±비율)
+    failure_rate: float = 0.0         # 프롬프트가 execution_error 로 끝날 확률
+    failure_node_type: str = "KSampler"
+    workers: int = 1                  # 동시에 실행할 프롬프트 수 (GPU 수)
+    seed: Optional[int] = None
+
+
+@dataclass
+class _Prompt:
+    prompt_id: str
+    number: int
+    workflow: dict
+    client_id: Optional[str]
+    task: Optional[asyncio.Task] = None
+
+
+class FakeComfyUI:
+    def __init__(self, config: FakeComfyConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.sockets: Dict[str, WebSocket] = {}
+        self.pending: Deque[_Prompt] = deque()
+        self.running: Dict[str, _Prompt] = {}
+        self.history: "OrderedDict[str, dict]" = OrderedDict()
+        self.last_signatures: set = set()
+        self.counters: Dict[str, int] = {}
+        self.number = 0
+        self.executed = 0
+        self.failed = 0
+        self.interrupted = 0
+        self.deleted = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+    # --- 수명 주기 ---
+    def start(self):
+        self.config.output_dir.mkdir(parents=True, exist_ok=True)
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.config.workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    # --- 큐 ---
+    def submit(self, workflow: dict, client_id: Optional[str]) -> _Prompt:
+        prompt = _Prompt(str(uuid.uuid4()), self.number, workflow, client_id)
+        self.number += 1
+        self.pending.append(prompt)
+        self._wakeup.set()
+        return prompt
+
+    def delete(self, prompt_ids: List[str]):
+        ids = set(prompt_ids)
+        before = len(self.pending)
+        self.pending = deque(prompt for prompt in self.pending if prompt.prompt_id not in ids)
+        self.deleted += before - len(self.pending)
+
+    def interrupt(self, prompt_id: Optional[str] = None):
+        for prompt in list(self.running.values()):
+            if prompt_id is None or prompt.prompt_id == prompt_id:
+                prompt.task.cancel()
+
+    def queue(self) -> dict:
+        def item(prompt):
+            return [prompt.number, prompt.prompt_id, {}, {"client_id": prompt.client_id}, []]
+        return {
+            "queue_running": [item(prompt) for prompt in self.running.values()],
+            "queue_pending": [item(prompt) for prompt in self.pending],
+        }
+
+    async def _worker(self):
+        while True:
+            while not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            prompt = self.pending.popleft()
+            self.running[prompt.prompt_id] = prompt
+            prompt.task = asyncio.create_task(self._execute(prompt))
+            try:
+                await asyncio.gather(prompt.task, return_exceptions=True)
+            finally:
+                self.running.pop(prompt.prompt_id, None)
+
+    # --- 실행 ---
+    async def _execute(self, prompt: _Prompt):
+        pid, workflow = prompt.prompt_id, prompt.workflow
+        order = _execution_order(workflow)
+        signatures = _signatures(workflow)
+        cached = [node_id for node_id in order if signatures[node_id] in self.last_signatures]
+        fail_at = None
+        if self.rng.random() < self.config.failure_rate:
+            candidates = [node_id for node_id in order if workflow[node_id]["class_type"] == self.config.failure_node_type]
+            fail_at = self.rng.choice(candidates or order)
+
+        outputs: Dict[str, dict] = {}
+        messages = []
+        status = "success"
+        await self._send(prompt, "execution_start", {"prompt_id": pid, "timestamp": _now_ms()})
+        if cached:
+            await self._send(prompt, "execution_cached", {"nodes": cached, "prompt_id": pid, "timestamp": _now_ms()})
+        try:
+            for node_id in order:
+                if node_id in cached:
+                    continue
+                node = workflow[node_id]
+                class_type = node["class_type"]
+                await self._send(prompt, "executing", {"node": node_id, "display_node": node_id, "prompt_id": pid})
+                if node_id == fail_at:
+                    raise _InjectedFailure(node_id, class_type)
+                await self._sleep(prompt, node_id, node)
+                output = self._output(workflow, node)
+                if output is not None:
+                    outputs[node_id] = output
+                    await self._send(prompt, "executed",
+                                     {"node": node_id, "display_node": node_id, "output": output, "prompt_id": pid})
+            self.last_signatures = set(signatures.values())
+            self.executed += 1
+            await self._send(prompt, "execution_success", {"prompt_id": pid, "timestamp": _now_ms()})
+        except _InjectedFailure as e:
+            self.failed += 1
+            status = "error"
+            error = {"prompt_id": pid, "node_id": e.node_id, "node_type": e.class_type, "executed": list(outputs),
+                     "exception_message": "Injected failure (fake ComfyUI)", "exception_type": "RuntimeError",
+                     "traceback": [], "current_inputs": {}, "current_outputs": {}}
+            messages.append(["execution_error", error])
+            await self._send(prompt, "execution_error", error)
+        except asyncio.CancelledError:
+            self.interrupted += 1
+            status = "error"
+            messages.append(["execution_interrupted", {"prompt_id": pid}])
+            await self._send(prompt, "execution_interrupted",
+                             {"prompt_id": pid, "node_id": None, "node_type": None, "executed": list(outputs)})
+        finally:
+            self.history[pid] = {
+                "prompt": [prompt.number, pid, {}, {"client_id": prompt.client_id}, list(outputs)],
+                "outputs": outputs,
+                "status": {"status_str": status, "completed": status == "success", "messages": messages},
+            }
+            while len(self.history) > MAX_HISTORY:
+                self.history.popitem(last=False)
+        await self._send(prompt, "executing", {"node": None, "display_node": None, "prompt_id": pid})
+
+    async def _sleep(self, prompt: _Prompt, node_id: str, node: dict):
+        class_type = node["class_type"]
+        latency = self.config.node_latency.get(class_type, 0.0)
+        if latency <= 0:
+            return
+        latency *= 1 + self.rng.uniform(-self.config.latency_jitter, self.config.latency_jitter)
+        if class_type != "KSampler":
+            await asyncio.sleep(latency)
+            return
+        steps = node["inputs"].get("steps", SAMPLER_STEPS)
+        steps = steps if isinstance(steps, int) and steps > 0 else SAMPLER_STEPS
+        for step in range(1, steps + 1):
+            await asyncio.sleep(latency / steps)
+            await self._send(prompt, "progress",
+                             {"value": step, "max": steps, "prompt_id": prompt.prompt_id, "node": node_id})
+
+    def _output(self, workflow: dict, node: dict) -> Optional[dict]:
+        class_type, inputs = node["class_type"], node["inputs"]
+        if class_type in ("SaveImage", "PreviewImage"):
+            prefix = inputs.get("filename_prefix", "ComfyUI")
+            subfolder, base = os.path.split(prefix)
+            filename = f"{base}_{self._next_counter(subfolder, base):05d}_.png"
+            target = self.config.output_dir / subfolder / filename
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(FAKE_PNG)
+            return {"images": [{"filename": filename, "subfolder": subfolder, "type": "output"}]}
+        if class_type == "SaveText|pysssss":
+            text = _resolve_text(workflow, inputs.get("text"))
+            target = self.config.output_dir / inputs["file"]
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if inputs.get("append") == "append" and target.exists():
+                content = target.read_text(encoding="utf-8") + text
+            else:
+                content = text
+            # 원자적으로 교체해서, 읽는 쪽이 본 반쪽짜리 캡션은 API 서버 쪽 문제로만 남게 함
+            tmp = target.with_name(f".{target.name}.fake.tmp")
+            tmp.write_text(content, encoding="utf-8")
+            os.replace(tmp, target)
+            return {"text": [text]}
+        return None
+
+    def _next_counter(self, subfolder: str, base: str) -> int:
+        key = f"{subfolder}/{base}"
+        if key not in self.counters:
+            # ComfyUI 처럼 폴더에 있는 가장 큰 번호 다음부터
+            pattern = re.compile(rf"^{re.escape(base)}_(\d+)_\.png$")
+            directory = self.config.output_dir / subfolder
+            numbers = [int(m.group(1)) for name in (os.listdir(directory) if directory.is_dir() else [])
+                       if (m := pattern.match(name))]
+            self.counters[key] = max(numbers, default=0)
+        self.counters[key] += 1
+        return self.counters[key]
+
+    # --- 웹소켓 ---
+    async def _send(self, prompt: _Prompt, msg_type: str, data: dict):
+        await self._send_to(prompt.client_id, msg_type, data)
+
+    async def _send_to(self, client_id: Optional[str], msg_type: str, data: dict):
+        # client_id 없이 보낸 프롬프트의 메시지는 모든 연결에 보냄 (ComfyUI 와 동일)
+        targets = list(self.sockets.values()) if client_id is None else (
+            [self.sockets[client_id]] if client_id in self.sockets else [])
+        message = json.dumps({"type": msg_type, "data": data})
+        for websocket in targets:
+            try:
+                await websocket.send_text(message)
+            except Exception:
+                pass
+
+    def status_message(self) -> str:
+        return json.dumps({"type": "status", "data": {"status": {"exec_info": {
+            "queue_remaining": len(self.pending) + len(self.running)}}}})
+
+
+class _InjectedFailure(Exception):
+    def __init__(self, node_id: str, class_type: str):
+        super().__init__(node_id)
+        self.node_id = node_id
+        self.class_type = class_type
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _links(node: dict):
+    return [value[0] for value in node["inputs"].values() if isinstance(value, list) and len(value) == 2]
+
+
+def _execution_order(workflow: dict) -> List[str]:
+    """출력 노드에 필요한 노드만 의존 순서대로"""
+    order, seen = [], set()
+
+    def visit(node_id):
+        if node_id in seen or node_id not in workflow:
+            return
+        seen.add(node_id)
+        for upstream in _links(workflow[node_id]):
+            visit(upstream)
+        order.append(node_id)
+
+    for node_id, node in workflow.items():
+        if node["class_type"] in OUTPUT_NODE_TYPES:
+            visit(node_id)
+    return order
+
+
+def _signatures(workflow: dict) -> Dict[str, str]:
+    """노드 종류 + 입력값 + 상위 노드 서명으로 만든 캐시 키 (ComfyUI 캐시 흉내)"""
+    memo: Dict[str, str] = {}
+
+    def signature(node_id):
+        if node_id not in memo:
+            node = workflow[node_id]
+            inputs = {name: signature(value[0]) if isinstance(value, list) and len(value) == 2 and value[0] in workflow else value
+                      for name, value in node["inputs"].items()}
+            memo[node_id] = json.dumps([node["class_type"], inputs], sort_keys=True)
+        return memo[node_id]
+
+    return {node_id: signature(node_id) for node_id in _execution_order(workflow)}
+
+
+def _resolve_text(workflow: dict, value) -> str:
+    """SaveText 의 text 입력 (DeepDanbooruCaption 이면 가짜 태그 목록)"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list) and value and value[0] in workflow:
+        upstream = workflow[value[0]]
+        prefix = upstream["inputs"].get("prefix")
+        tags = FAKE_CAPTION_TAGS
+        return f"{prefix}, {tags}" if isinstance(prefix, str) and prefix else tags
+    return "fake caption"
+
+
+def _missing_inputs(workflow: dict, output_dir: Path) -> dict:
+    """LoadImageOutput 의 "이름 [output]" 파일이 output 폴더에 없는 노드 -> ComfyUI 형식 node_errors"""
+    errors = {}
+    for node_id, node in workflow.items():
+        if node.get("class_type") != "LoadImageOutput":
+            continue
+        image = node["inputs"].get("image", "")
+        name = image[:-len(" [output]")] if image.endswith(" [output]") else image
+        if not (output_dir / name).is_file():
+            errors[node_id] = {"errors": [{"type": "value_not_in_list", "message": "Value not in list",
+                                           "details": f"image: '{image}' not in output folder"}],
+                               "class_type": "LoadImageOutput"}
+    return errors
+
+
+def create_app(config: FakeComfyConfig) -> FastAPI:
+    app = FastAPI()
+    fake = FakeComfyUI(config)
+    app.state.fake = fake
+
+    @app.on_event("startup")
+    async def startup():
+        fake.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        await fake.stop()
+
+    @app.post("/prompt")
+    async def post_prompt(request: Request):
+        body = await request.json()
+        workflow = body.get("prompt")
+        if not isinstance(workflow, dict) or not _execution_order(workflow):
+            raise HTTPException(status_code=400, detail={"error": {"type": "prompt_no_outputs",
+                                                                   "message": "Prompt has no outputs"}})
+        node_errors = _missing_inputs(workflow, config.output_dir)
+        if node_errors:
+            raise HTTPException(status_code=400, detail={"error": {"type": "prompt_outputs_failed_validation",
+                                                                   "message": "Prompt outputs failed validation"},
+                                                         "node_errors": node_errors})
+        prompt = fake.submit(workflow, body.get("client_id"))
+        return {"prompt_id": prompt.prompt_id, "number": prompt.number, "node_errors": {}}
+
+    @app.get("/queue")
+    async def get_queue():
+        return fake.queue()
+
+    @app.post("/queue")
+    async def post_queue(request: Request):
+        body = await request.json()
+        if body.get("clear"):
+            fake.pending.clear()
+        if body.get("delete"):
+            fake.delete(body["delete"])
+        return {}
+
+    @app.post("/interrupt")
+    async def post_interrupt(request: Request):
+        body = await request.body()
+        prompt_id = json.loads(body).get("prompt_id") if body else None
+        fake.interrupt(prompt_id)
+        return {}
+
+    @app.get("/history")
+    async def get_history(max_items: Optional[int] = None):
+        items = list(fake.history.items())
+        return dict(items[-max_items:] if max_items else items)
+
+    @app.get("/history/{prompt_id}")
+    async def get_prompt_history(prompt_id: str):
+        return {prompt_id: fake.history[prompt_id]} if prompt_id in fake.history else {}
+
+    @app.get("/view")
+    async def view(filename: str, subfolder: str = "", type: str = "output"):
+        path = config.output_dir / subfolder / filename
+        if not path.is_file():
+            raise HTTPException(status_code=404)
+        return Response(content=path.read_bytes(), media_type="image/png" if filename.endswith(".png") else "text/plain")
+
+    @app.get("/fake/stats")
+    async def stats():
+        return {"executed": fake.executed, "failed": fake.failed, "interrupted": fake.interrupted,
+                "deleted": fake.deleted, "pending": len(fake.pending), "running": len(fake.running)}
+
+    @app.websocket("/ws")
+    async def websocket_endpoint(websocket: WebSocket, clientId: Optional[str] = None):
+        await websocket.accept()
+        client_id = clientId or uuid.uuid4().hex
+        fake.sockets[client_id] = websocket
+        try:
+            await websocket.send_text(fake.status_message())
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if fake.sockets.get(client_id) is websocket:
+                del fake.sockets[client_id]
+
+    return app
+
+
+def parse_latency(values: List[str]) -> Dict[str, float]:
+    """["KSampler=2.0", "VAEDecode=0.1"] -> 기본값에 덮어쓴 노드별 지연 시간"""
+    latency = dict(DEFAULT_NODE_LATENCY)
+    for value in values:
+        name, _, seconds = value.partition("=")
+        latency[name] = float(seconds)
+    return latency
+
+
+def serve(port: int, config: FakeComfyConfig, log_level: str = "warning"):
+    import uvicorn
+    uvicorn.run(create_app(config), host="127.0.0.1", port=port, log_level=log_level)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake ComfyUI server for offline benchmarks")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--output-dir", default="/tmp/fake_comfyui/output")
+    parser.add_argument("--latency", nargs="*", default=[], metavar="NODE=SECONDS",
+                        help="per-node-type execution time, e.g. KSampler=2.0")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    serve(args.port, FakeComfyConfig(
+        output_dir=Path(args.output_dir),
+        node_latency=parse_latency(args.latency),
+        latency_jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        workers=args.workers,
+        seed=args.seed,
+    ), log_level="info")
@@ -1,9 +1,11 @@
-import json
-import os
+import argparse
 from pathlib import Path
 
+from app.prompt_bundle import compile_bundle
+from app.prompt_util import PROMPT_BUNDLE_PATH
+
 # --- Configuration ---
-CHARACTERS = ["ellie", "ryder"]
+# data/ 아래의 모든 캐릭터 폴더를 대상으로 함 (캐릭터 목록을 따로 관리하지 않음)
 BASE_PATH = Path("data")
 
 # Expression prompts (Korean: 웃음, 화남, 슬픔)
@@ -19,54 +21,35 @@ ANGLES = {
     "left_three_quarter": ["a bust shot from a left three-quarter angle", "a bust shot from a complete left profile view", "a bust shot from a left rear three-quarter angle"],
     "right_three_quarter": ["a bust shot from a right three-quarter angle", "a bust shot from a complete right profile view", "a bust shot from a right rear three-quarter angle"]
 }
+# 다시 만든 프롬프트셋 이름을 하나씩 출력할 최대 개수 (넘으면 개수만 출력)
+MAX_LISTED = 20
 # --- End Configuration ---
 
-def create_expression_prompts():
+def create_expression_prompts(force=False):
     """
-    Creates expression-based prompt sets for each character.
-    It uses the existing bustShot prompt as a template and replaces
-    the 'expression' and 'camera_angle' categories.
+    data/ 아래 모든 캐릭터의 프롬프트셋을 프롬프트 번들 하나로 컴파일합니다.
+    - 이미 있는 {표정}/{앵글}_PromptSet.json 은 그대로 사용 (직접 다듬은 파일 보존)
+    - 없는 (표정, 앵글) 조합은 bustShot/PromptSet.json 의 expression / camera_angle 을 바꿔서 만듦
+    - 입력이 바뀐 프롬프트셋만 다시 만들고, 바뀐 것이 없으면 번들을 다시 쓰지 않음
+    서버는 번들이 있으면 번들에서 프롬프트셋을 읽습니다.
     """
-    print("🚀 Starting creation of expression prompt sets...")
-
-    for char in CHARACTERS:
-        print(f"Processing character: {char}")
-
-        # 1. Load base prompt set from bustShot
-        base_prompt_file = BASE_PATH / char / "bustShot" / "PromptSet.json"
-        try:
-            with open(base_prompt_file, 'r', encoding='utf-8') as f:
-                base_prompts = json.load(f)
-            print(f"  ✅ Loaded base prompt from {base_prompt_file}")
-        except FileNotFoundError:
-            print(f"  ❌ ERROR: Base prompt file not found at {base_prompt_file}. Skipping {char}.")
-            continue
-
-        # 2. Generate new prompt files for each expression and angle
-        for exp_name, exp_prompts in EXPRESSIONS.items():
-            # Create expression directory
-            expression_dir = BASE_PATH / char / exp_name
-            expression_dir.mkdir(parents=True, exist_ok=True)
-
-            for angle_name, angle_prompts in ANGLES.items():
-                new_prompt_set = []
-                # Replace categories
-                for category in base_prompts:
-                    if category["category"] == "expression":
-                        new_prompt_set.append({"category": "expression", "prompts": exp_prompts})
-                    elif category["category"] == "camera_angle":
-                        new_prompt_set.append({"category": "camera_angle", "prompts": angle_prompts})
-                    else:
-                        new_prompt_set.append(category)
-
-                # Write the new prompt file
-                new_filename = f"{angle_name}_PromptSet.json"
-                output_path = expression_dir / new_filename
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(new_prompt_set, f, indent=2, ensure_ascii=False)
-                print(f"    📄 Created {output_path}")
-
-    print("\n🎉 Done creating all expression prompt sets.")
+    print("🚀 Compiling prompt bundle...")
+    result = compile_bundle(BASE_PATH, PROMPT_BUNDLE_PATH, EXPRESSIONS, ANGLES, force=force)
+    if len(result["rebuilt"]) <= MAX_LISTED:
+        for name in result["rebuilt"]:
+            print(f"    📄 Rebuilt {name}")
+    for name in result["removed"]:
+        print(f"    🗑️ Removed {name}")
+    print(f"  ✅ {result['sets']} prompt sets ({result['derived']} derived), "
+          f"{len(result['rebuilt'])} rebuilt, {result['reused']} unchanged")
+    if result["written"]:
+        print(f"\n🎉 Wrote {PROMPT_BUNDLE_PATH} (build {result['build']}, "
+              f"{result['strings']} strings, {result['bytes']:,} bytes)")
+    else:
+        print(f"\n🎉 {PROMPT_BUNDLE_PATH} is up to date (build {result['build']})")
 
 if __name__ == "__main__":
-    create_expression_prompts()
+    parser = argparse.ArgumentParser(description="Compile all prompt sets under data/ into one bundle")
+    parser.add_argument("--force", action="store_true", help="rebuild every prompt set")
+    args = parser.parse_args()
+    create_expression_prompts(force=args.force)
@@ -1,8 +1,47 @@
-import requests
+import argparse
+import asyncio
+import collections
+import os
 import time
 import itertools
+from pathlib import Path
+
+import httpx
+
+from job_ledger import JobLedger
 
 API_URL = "http://localhost:8000/generateDataset"
+JOBS_URL = "http://localhost:8000/jobs"
+QUEUE_URL = "http://localhost:8000/queue"
+FILES_URL = "http://localhost:8000/files"
+
+# 한 번의 /jobs 요청에 담아 보낼 작업 수
+SUBMIT_BATCH_SIZE = 100
+# 작업 상태 확인 주기 (초)
+POLL_INTERVAL = 2
+# 서버에 동시에 올려둘 최대 작업 수 (나머지는 원장에서 대기)
+MAX_OUTSTANDING = 1000
+# 실패한 작업의 최대 시도 횟수와 재시도 대기 시간 (초, 시도마다 두 배)
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 5
+# 동시에 보낼 HTTP 요청 수 (커넥션 풀 크기)
+MAX_CONCURRENCY = 8
+# HTTP 요청 하나의 제한 시간 (초)
+REQUEST_TIMEOUT = 30
+# 서버 대기열은 ComfyUI 동시 실행 슬롯(queue_depth) 하나당 이 개수까지만 채움 (적응형 백프레셔)
+BACKLOG_PER_SLOT = 50
+# 전송 후 이 시간(초) 안에 끝나지 않은 작업은 실패로 보고 재시도
+JOB_DEADLINE = 1800
+# images/min 을 계산할 최근 구간 (초)와 지연 시간 백분위에 쓸 최근 샘플 수
+RATE_WINDOW = 300
+LATENCY_SAMPLES = 1000
+
+# 작업 원장(SQLite) 파일 경로
+LEDGER_PATH = "generate_loop.db"
+
+# 완료된 작업의 이미지/캡션을 API 서버에서 내려받을 폴더 (None이면 내려받지 않음: GPU 서버의 output 폴더를 직접 사용)
+# 다른 머신에서 실행할 때 NFS 없이 결과를 모을 수 있음. 내려받기에 실패한 작업은 재시도 (서버 결과 캐시 적중)
+DOWNLOAD_DIR = None
 
 # --- Configuration ---
 # 'shot_type', 'expression', or 'both'
@@ -17,6 +56,15 @@ EXPRESSION_CHARACTERS = ["bunta"]
 EXPRESSIONS = ["smile", "angry", "sad"]
 ANGLES = ["front", "left_three_quarter", "right_three_quarter"]
 NUM_SAMPLES_PER_EXPRESSION = 1
+
+# 시드 계산에 쓰이는 실행 ID: 같은 값이면 같은 인덱스는 같은 프롬프트/시드로 생성되어
+# 서버의 결과 캐시를 그대로 재사용함. 새로운 샘플을 원하면 값을 바꿀 것
+SEED_RUN_ID = "v1"
+
+# 서버 대기열 우선순위 ('high', 'normal', 'low')와 공정 분배 단위 (None이면 서버 기본값: normal / 캐릭터 이름)
+# 대량 생성은 'low' 로 돌리면 급한 보충 생성('high')이 뒤에 밀리지 않음
+PRIORITY = None
+TENANT = None
 # --- End Configuration ---
 
 def get_trigger_word(character_name, prefix=None):
@@ -48,82 +96,341 @@ def get_trigger_word(character_name, prefix=None):
     
     return f"{prefix}_{character_name}"
 
-def run_shot_type_generation():
+def plan_shot_type_jobs():
     """
     Shot type 생성 모드
     full shot, knee shot, close up, bust shot 별로 이미지를 생성함
     """
-    print("🚀 Starting generation in 'shot_type' mode.")
     # Use a global counter for unique indices
     global_index = 0
     for char in SHOT_TYPE_CHARACTERS:
         trigger_word = get_trigger_word(char)
         for i in range(NUM_SAMPLES_PER_SHOT_TYPE):
             global_index += 1
-            payload = {
+            yield {
                 "generation_mode": "shot_type",
                 "trigger_word": trigger_word,
                 "character_name": char,
-                "index": global_index
+                "index": global_index,
+                "run_id": SEED_RUN_ID
             }
-            send_request(payload, f"{global_index}/{len(SHOT_TYPE_CHARACTERS) * NUM_SAMPLES_PER_SHOT_TYPE}")
 
-def run_expression_generation():
+def plan_expression_jobs():
     """
     Expression 생성 모드
     smile, angry, sad 별로 이미지를 생성함
     """
-    print("🚀 Starting generation in 'expression' mode.")
-    combinations = list(itertools.product(EXPRESSION_CHARACTERS, EXPRESSIONS, ANGLES))
-    total_requests = len(combinations) * NUM_SAMPLES_PER_EXPRESSION
-    
     # Use a single, global counter for the index across all combinations
     global_index = 0
-
-    for char, expression, angle in combinations:
+    for char, expression, angle in itertools.product(EXPRESSION_CHARACTERS, EXPRESSIONS, ANGLES):
         trigger_word = get_trigger_word(char)
-        print(f"\n--- Generating for {char} - {expression} - {angle} ---")
         for _ in range(NUM_SAMPLES_PER_EXPRESSION):
             global_index += 1
-            payload = {
+            yield {
                 "generation_mode": "expression",
                 "trigger_word": trigger_word,
                 "character_name": char,
                 "expression": expression,
                 "angle": angle,
-                "index": global_index
+                "index": global_index,
+                "run_id": SEED_RUN_ID
             }
-            send_request(payload, f"{global_index}/{total_requests}")
+
+def plan_jobs(mode):
+    """
+    생성 모드에 맞는 작업 목록을 만듦
+    'both' 모드는 shot_type ➜ expression 순
+    """
+    if mode == "shot_type":
+        return plan_shot_type_jobs()
+    if mode == "expression":
+        return plan_expression_jobs()
+    if mode == "both":
+        return itertools.chain(plan_shot_type_jobs(), plan_expression_jobs())
+    raise ValueError(f"Invalid GENERATION_MODE: '{mode}'. Please use 'shot_type', 'expression', or 'both'.")
+
+def run_generation(mode):
+    """
+    작업 계획을 원장에 기록한 뒤 서버로 전송함
+    """
+    print(f"🚀 Starting generation in '{mode}' mode.")
+    ledger = JobLedger(LEDGER_PATH)
+    config = {
+        "shot_type_characters": SHOT_TYPE_CHARACTERS,
+        "num_samples_per_shot_type": NUM_SAMPLES_PER_SHOT_TYPE,
+        "expression_characters": EXPRESSION_CHARACTERS,
+        "expressions": EXPRESSIONS,
+        "angles": ANGLES,
+        "num_samples_per_expression": NUM_SAMPLES_PER_EXPRESSION,
+        "seed_run_id": SEED_RUN_ID,
+        "priority": PRIORITY,
+        "tenant": TENANT,
+    }
+    run_id = ledger.create_run(mode, config)
+    total = ledger.plan(run_id, plan_jobs(mode))
+    print(f"📝 Planned {total} jobs (run_id: {run_id})")
+    asyncio.run(submit_and_wait(ledger, run_id))
+    ledger.close()
+
+def resume_generation(run_id=None):
+    """
+    원장에서 끝나지 않은 작업(미전송, 실패)만 다시 전송함
+    """
+    ledger = JobLedger(LEDGER_PATH)
+    run_id = run_id or ledger.latest_run()
+    if run_id is None:
+        print("❌ No run found in the ledger.")
+        return
+    print(f"🔁 Resuming run {run_id}: {ledger.summary(run_id)}")
+    asyncio.run(submit_and_wait(ledger, run_id))
+    ledger.close()
+
+def run_shot_type_generation():
+    run_generation("shot_type")
+
+def run_expression_generation():
+    run_generation("expression")
 
 def run_both_generation():
+    run_generation("both")
+
+class ProgressStats:
     """
-    Shot_type ➜ expression 순으로 이미지를 생성함
+    진행 상황 한 줄 요약: 최근 RATE_WINDOW 초 동안의 images/min,
+    작업 지연 시간(서버 접수 ➜ 완료) p50/p95, 남은 작업 기준 ETA
     """
-    print("🚀 Starting generation in 'both' mode: shot_type ➜ expression")
-    run_shot_type_generation()
-    run_expression_generation()
 
-def send_request(payload, progress):
+    def __init__(self):
+        self.started = time.monotonic()
+        self.done = 0
+        self.failed = 0
+        self._finished = collections.deque()
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, ok, latency=None):
+        if ok:
+            self.done += 1
+            self._finished.append(time.monotonic())
+        else:
+            self.failed += 1
+        if latency is not None:
+            self._latencies.append(latency)
+
+    def rate(self):
+        """분당 완료 수"""
+        now = time.monotonic()
+        while self._finished and now - self._finished[0] > RATE_WINDOW:
+            self._finished.popleft()
+        span = min(RATE_WINDOW, now - self.started)
+        return len(self._finished) * 60 / span if span > 0 else 0.0
+
+    def percentile(self, q):
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def line(self, remaining, in_flight, server_pending):
+        rate = self.rate()
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        latency = f"p50 {p50:.1f}s p95 {p95:.1f}s" if p50 is not None else "p50 - p95 -"
+        eta = format_duration(remaining / rate * 60) if rate > 0 else "-"
+        pending = "?" if server_pending is None else server_pending
+        return (f"📈 done {self.done} | failed {self.failed} | in flight {in_flight} (server pending {pending}) | "
+                f"{rate:.1f} img/min | {latency} | ETA {eta}")
+
+def log(message):
+    """진행 상황 줄을 지우고 메시지를 출력함 (진행 상황 줄은 다음 확인 때 다시 그려짐)"""
+    print(f"\r\033[K{message}", flush=True)
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s"
+
+async def submit_and_wait(ledger, run_id):
+    """
+    원장에서 보낼 차례인 작업을 서버 대기열에 넣고, 모두 끝날 때까지 상태를 확인함
+    커넥션 풀을 공유하는 httpx.AsyncClient 로 전송/상태 확인 요청을 MAX_CONCURRENCY 개까지 동시에 보냄
+    서버 대기열이 queue_depth * BACKLOG_PER_SLOT 을 넘지 않게 전송량을 조절하고 (백프레셔),
+    실패하거나 JOB_DEADLINE 을 넘긴 작업은 MAX_ATTEMPTS 까지 지수 백오프로 다시 보냄
+    """
+    limits = httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY)
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=limits) as client:
+        limiter = asyncio.Semaphore(MAX_CONCURRENCY)
+        stats = ProgressStats()
+
+        # 이전 실행에서 전송된 작업 중 서버가 모르는 것(서버 재시작 등)은 다시 보냄
+        now = time.monotonic()
+        outstanding = {job_id: (mode, idx, 0, now) for job_id, (mode, idx) in ledger.submitted(run_id).items()}
+        statuses = await fetch_statuses(client, limiter, list(outstanding)) if outstanding else None
+        if statuses is not None:
+            known = {status["job_id"] for status in statuses}
+            for job_id in list(outstanding):
+                if job_id not in known:
+                    mode, idx, _, _ = outstanding.pop(job_id)
+                    ledger.mark_planned(run_id, mode, idx)
+            ledger.flush()
+
+        while True:
+            # 1. 서버 대기열에 여유가 있는 만큼만 다음 작업들을 전송
+            backlog = await fetch_backlog(client, limiter)
+            server_pending = backlog[0] if backlog else None
+            free = MAX_OUTSTANDING - len(outstanding)
+            if backlog is not None:
+                pending, queue_depth = backlog
+                free = min(free, queue_depth * BACKLOG_PER_SLOT - pending)
+            else:
+                free = 0
+            if free > 0:
+                planned = ledger.next_batch(run_id, free, MAX_ATTEMPTS)
+                batches = [planned[start:start + SUBMIT_BATCH_SIZE] for start in range(0, len(planned), SUBMIT_BATCH_SIZE)]
+                results = await asyncio.gather(*(submit_batch(client, limiter, batch) for batch in batches))
+                now = time.monotonic()
+                for batch, job_ids in zip(batches, results):
+                    if job_ids is None:
+                        continue
+                    for (payload, attempts), job_id in zip(batch, job_ids):
+                        outstanding[job_id] = (payload["generation_mode"], payload["index"], attempts, now)
+                        ledger.mark_submitted(run_id, payload["generation_mode"], payload["index"], job_id)
+                ledger.flush()
+
+            remaining = ledger.remaining(run_id, MAX_ATTEMPTS)
+            print(f"\r\033[K{stats.line(remaining, len(outstanding), server_pending)}", end="", flush=True)
+            if not outstanding and remaining == 0:
+                break
+
+            # 2. 전송한 작업의 상태 확인
+            await asyncio.sleep(POLL_INTERVAL)
+            statuses = await fetch_statuses(client, limiter, list(outstanding)) if outstanding else []
+            if DOWNLOAD_DIR is not None:
+                done = [status for status in statuses or [] if status["status"] == "done"]
+                errors = await asyncio.gather(*(download_outputs(client, limiter, status["result"]) for status in done))
+                for status, error in zip(done, errors):
+                    if error is not None:
+                        status.update(status="failed", error=f"download failed: {error}")
+            now = time.monotonic()
+            for status in statuses or []:
+                if status["status"] not in ("done", "failed", "cancelled"):
+                    continue
+                mode, idx, attempts, submitted_at = outstanding.pop(status["job_id"])
+                if status.get("finished_at") and status.get("created_at"):
+                    latency = status["finished_at"] - status["created_at"]
+                else:
+                    latency = now - submitted_at
+                if status["status"] == "done":
+                    result = status.get("result") or {}
+                    ledger.mark_done(run_id, mode, idx, prompt=result.get("prompt"), seed=result.get("seed"),
+                                     outputs=result.get("images") or result.get("image"))
+                    stats.record(True, latency)
+                elif status["status"] == "cancelled":
+                    # 서버에서 취소된 작업은 다시 보내지 않음
+                    ledger.mark_cancelled(run_id, mode, idx)
+                    log(f"🛑 Cancelled: {mode} index {idx}")
+                else:
+                    retry_at = time.time() + RETRY_BACKOFF * 2 ** attempts
+                    ledger.mark_failed(run_id, mode, idx, status["error"], retry_at)
+                    stats.record(False, latency)
+                    log(f"❌ Failed: {mode} index {idx} - {status['error']}")
+
+            # 3. 기한을 넘긴 작업은 실패로 처리 (재시도 때 서버 결과 캐시에 있으면 바로 완료됨)
+            for job_id, (mode, idx, attempts, submitted_at) in list(outstanding.items()):
+                if now - submitted_at > JOB_DEADLINE:
+                    del outstanding[job_id]
+                    retry_at = time.time() + RETRY_BACKOFF * 2 ** attempts
+                    ledger.mark_failed(run_id, mode, idx, f"deadline exceeded ({JOB_DEADLINE}s)", retry_at)
+                    stats.record(False)
+                    log(f"⏰ Deadline exceeded: {mode} index {idx}")
+            ledger.flush()
+
+    print(f"\n🎉 Run {run_id} finished: {ledger.summary(run_id)}")
+
+async def submit_batch(client, limiter, batch):
     """
-    API를 호출하여 이미지를 생성함
+    작업 묶음을 /jobs 로 전송하고 job_id 목록을 반환함 (실패 시 None)
     """
-    print(f"▶ [{progress}] Sending request: {payload}")
+    extra = {key: value for key, value in (("priority", PRIORITY), ("tenant", TENANT)) if value is not None}
     try:
-        res = requests.post(API_URL, json=payload, timeout=300)
-        if res.ok:
-            print(f"✅ Success: {res.json().get('prompt', 'N/A')}")
-        else:
-            print(f"❌ Failed: {res.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Request failed: {e}")
-    time.sleep(1)
+        async with limiter:
+            res = await client.post(JOBS_URL, json={"jobs": [{**payload, **extra} for payload, _ in batch]})
+        if res.status_code == 429:
+            # 서버 대기열이 우선순위 한도에 걸림: 다음 확인 때 다시 보냄
+            log(f"⏸️ Server queue full, retrying later: {res.json().get('detail')}")
+            return None
+        res.raise_for_status()
+    except httpx.HTTPError as e:
+        log(f"❌ Submit failed: {e!r}")
+        return None
+    return res.json()["job_ids"]
+
+async def download_outputs(client, limiter, result):
+    """
+    작업 결과의 이미지와 캡션을 /files 에서 DOWNLOAD_DIR 로 내려받음 (실패 시 오류 메시지, 성공 시 None)
+    파일은 임시 이름으로 받은 뒤 옮겨서 중간에 끊겨도 반쪽 파일이 남지 않음
+    """
+    names = list(result.get("images") or [])
+    if result.get("caption"):
+        names.append(result["caption"])
+    try:
+        for name in names:
+            path = Path(DOWNLOAD_DIR) / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.part")
+            async with limiter:
+                async with client.stream("GET", f"{FILES_URL}/{name}") as res:
+                    res.raise_for_status()
+                    with open(tmp, "wb") as f:
+                        async for chunk in res.aiter_bytes():
+                            f.write(chunk)
+            os.replace(tmp, path)
+    except (httpx.HTTPError, OSError) as e:
+        log(f"❌ Download failed: {e!r}")
+        return repr(e)
+    return None
+
+async def fetch_backlog(client, limiter):
+    """
+    서버 대기열의 (pending, queue_depth)를 조회함 (실패 시 None)
+    """
+    try:
+        async with limiter:
+            res = await client.get(QUEUE_URL)
+        res.raise_for_status()
+    except httpx.HTTPError as e:
+        log(f"❌ Queue check failed: {e!r}")
+        return None
+    queue = res.json()
+    return queue["pending"], queue["queue_depth"]
+
+async def fetch_statuses(client, limiter, job_ids):
+    """
+    서버에 여러 작업의 상태를 동시에 나눠서 물어봄 (실패 시 None)
+    """
+    async def fetch(chunk):
+        async with limiter:
+            res = await client.post(f"{JOBS_URL}/status", json={"job_ids": chunk})
+        res.raise_for_status()
+        return res.json()["jobs"]
+
+    chunk_size = SUBMIT_BATCH_SIZE * 10
+    try:
+        chunks = await asyncio.gather(*(fetch(job_ids[start:start + chunk_size])
+                                        for start in range(0, len(job_ids), chunk_size)))
+    except httpx.HTTPError as e:
+        log(f"❌ Status check failed: {e!r}")
+        return None
+    return [status for chunk in chunks for status in chunk]
 
 if __name__ == "__main__":
-    if GENERATION_MODE == "shot_type":
-        run_shot_type_generation()
-    elif GENERATION_MODE == "expression":
-        run_expression_generation()
-    elif GENERATION_MODE == "both":
-        run_both_generation()
+    parser = argparse.ArgumentParser(description="Dataset generation driver")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("run", help="plan a new run from the configuration above (default)")
+    resume_parser = subparsers.add_parser("resume", help="re-submit only missing or failed jobs")
+    resume_parser.add_argument("--run-id", help="run to resume (default: latest)")
+    args = parser.parse_args()
+
+    if args.command == "resume":
+        resume_generation(args.run_id)
+    elif GENERATION_MODE in ("shot_type", "expression", "both"):
+        run_generation(GENERATION_MODE)
     else:
         print(f"❌ Invalid GENERATION_MODE: '{GENERATION_MODE}'. Please use 'shot_type', 'expression', or 'both'.")
@@ -0,0 +1,210 @@
+import json
+import sqlite3
+import time
+import uuid
+
+# 계획된 작업을 한 번에 INSERT 할 개수
+PLAN_CHUNK_SIZE = 10000
+# 버퍼에 쌓인 상태 변경이 이 개수를 넘으면 자동으로 기록
+FLUSH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    mode TEXT NOT NULL,
+    config TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    character TEXT NOT NULL,
+    trigger_word TEXT NOT NULL,
+    expression TEXT,
+    angle TEXT,
+    prompt TEXT,
+    seed INTEGER,
+    seed_run_id TEXT,
+    state TEXT NOT NULL DEFAULT 'planned',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    retry_at REAL NOT NULL DEFAULT 0,
+    job_id TEXT,
+    outputs TEXT,
+    error TEXT,
+    updated_at REAL,
+    PRIMARY KEY (run_id, mode, idx)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (run_id, state);
+"""
+
+
+class JobLedger:
+    """
+    generate_loop 실행 기록을 SQLite 파일에 남기는 작업 원장.
+
+    계획된 작업마다 (mode, character, expression, angle, index, prompt, seed)와
+    상태(planned -> submitted -> done | failed | cancelled), 출력 파일을 기록해 두므로
+    프로세스가 중간에 죽어도 resume 으로 남은 작업만 다시 보낼 수 있습니다.
+    상태 변경은 버퍼에 모았다가 flush() 때 하나의 트랜잭션으로 기록합니다.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    # --- 실행(run) ---
+    def create_run(self, mode, config=None):
+        run_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO runs (run_id, mode, config, created_at) VALUES (?, ?, ?, ?)",
+                (run_id, mode, json.dumps(config or {}, ensure_ascii=False), time.time()),
+            )
+        return run_id
+
+    def latest_run(self):
+        row = self._conn.execute("SELECT run_id FROM runs ORDER BY created_at DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def plan(self, run_id, payloads):
+        """payload 이터러블을 청크 단위로 기록합니다. (목록 전체를 메모리에 올리지 않음)"""
+        now = time.time()
+        rows = (
+            (run_id, p["generation_mode"], p["index"], p["character_name"], p["trigger_word"],
+             p.get("expression"), p.get("angle"), p.get("seed"), p.get("run_id"), now)
+            for p in payloads
+        )
+        total = 0
+        while True:
+            chunk = [row for _, row in zip(range(PLAN_CHUNK_SIZE), rows)]
+            if not chunk:
+                break
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO jobs (run_id, mode, idx, character, trigger_word, expression, angle, seed, seed_run_id, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    chunk,
+                )
+            total += len(chunk)
+        return total
+
+    # --- 조회 ---
+    def next_batch(self, run_id, limit, max_attempts):
+        """보낼 차례인 작업(planned, 또는 재시도 대기가 끝난 failed)을 (payload, 시도 횟수) 목록으로 반환합니다."""
+        rows = self._conn.execute(
+            "SELECT mode, idx, character, trigger_word, expression, angle, seed, seed_run_id, attempts FROM jobs "
+            "WHERE run_id = ? AND (state = 'planned' OR (state = 'failed' AND attempts < ? AND retry_at <= ?)) "
+            "LIMIT ?",
+            (run_id, max_attempts, time.time(), limit),
+        ).fetchall()
+        return [(_payload(row[:-1]), row[-1]) for row in rows]
+
+    def submitted(self, run_id):
+        """submitted 상태인 작업의 {job_id: (mode, index)}"""
+        rows = self._conn.execute(
+            "SELECT job_id, mode, idx FROM jobs WHERE run_id = ? AND state = 'submitted'", (run_id,)
+        ).fetchall()
+        return {job_id: (mode, idx) for job_id, mode, idx in rows}
+
+    def remaining(self, run_id, max_attempts):
+        """아직 끝나지 않았거나 재시도할 수 있는 작업 수"""
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE run_id = ? AND "
+            "(state IN ('planned', 'submitted') OR (state = 'failed' AND attempts < ?))",
+            (run_id, max_attempts),
+        ).fetchone()[0]
+
+    def summary(self, run_id):
+        rows = self._conn.execute(
+            "SELECT state, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY state", (run_id,)
+        ).fetchall()
+        return dict(rows)
+
+    def done_outputs(self, run_id=None):
+        """
+        완료된 작업의 (run_id, mode, idx, character, seed, seed_run_id, 출력 파일) 을 차례로 돌려줍니다.
+        run_id 를 주면 그 실행만. (출력 파일은 파일명 목록, 이전 기록은 파일명 하나)
+        """
+        sql = "SELECT run_id, mode, idx, character, seed, seed_run_id, outputs FROM jobs WHERE state = 'done' AND outputs IS NOT NULL"
+        params = ()
+        if run_id is not None:
+            sql += " AND run_id = ?"
+            params = (run_id,)
+        for row in self._conn.execute(sql, params):
+            yield row[:-1] + (json.loads(row[-1]),)
+
+    # --- 상태 변경 (버퍼링) ---
+    def mark_submitted(self, run_id, mode, idx, job_id):
+        self._push("UPDATE jobs SET state = 'submitted', job_id = ?, updated_at = ? WHERE run_id = ? AND mode = ? AND idx = ?",
+                   (job_id, time.time(), run_id, mode, idx))
+
+    def mark_planned(self, run_id, mode, idx):
+        """서버가 모르는 submitted 작업(서버 재시작 등)을 다시 보낼 수 있게 되돌립니다."""
+        self._push("UPDATE jobs SET state = 'planned', job_id = NULL, updated_at = ? WHERE run_id = ? AND mode = ? AND idx = ?",
+                   (time.time(), run_id, mode, idx))
+
+    def mark_done(self, run_id, mode, idx, prompt=None, seed=None, outputs=None):
+        self._push("UPDATE jobs SET state = 'done', prompt = ?, seed = COALESCE(?, seed), outputs = ?, error = NULL, updated_at = ? "
+                   "WHERE run_id = ? AND mode = ? AND idx = ?",
+                   (prompt, seed, json.dumps(outputs, ensure_ascii=False) if outputs else None, time.time(), run_id, mode, idx))
+
+    def mark_failed(self, run_id, mode, idx, error, retry_at):
+        self._push("UPDATE jobs SET state = 'failed', attempts = attempts + 1, retry_at = ?, error = ?, updated_at = ? "
+                   "WHERE run_id = ? AND mode = ? AND idx = ?",
+                   (retry_at, error, time.time(), run_id, mode, idx))
+
+    def mark_cancelled(self, run_id, mode, idx):
+        """서버에서 취소된 작업은 재시도하지 않습니다. (remaining 에서 제외)"""
+        self._push("UPDATE jobs SET state = 'cancelled', error = 'cancelled', updated_at = ? WHERE run_id = ? AND mode = ? AND idx = ?",
+                   (time.time(), run_id, mode, idx))
+
+    def requeue(self, run_id, mode, idx, seed, reason):
+        """
+        완료되었지만 품질 검사에서 떨어진 작업을 새 시드로 다시 계획합니다. (resume 으로 재생성)
+        시드가 같으면 서버 결과 캐시가 같은 결과를 돌려주므로 반드시 새 시드를 줄 것.
+        """
+        self._push("UPDATE jobs SET state = 'planned', seed = ?, attempts = 0, retry_at = 0, job_id = NULL, outputs = NULL, "
+                   "error = ?, updated_at = ? WHERE run_id = ? AND mode = ? AND idx = ?",
+                   (seed, reason, time.time(), run_id, mode, idx))
+
+    def _push(self, sql, params):
+        self._buffer.append((sql, params))
+        if len(self._buffer) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """버퍼에 쌓인 상태 변경을 하나의 트랜잭션으로 기록합니다."""
+        if not self._buffer:
+            return
+        buffer, self._buffer = self._buffer, []
+        with self._conn:
+            for sql, params in buffer:
+                self._conn.execute(sql, params)
+
+
+def _payload(row):
+    mode, idx, character, trigger_word, expression, angle, seed, seed_run_id = row
+    payload = {
+        "generation_mode": mode,
+        "trigger_word": trigger_word,
+        "character_name": character,
+        "index": idx,
+    }
+    if expression is not None:
+        payload["expression"] = expression
+    if angle is not None:
+        payload["angle"] = angle
+    if seed is not None:
+        payload["seed"] = seed
+    if seed_run_id is not None:
+        payload["run_id"] = seed_run_id
+    return payload
@@ -1,58 +1,268 @@
+import argparse
+import errno
+import fcntl
+import json
 import os
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-def organize_files():
+SOURCE_DIR = "/home/jonathan/Desktop/NewSSD500GB/newssd/pythonProject/ComfyUI/output"
+MANIFEST_NAME = "manifest.jsonl"
+# 매니페스트 옆의 잠금 파일: 덧붙이기(organize_output)와 통째로 다시 쓰기(validate_dataset)를 서로 배제
+MANIFEST_LOCK_SUFFIX = ".lock"
+
+# 병렬 이동에 사용할 스레드 수
+NUM_WORKERS = 16
+# watch 모드: 폴더를 다시 확인하는 주기 (초)
+WATCH_INTERVAL = 2.0
+# watch 모드: 마지막 수정 후 이 시간(초)이 지나야 파일이 다 써진 것으로 간주
+SETTLE_SECONDS = 1.0
+# watch 모드: 이미지가 생긴 뒤 캡션을 기다리는 최대 시간 (초). 지나면 이미지만 옮김
+CAPTION_TIMEOUT = 60.0
+
+
+def parse_filename(filename):
     """
-    Organizes files from a source directory into a structured destination directory
-    based on parsing the filenames.
+    파일명에서 (character, shot_type, emotion, angle)을 추출합니다.
+    형식이 맞지 않으면 None 을 반환합니다.
+    """
+    parts = filename.split('_')
+    if len(parts) < 5:
+        return None
+
+    shot_type = parts[0]
+    character = parts[2]
+    emotion = parts[3]
+
+    # The angle might contain underscores, so we join the rest
+    angle_parts = parts[4:-1]
+    angle = "_".join(angle_parts)
+    return character, shot_type, emotion, angle
+
+
+def scan_samples(source_dir):
+    """
+    os.scandir 로 폴더를 한 번만 읽어 이미지/캡션을 같은 이름(stem)끼리 묶습니다.
+
+    Returns:
+        dict: stem -> {"png": DirEntry, "txt": DirEntry}
+    """
+    samples = {}
+    with os.scandir(source_dir) as entries:
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if ext not in (".png", ".txt") or not entry.is_file():
+                continue
+            samples.setdefault(stem, {})[ext[1:]] = entry
+    return samples
+
+
+def _move(source, destination):
+    """
+    원본을 destination 으로 옮깁니다. destination 이 이미 있으면 덮어쓰지 않고 FileExistsError.
+    같은 파일 시스템이면 하드 링크 후 원본 삭제(이미 있으면 link 가 원자적으로 실패), 아니면 확인 후 shutil.move.
+    """
+    try:
+        os.link(source, destination)
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.ENOTSUP):
+            raise
+        # 다른 파일 시스템이거나 하드 링크를 지원하지 않는 파일 시스템
+        if os.path.lexists(destination):
+            raise FileExistsError(errno.EEXIST, "destination exists", destination)
+        shutil.move(source, destination)
+        return
+    os.unlink(source)
+
+
+def _unique_stem(stem, target_dir, names, taken):
+    """
+    target_dir 에 이미 있는(names) 파일이나 이번에 옮길(taken, 대상 경로) 파일과 겹치지 않는 이름(확장자 제외)을 고릅니다.
+    ComfyUI 는 output 폴더에 남은 가장 큰 번호 다음부터 번호를 매기므로, 파일을 옮기고 나면 같은 이름이 다시 나옴
+    """
+    candidate, n = stem, 1
+    while any(f"{candidate}{ext}" in names or f"{target_dir}/{candidate}{ext}" in taken for ext in (".png", ".txt")):
+        n += 1
+        candidate = f"{stem}{n}"
+    return candidate
+
+
+@contextmanager
+def manifest_lock(manifest_path):
+    """
+    매니페스트 잠금 (fcntl.flock, 프로세스 간 배타 잠금).
+    validate_dataset 이 매니페스트를 os.replace 로 교체하는 동안 덧붙인 줄이 옛 파일에 쓰여 사라지지 않도록
+    매니페스트를 열고 쓰는 곳은 모두 이 잠금 안에서 엽니다.
+    """
+    with open(f"{manifest_path}{MANIFEST_LOCK_SUFFIX}", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def append_manifest(manifest_path, records):
+    """잠금 안에서 매니페스트를 열어 레코드를 한 줄씩 덧붙입니다."""
+    with manifest_lock(manifest_path):
+        with open(manifest_path, "a", encoding="utf-8") as manifest:
+            manifest.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+
+def organize_samples(samples, source_dir, destination_base_dir, workers=NUM_WORKERS, manifest_path=None):
     """
-    source_dir = "/home/jonathan/Desktop/NewSSD500GB/newssd/pythonProject/ComfyUI/output"
-    
-    destination_base_dir = source_dir
+    (stem, {"png": ..., "txt": ...}) 목록을 캐릭터/샷타입/감정/앵글 폴더로 옮기고
+    manifest_path(JSONL)에 샘플마다 한 줄씩 덧붙입니다. (다 옮긴 뒤 잠금 안에서 열어 씀)
 
-    for filename in os.listdir(source_dir):
-        source_file_path = os.path.join(source_dir, filename)
-        if os.path.isfile(source_file_path) and filename.endswith(".png"):
+    Returns:
+        tuple: (옮긴 샘플 수, 건너뛴 샘플 수)
+    """
+    moves = []
+    records = []
+    target_dirs = {}
+    existing = {}  # 대상 폴더 -> 이미 있는 파일 이름 (폴더마다 한 번만 읽음)
+    taken = set()  # 이번에 옮길 대상 경로
+    skipped = 0
+    for stem, files in samples:
+        png = files.get("png")
+        if png is None:
+            continue
+        parsed = parse_filename(png.name)
+        if parsed is None:
+            skipped += 1
+            continue
+        character, shot_type, emotion, angle = parsed
+        relative_dir = f"{character}/{shot_type}/{emotion}/{angle}"
+        target_dir = target_dirs.get(relative_dir)
+        if target_dir is None:
+            target_dir = target_dirs[relative_dir] = os.path.join(destination_base_dir, relative_dir)
             try:
-                parts = filename.split('_')
-                if len(parts) < 5:
-                    print(f"Skipping file with unexpected name format: {filename}")
-                    continue
+                existing[target_dir] = set(os.listdir(target_dir))
+            except FileNotFoundError:
+                existing[target_dir] = set()
+
+        # 같은 이름이 이미 있으면 덮어쓰지 않도록 번호를 붙인 이름으로 옮김 (이미지와 캡션은 같은 이름 유지)
+        target_stem = _unique_stem(stem, target_dir, existing[target_dir], taken)
+        txt = files.get("txt")
+        image_move = (png.path, f"{target_dir}/{target_stem}.png")
+        caption_move = (txt.path, f"{target_dir}/{target_stem}.txt") if txt is not None else None
+        for move in (image_move, caption_move):
+            if move is not None:
+                moves.append(move)
+                taken.add(move[1])
+        records.append((image_move, caption_move, {
+            "image": f"{relative_dir}/{target_stem}.png",
+            "caption": f"{relative_dir}/{target_stem}.txt" if txt is not None else None,
+            # ComfyUI output 폴더 기준 원래 경로 (generate_loop 원장의 outputs 와 같은 형식, validate_dataset 재계획에 사용)
+            "source": os.path.relpath(png.path, source_dir),
+            "character": character,
+            "shot_type": shot_type,
+            "emotion": emotion,
+            "angle": angle,
+        }))
+
+    # 대상 폴더는 한 번씩만 생성
+    for target_dir in target_dirs.values():
+        os.makedirs(target_dir, exist_ok=True)
 
-                shot_type = parts[0]
-                character = parts[2]
-                emotion = parts[3]
-                
-                # The angle might contain underscores, so we join the rest
-                angle_parts = parts[4:-1]
-                angle = "_".join(angle_parts)
-
-                # Create the directory structure
-                target_dir = os.path.join(destination_base_dir, character, shot_type, emotion, angle)
-                if not os.path.exists(target_dir):
-                    os.makedirs(target_dir)
-
-                # Move the file
-                source_file_path = os.path.join(source_dir, filename)
-                destination_file_path = os.path.join(target_dir, filename)
-                
-                # To avoid errors if the script is run multiple times, check if the file is still there
-                if os.path.exists(source_file_path):
-                    shutil.move(source_file_path, destination_file_path)
-                    print(f"Moved: {filename} -> {destination_file_path}")
-                else:
-                    print(f"File already moved or does not exist, skipping: {filename}")
-
-
-            except IndexError as e:
-                print(f"Could not parse filename: {filename}. Error: {e}")
-            except Exception as e:
-                print(f"An error occurred while processing {filename}. Error: {e}")
-
-    print("\nFile organization complete.")
+    # 파일마다 작업을 제출하면 스레드풀 오버헤드가 rename 보다 커지므로 워커별로 나눠서 넘김
+    if workers <= 1 or len(moves) < workers:
+        failed = _move_chunk(moves)
+    else:
+        failed = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk_failed in executor.map(_move_chunk, [moves[i::workers] for i in range(workers)]):
+                failed |= chunk_failed
+
+    # 실패 여부는 (원본, 대상) 쌍으로 확인. 캡션만 못 옮긴 샘플은 캡션 없이 기록
+    moved_records = []
+    for image_move, caption_move, record in records:
+        if image_move in failed:
+            continue
+        if caption_move in failed:
+            record["caption"] = None
+        moved_records.append(record)
+    if manifest_path is not None and moved_records:
+        append_manifest(manifest_path, moved_records)
+    return len(moved_records), skipped
+
+
+def _move_chunk(moves):
+    """moves 를 순서대로 옮기고 실패한 (원본, 대상) 집합을 반환합니다."""
+    failed = set()
+    for source, destination in moves:
+        try:
+            _move(source, destination)
+        except Exception as e:
+            print(f"An error occurred while moving {source}. Error: {e}")
+            failed.add((source, destination))
+    return failed
+
+
+def organize_files(source_dir=SOURCE_DIR, destination_base_dir=None, workers=NUM_WORKERS):
+    """
+    Organizes files from a source directory into a structured destination directory
+    based on parsing the filenames. (batch mode)
+    """
+    destination_base_dir = destination_base_dir or source_dir
+    start = time.perf_counter()
+    samples = scan_samples(source_dir)
+
+    manifest_path = os.path.join(destination_base_dir, MANIFEST_NAME)
+    moved, skipped = organize_samples(samples.items(), source_dir, destination_base_dir, workers, manifest_path)
+
+    print(f"\nFile organization complete in {time.perf_counter() - start:.1f}s.")
+    print(f"Moved {moved} samples, skipped {skipped} files with unexpected name format.")
     print(f"All organizable files have been moved to: {destination_base_dir}")
-    print(f"The original directory '{source_dir}' might now contain files that could not be parsed or are not images.")
+    print(f"Manifest: {manifest_path}")
+    return moved, skipped
+
+
+def watch_files(source_dir=SOURCE_DIR, destination_base_dir=None, workers=NUM_WORKERS, interval=WATCH_INTERVAL):
+    """
+    폴더를 주기적으로 확인하면서 이미지/캡션 쌍이 모두 다 써지면 바로 옮깁니다. (watch mode)
+    캡션이 CAPTION_TIMEOUT 안에 나타나지 않으면 이미지만 옮깁니다.
+    """
+    destination_base_dir = destination_base_dir or source_dir
+    manifest_path = os.path.join(destination_base_dir, MANIFEST_NAME)
+    print(f"👀 Watching {source_dir} (Ctrl+C to stop)")
+    total = 0
+    try:
+        while True:
+            now = time.time()
+            ready = []
+            for stem, files in scan_samples(source_dir).items():
+                if "png" not in files:
+                    continue
+                mtimes = [entry.stat().st_mtime for entry in files.values()]
+                if now - max(mtimes) < SETTLE_SECONDS:
+                    continue
+                if "txt" not in files and now - mtimes[0] < CAPTION_TIMEOUT:
+                    continue
+                ready.append((stem, files))
+            if ready:
+                # 매니페스트는 옮긴 뒤 잠금 안에서 다시 열어 덧붙임 (validate_dataset 이 판정을 넣어 파일을 교체할 수 있음)
+                moved, _ = organize_samples(ready, source_dir, destination_base_dir, workers, manifest_path)
+                total += moved
+                print(f"Moved {moved} samples (total {total})")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print(f"\nStopped watching. Moved {total} samples.")
 
 
 if __name__ == "__main__":
-    organize_files()
+    parser = argparse.ArgumentParser(description="Organize ComfyUI outputs into character/shot_type/emotion/angle folders")
+    parser.add_argument("--source", default=SOURCE_DIR, help="ComfyUI output directory")
+    parser.add_argument("--dest", default=None, help="destination base directory (default: same as source)")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--watch", action="store_true", help="keep watching and move samples as they complete")
+    args = parser.parse_args()
+
+    if args.watch:
+        watch_files(args.source, args.dest, args.workers)
+    else:
+        organize_files(args.source, args.dest, args.workers)
@@ -0,0 +1,441 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from app.prompt_util import SEED_MASK, derive_seed
+from job_ledger import JobLedger
+from organize_output import MANIFEST_NAME, SOURCE_DIR, manifest_lock
+
+# 병렬 분석에 사용할 프로세스 수
+NUM_WORKERS = os.cpu_count() or 1
+# 프로세스 하나에 한 번에 넘길 이미지 수 (묶음 단위로 NumPy 계산)
+CHUNK_SIZE = 256
+# 통계/해시를 계산할 축소 이미지 크기 (BOX 축소라 평균 밝기는 원본과 같음)
+THUMB_SIZE = 64
+# pHash: THUMB_SIZE/2 크기에서 DCT 후 왼쪽 위 HASH_SIZE x HASH_SIZE 계수 -> 64비트
+HASH_SIZE = 8
+
+# 검정(또는 거의 검정) 프레임: 평균 밝기(0~255)가 이 값 미만
+BLACK_MEAN = 8.0
+# 단색(빈) 프레임: 밝기 표준편차가 이 값 미만
+FLAT_STD = 2.0
+# 같은 캐릭터의 앞선 샘플과 pHash 해밍 거리가 이 값 이하이면 중복으로 판정
+NEAR_DUPLICATE_DISTANCE = 6
+# 참조(입력) 이미지와 pHash 해밍 거리가 이 값 이하이면 참조 이미지 복사본으로 판정 (Kontext 가 아무것도 바꾸지 않음)
+REFERENCE_DISTANCE = 4
+# 캡션 태그가 이 개수 이하이면 빈 캡션 (트리거 워드만 있는 경우)
+MIN_CAPTION_TAGS = 1
+# 참조 이미지 파일 패턴 (SOURCE_DIR 기준): shot_type 모드 참조 이미지 {샷}_{트리거}.png
+REFERENCE_GLOBS = ["closeup_*.png", "bustShot_*.png", "kneeShot_*.png", "fullShot_*.png"]
+# watch 모드: 다시 검사하는 주기 (초)
+VALIDATE_INTERVAL = 60.0
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(THUMB_SIZE // 2)
+
+
+def popcount(values):
+    """uint64 배열의 비트 수 (NumPy 2 의 bitwise_count, 없으면 바이트 표 조회)"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _POPCOUNT8[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+
+def load_thumbnails(paths):
+    """
+    이미지들을 THUMB_SIZE x THUMB_SIZE 흑백(float32)으로 읽어 (n, T, T) 배열로 쌓습니다.
+    읽지 못한 이미지(없음, 깨짐)는 함께 반환하는 ok 배열에 False 로 표시합니다.
+    """
+    thumbs = np.zeros((len(paths), THUMB_SIZE, THUMB_SIZE), dtype=np.float32)
+    ok = np.zeros(len(paths), dtype=bool)
+    for i, path in enumerate(paths):
+        try:
+            with Image.open(path) as image:
+                # JPEG 은 디코딩 단계에서 축소 (PNG 는 무시됨)
+                image.draft("L", (THUMB_SIZE * 2, THUMB_SIZE * 2))
+                thumbs[i] = np.asarray(image.convert("L").resize((THUMB_SIZE, THUMB_SIZE), Image.BOX), dtype=np.float32)
+            ok[i] = True
+        except (OSError, ValueError):
+            continue
+    return thumbs, ok
+
+
+def image_features(thumbs):
+    """
+    축소 이미지 묶음의 (pHash uint64, 평균 밝기, 밝기 표준편차)를 한 번에 계산합니다.
+    pHash 는 2x2 평균으로 한 번 더 줄인 뒤 DCT 의 저주파 HASH_SIZE x HASH_SIZE 계수를 중앙값과 비교합니다.
+    """
+    n = len(thumbs)
+    half = THUMB_SIZE // 2
+    small = thumbs.reshape(n, half, 2, half, 2).mean(axis=(2, 4))
+    coeffs = (_DCT @ small @ _DCT.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(n, -1)
+    bits = coeffs > np.median(coeffs, axis=1, keepdims=True)
+    hashes = np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+    return hashes, thumbs.mean(axis=(1, 2)), thumbs.std(axis=(1, 2))
+
+
+def caption_tag_count(path):
+    """캡션 파일의 태그 수 (파일이 없으면 -1)"""
+    if path is None:
+        return -1
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except OSError:
+        return -1
+    return sum(1 for tag in text.split(",") if tag.strip())
+
+
+def analyze_chunk(paths):
+    """
+    이미지 묶음을 분석합니다. (프로세스 풀 워커)
+
+    Returns:
+        dict: 배열마다 이미지 순서대로 ok(읽기 성공), phash, mean, std
+    """
+    thumbs, ok = load_thumbnails(paths)
+    hashes, means, stds = image_features(thumbs)
+    return {"ok": ok, "phash": hashes, "mean": means, "std": stds}
+
+
+def analyze(paths, workers=NUM_WORKERS):
+    """모든 이미지를 CHUNK_SIZE 씩 나눠 프로세스 풀에서 분석하고 결과 배열을 이어 붙입니다."""
+    chunks = [paths[i:i + CHUNK_SIZE] for i in range(0, len(paths), CHUNK_SIZE)]
+    if not chunks:
+        return {"ok": np.zeros(0, dtype=bool), "phash": np.zeros(0, dtype=np.uint64),
+                "mean": np.zeros(0), "std": np.zeros(0)}
+    if workers <= 1 or len(chunks) == 1:
+        results = [analyze_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(analyze_chunk, chunks))
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+
+def near_duplicate_pairs(hashes, groups, max_distance=NEAR_DUPLICATE_DISTANCE):
+    """
+    같은 그룹 안에서 pHash 해밍 거리가 max_distance 이하인 (i, j) 쌍 (i < j)을 찾습니다.
+
+    64비트를 max_distance + 1 개의 구간으로 나누면 거리가 max_distance 이하인 두 해시는
+    비둘기집 원리로 적어도 한 구간이 완전히 같습니다. 그래서 (그룹, 구간, 구간 값)이 같은
+    버킷 안에서만 비교하면 O(n²) 비교 없이도 빠짐없이 찾을 수 있습니다. (LSH 밴딩)
+    버킷 안의 비교는 XOR + popcount 로 한 번에 계산합니다.
+    """
+    n = len(hashes)
+    if n < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    bands = max_distance + 1
+    edges = np.linspace(0, 64, bands + 1).astype(int)
+    found = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        width = int(end - start)
+        values = (hashes >> np.uint64(start)) & np.uint64((1 << width) - 1)
+        keys = groups.astype(np.uint64) << np.uint64(width) | values
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+        for bucket in np.split(order, boundaries):
+            if len(bucket) > 1:
+                found.append(_bucket_pairs(np.sort(bucket), hashes, max_distance))
+    if not found:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.concatenate(found)
+    # 여러 구간에서 같은 쌍이 나올 수 있으므로 중복 제거
+    return np.unique(pairs, axis=0) if len(pairs) else pairs
+
+
+def _bucket_pairs(members, hashes, max_distance, block=2048):
+    """버킷 안의 모든 쌍의 거리를 블록 단위로 계산 (메모리: block x 버킷 크기)"""
+    pairs = []
+    bucket_hashes = hashes[members]
+    for start in range(0, len(members), block):
+        rows = bucket_hashes[start:start + block]
+        distances = popcount(rows[:, None] ^ bucket_hashes[None, :])
+        i, j = np.nonzero(distances <= max_distance)
+        i += start
+        keep = i < j
+        pairs.append(np.stack([members[i[keep]], members[j[keep]]], axis=1))
+    return np.concatenate(pairs)
+
+
+def reference_matches(hashes, reference_hashes, max_distance=REFERENCE_DISTANCE, block=4096):
+    """이미지마다 가장 가까운 참조 이미지 번호 (max_distance 보다 멀면 -1)"""
+    nearest = np.full(len(hashes), -1, dtype=np.int64)
+    if len(reference_hashes) == 0:
+        return nearest
+    for start in range(0, len(hashes), block):
+        distances = popcount(hashes[start:start + block, None] ^ reference_hashes[None, :])
+        best = distances.argmin(axis=1)
+        close = distances[np.arange(len(best)), best] <= max_distance
+        nearest[start:start + block][close] = best[close]
+    return nearest
+
+
+def greedy_duplicates(pairs):
+    """
+    중복 쌍에서 매니페스트 순서대로 처음 나온 샘플은 남기고, 이미 남긴 샘플과 가까운 샘플을 중복으로 표시합니다.
+
+    Returns:
+        dict: 중복 샘플 번호 -> 남긴 샘플 번호
+    """
+    neighbors = {}
+    for i, j in pairs.tolist():
+        neighbors.setdefault(i, []).append(j)
+        neighbors.setdefault(j, []).append(i)
+    kept, duplicate_of = set(), {}
+    for index in sorted(neighbors):
+        match = next((other for other in neighbors[index] if other in kept and other < index), None)
+        if match is None:
+            kept.add(index)
+        else:
+            duplicate_of[index] = match
+    return duplicate_of
+
+
+def read_manifest(manifest_path):
+    """
+    매니페스트의 레코드를 읽습니다. 같은 이미지가 여러 번 기록되었으면 마지막 것을 사용합니다.
+
+    Returns:
+        tuple: (이미지 -> 레코드 (순서 유지), 읽은 바이트 수)
+    """
+    records = {}
+    with open(manifest_path, "rb") as f:
+        data = f.read()
+    # 마지막 줄이 아직 쓰이는 중일 수 있으므로 개행으로 끝난 줄까지만 읽음
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].decode("utf-8").splitlines():
+        if line.strip():
+            record = json.loads(line)
+            records[record["image"]] = record
+    return records, end
+
+
+def write_manifest(manifest_path, records, offset):
+    """
+    판정을 담은 레코드로 매니페스트를 원자적으로 다시 씁니다.
+    읽은 뒤(offset 이후)에 organize_output 이 덧붙인 줄은 그대로 뒤에 붙여 잃어버리지 않습니다.
+    뒷부분 복사부터 교체까지는 매니페스트 잠금 안에서 하므로 그 사이에 덧붙는 줄은 없습니다.
+    """
+    tmp = f"{manifest_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as out:
+        for record in records.values():
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        with manifest_lock(manifest_path):
+            with open(manifest_path, "rb") as current:
+                current.seek(offset)
+                out.write(current.read().decode("utf-8"))
+            out.flush()
+            os.replace(tmp, manifest_path)
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def validate_dataset(dataset_dir, reference_dir=SOURCE_DIR, workers=NUM_WORKERS, requeue_ledger=None, requeue_run=None):
+    """
+    매니페스트의 모든 샘플을 검사하고 판정을 매니페스트의 "quality" 에 기록합니다.
+
+    - black_frame / flat_frame: 평균 밝기 / 밝기 표준편차 기준
+    - reference_copy: 참조 이미지와 거의 같음
+    - near_duplicate: 같은 캐릭터의 앞선 샘플과 거의 같음 (duplicate_of 에 남긴 샘플)
+    - missing_image / missing_caption / empty_caption
+    파일 크기와 수정 시각이 그대로인 샘플은 이전에 계산한 특징(pHash, 밝기)을 다시 사용합니다.
+    requeue_ledger 를 주면 불합격 샘플의 작업을 원장의 requeue_run 실행(기본: 가장 최근 실행)에 새 시드로 다시 계획합니다.
+    (generate_loop resume 으로 재생성)
+
+    Returns:
+        Counter: 판정 사유별 샘플 수 ("ok" 포함)
+    """
+    start = time.perf_counter()
+    manifest_path = os.path.join(dataset_dir, MANIFEST_NAME)
+    records, offset = read_manifest(manifest_path)
+    entries = list(records.values())
+
+    # 1. 이미지 특징: 바뀌지 않은 샘플은 이전 결과 재사용, 나머지는 프로세스 풀에서 계산
+    stat_keys = [_stat_key(os.path.join(dataset_dir, record["image"])) for record in entries]
+    previous = [record.get("quality") or {} for record in entries]
+    stale = [i for i in range(len(entries)) if stat_keys[i] is None or previous[i].get("file") != stat_keys[i]]
+    fresh = analyze([os.path.join(dataset_dir, entries[i]["image"]) for i in stale], workers)
+    features = {
+        "ok": np.array(["missing_image" not in quality.get("reasons", ["missing_image"]) for quality in previous], dtype=bool),
+        "phash": np.array([int(quality.get("phash", "0"), 16) for quality in previous], dtype=np.uint64),
+        "mean": np.array([quality.get("mean", 0.0) for quality in previous], dtype=np.float64),
+        "std": np.array([quality.get("std", 0.0) for quality in previous], dtype=np.float64),
+    }
+    for key, values in fresh.items():
+        features[key][stale] = values
+    # 캡션은 이미지와 따로 다시 쓰일 수 있으므로 매번 확인 (작은 텍스트 파일)
+    caption_tags = [caption_tag_count(os.path.join(dataset_dir, record["caption"]) if record.get("caption") else None)
+                    for record in entries]
+    analyzed = time.perf_counter() - start
+
+    # 2. 참조 이미지 복사본과 같은 캐릭터 안의 중복
+    reference_paths = sorted({path for pattern in REFERENCE_GLOBS for path in glob.glob(os.path.join(reference_dir, pattern))})
+    references = analyze(reference_paths, workers)
+    reference_hashes = references["phash"][references["ok"]]
+    reference_names = [os.path.basename(path) for path, ok in zip(reference_paths, references["ok"]) if ok]
+    nearest_reference = reference_matches(features["phash"], reference_hashes)
+    characters = {}
+    groups = np.array([characters.setdefault(record.get("character"), len(characters)) for record in entries], dtype=np.int64)
+    black = features["mean"] < BLACK_MEAN
+    flat = ~black & (features["std"] < FLAT_STD)
+    # 빈 프레임끼리는 모두 같은 해시이므로 중복 검사에서 제외 (이미 불합격)
+    valid = np.flatnonzero(features["ok"] & ~black & ~flat)
+    pairs = near_duplicate_pairs(features["phash"][valid], groups[valid])
+    duplicate_of = {int(valid[i]): int(valid[j]) for i, j in greedy_duplicates(pairs).items()}
+
+    # 3. 판정 기록
+    counts = Counter()
+    rejected = []
+    for i, record in enumerate(entries):
+        reasons = []
+        if not features["ok"][i]:
+            reasons.append("missing_image")
+        else:
+            if black[i]:
+                reasons.append("black_frame")
+            elif flat[i]:
+                reasons.append("flat_frame")
+            if nearest_reference[i] >= 0:
+                reasons.append("reference_copy")
+            if i in duplicate_of:
+                reasons.append("near_duplicate")
+        if caption_tags[i] < 0:
+            reasons.append("missing_caption")
+        elif caption_tags[i] <= MIN_CAPTION_TAGS:
+            reasons.append("empty_caption")
+        quality = {
+            "ok": not reasons,
+            "reasons": reasons,
+            "phash": f"{int(features['phash'][i]):016x}",
+            "mean": round(float(features["mean"][i]), 2),
+            "std": round(float(features["std"][i]), 2),
+            "caption_tags": caption_tags[i],
+            "file": stat_keys[i],
+        }
+        if "near_duplicate" in reasons:
+            quality["duplicate_of"] = entries[duplicate_of[i]]["image"]
+        if "reference_copy" in reasons:
+            quality["reference"] = reference_names[nearest_reference[i]]
+        # 다시 계획했다는 표시는 파일이 그대로일 때만 유지 (파일이 바뀌었으면 새 판정대로 다시 계획할 수 있음)
+        if previous[i].get("requeued") and previous[i].get("file") == stat_keys[i]:
+            quality["requeued"] = previous[i]["requeued"]
+        record["quality"] = quality
+        counts.update(reasons or ["ok"])
+        if reasons and not quality.get("requeued") and "missing_image" not in reasons:
+            rejected.append(record)
+
+    if requeue_ledger and rejected:
+        requeued = requeue_samples(requeue_ledger, rejected, requeue_run)
+        counts["requeued"] = requeued
+    write_manifest(manifest_path, records, offset)
+
+    elapsed = time.perf_counter() - start
+    print(f"\nValidated {len(entries)} samples in {elapsed:.1f}s "
+          f"(analyzed {len(stale)} changed in {analyzed:.1f}s, {len(reference_hashes)} references, "
+          f"{len(pairs)} near-duplicate pairs).")
+    for reason, count in counts.most_common():
+        print(f"  {reason:<16} {count}")
+    print(f"Verdicts written to: {manifest_path}")
+    return counts
+
+
+def next_seed(seed):
+    """다시 생성할 때 쓸 시드 (같은 시드면 결과 캐시가 같은 결과를 돌려주므로)"""
+    digest = hashlib.sha256(f"{seed}|requeue".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & SEED_MASK
+
+
+def requeue_samples(ledger_path, records, run_id=None):
+    """
+    불합격 샘플을 만든 작업을 원장의 run_id 실행(기본: 가장 최근 실행)에서 찾아 새 시드로 다시 계획합니다.
+    샘플은 ComfyUI output 폴더 기준 원래 경로(매니페스트의 source)와 원장의 출력 파일 경로가 같아야 짝지어집니다.
+    (ComfyUI 는 파일이 옮겨지면 번호를 다시 쓰므로 같은 경로를 낸 작업이 둘 이상이면 짐작하지 않고 건너뜀)
+    다시 계획한 샘플은 quality.requeued 에 표시해 두 번 다시 계획하지 않습니다.
+
+    Returns:
+        int: 다시 계획한 작업 수
+    """
+    # source 가 없는 이전 매니페스트는 하위 폴더 없이 원래 이름 그대로 옮겨졌으므로 이미지 이름이 원래 경로
+    by_source = {record.get("source") or os.path.basename(record["image"]): record for record in records}
+    ledger = JobLedger(ledger_path)
+    requeued = 0
+    try:
+        run_id = run_id or ledger.latest_run()
+        matches = {}
+        for row in ledger.done_outputs(run_id):
+            outputs = row[-1]
+            for name in outputs if isinstance(outputs, list) else [outputs]:
+                if name in by_source:
+                    matches.setdefault(name, []).append(row)
+        for source, rows in matches.items():
+            if len(rows) > 1:
+                print(f"⚠️ {len(rows)} jobs in run {run_id} produced {source}, not requeuing it")
+                continue
+            _, mode, idx, character, seed, seed_run_id, _ = rows[0]
+            if seed is None:
+                seed = derive_seed(character, mode, idx, seed_run_id or "")
+            record = by_source[source]
+            reasons = ",".join(record["quality"]["reasons"])
+            ledger.requeue(run_id, mode, idx, next_seed(seed), f"quality: {reasons}")
+            record["quality"]["requeued"] = run_id
+            requeued += 1
+    finally:
+        ledger.close()
+    return requeued
+
+
+def watch_dataset(dataset_dir, reference_dir=SOURCE_DIR, workers=NUM_WORKERS, requeue_ledger=None,
+                  requeue_run=None, interval=VALIDATE_INTERVAL):
+    """
+    organize_output --watch 와 함께 돌면서 주기적으로 다시 검사합니다. (watch mode)
+    바뀌지 않은 샘플은 이전 특징을 다시 쓰므로 새로 옮겨진 샘플만 분석합니다.
+    """
+    print(f"👀 Validating {dataset_dir} every {interval:.0f}s (Ctrl+C to stop)")
+    try:
+        while True:
+            if os.path.exists(os.path.join(dataset_dir, MANIFEST_NAME)):
+                validate_dataset(dataset_dir, reference_dir, workers, requeue_ledger, requeue_run)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\nStopped validating.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate organized dataset samples and record verdicts in the manifest")
+    parser.add_argument("--dataset", default=SOURCE_DIR, help="organized dataset directory (with manifest.jsonl)")
+    parser.add_argument("--references", default=SOURCE_DIR, help="directory with the shot_type reference images")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--requeue", metavar="LEDGER", help="re-plan rejected samples in this generate_loop ledger")
+    parser.add_argument("--run-id", help="ledger run the samples came from (default: latest)")
+    parser.add_argument("--watch", action="store_true", help="keep validating as organize_output moves samples")
+    args = parser.parse_args()
+
+    if args.watch:
+        watch_dataset(args.dataset, args.references, args.workers, args.requeue, args.run_id)
+    else:
+        validate_dataset(args.dataset, args.references, args.workers, args.requeue, args.run_id)